@@ -0,0 +1,101 @@
+"""In-process benchmark of the webhook ingress request path.
+
+Feeds a realistic message update through the ASGI app (secret check, body
+limit, orjson decoding, ``Update.de_json``, queueing) and through the
+json-based :class:`EarlyWebhook` dispatch, and reports requests per second
+and latency percentiles per request (for the ASGI app also the time until
+the response was sent). No sockets are involved, so this
+measures the per-POST work the ingress adds on top of the HTTP server.
+
+Usage:
+    python -m benchmarks.bench_ingress --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from telegram.ext import Application
+
+from moderation_bot.core.asgi import AsgiWebhook
+from moderation_bot.core.startup import EarlyWebhook
+
+SECRET = "s3cret"
+
+
+def _body(update_id: int) -> bytes:
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 1700000000, "text": "hello there, this is a test message " * 4,
+            "chat": {"id": -1001234567890, "type": "supergroup", "title": "Benchmark chat"},
+            "from": {"id": 4242, "is_bot": False, "first_name": "Bench", "username": "bench", "language_code": "en"},
+            "entities": [{"type": "bold", "offset": 0, "length": 5}],
+        },
+    }).encode()
+
+
+def _report(name: str, latencies: list) -> None:
+    latencies.sort()
+    total = sum(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e6
+    print(f"{name:>14}: {len(latencies) / total:>9.0f} req/s  p50 {pick(0.5):6.1f}us  "
+          f"p99 {pick(0.99):6.1f}us  p99.9 {pick(0.999):6.1f}us")
+
+
+async def bench_asgi(application, bodies) -> list:
+    app = AsgiWebhook(application, "token", secret_token=SECRET)
+    headers = [(b"content-type", b"application/json"), (b"x-telegram-bot-api-secret-token", SECRET.encode())]
+
+    latencies = []
+    ack_latencies = []
+    acked = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            acked.append(time.perf_counter())
+
+    for body in bodies:
+        scope = {"type": "http", "method": "POST", "path": "/token",
+                 "headers": headers + [(b"content-length", str(len(body)).encode())]}
+        message = {"type": "http.request", "body": body, "more_body": False}
+
+        async def receive():
+            return message
+
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        done = time.perf_counter()
+        latencies.append(done - started)
+        ack_latencies.append(acked.pop() - started)
+        application.update_queue.get_nowait()
+    return latencies, ack_latencies
+
+
+def bench_early(application, bodies) -> list:
+    webhook = EarlyWebhook(application, secret_token=SECRET)
+    latencies = []
+    for body in bodies:
+        started = time.perf_counter()
+        webhook.check_secret(SECRET)
+        webhook.dispatch(body)
+        latencies.append(time.perf_counter() - started)
+        application.update_queue.get_nowait()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    application = Application.builder().token("1000:test").build()
+    bodies = [_body(update_id) for update_id in range(args.requests)]
+    _report("EarlyWebhook", bench_early(application, bodies))
+    latencies, ack_latencies = asyncio.run(bench_asgi(application, bodies))
+    _report("AsgiWebhook", latencies)
+    _report("  until ack", ack_latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""In-process throughput/latency benchmark for the moderation bot's handler pipeline.
+
+Builds the real Application (all handlers, rate limiter, update processor)
+from ``moderation_bot.main`` on top of a fake Bot API transport that answers
+every call with a canned response after a configurable latency, then pushes
+a synthetic mix of updates through it.
+
+Usage:
+    python -m benchmarks.bench_pipeline --updates 5000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+
+import structlog
+from telegram import Update
+from telegram.request import BaseRequest
+
+from moderation_bot.core.deletion import deletion_batcher
+from moderation_bot.core.welcome import welcome_batcher
+from moderation_bot.handlers import pipeline
+from moderation_bot.main import build_application
+
+BOT_ID = 1000
+ADMIN_ID = 42
+CHANNEL_ID = -1009000000000
+DEFAULT_MIX = {"text": 70, "bot": 8, "channel": 7, "join": 5, "command": 10}
+
+
+class FakeBotAPI(BaseRequest):
+    """Answers Bot API calls from memory after ``latency`` seconds."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self._message_id = 10**6
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _result(self, endpoint: str, params: dict):
+        user = {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}
+        if endpoint == "getMe":
+            return {"id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if endpoint == "getChatAdministrators":
+            return [{"status": "creator", "user": user, "is_anonymous": False}]
+        if endpoint == "getChatMember":
+            return {"status": "member", "user": {"id": params["user_id"], "is_bot": False, "first_name": "Member"}}
+        if endpoint == "getChat":
+            return {"id": params["chat_id"], "type": "supergroup", "title": "Bench", "accent_color_id": 0,
+                    "max_reaction_count": 0, "accepted_gift_types": {"unlimited_gifts": False, "limited_gifts": False,
+                    "unique_gifts": False, "premium_subscription": False}}
+        if endpoint.startswith("send"):
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time.time()),
+                    "chat": {"id": params.get("chat_id", 0), "type": "supergroup"},
+                    "text": params.get("text", "")}
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self._result(endpoint, params)}).encode()
+
+
+class UpdateFactory:
+    """Generates synthetic updates of the kinds the bot sees in busy groups."""
+
+    def __init__(self, chats: int, users: int, seed: int = 0):
+        self.random = random.Random(seed)
+        self.chats = [-1001000000000 - index for index in range(chats)]
+        self.users = list(range(10_000, 10_000 + users))
+        self._update_id = 0
+        self._message_id = 0
+
+    def _ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def _message(self, chat_id, sender, text=None, **extra):
+        update_id, message_id = self._ids()
+        message = {"message_id": message_id, "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"}, "from": sender, **extra}
+        if text is not None:
+            message["text"] = text
+        return {"update_id": update_id, "message": message}
+
+    def _user(self, is_bot=False):
+        user_id = self.random.choice(self.users)
+        return {"id": user_id, "is_bot": is_bot, "first_name": f"User{user_id}"}
+
+    def make(self, kind: str) -> dict:
+        chat_id = self.random.choice(self.chats)
+        if kind == "text":
+            words = self.random.choices(["hello", "gm", "price", "when", "moon", "ser", "wen", "airdrop"], k=8)
+            return self._message(chat_id, self._user(), " ".join(words))
+        if kind == "bot":
+            return self._message(chat_id, self._user(is_bot=True), "Buy followers now!")
+        if kind == "channel":
+            channel = {"id": CHANNEL_ID, "type": "channel", "title": "Linked channel"}
+            sender = {"id": 136817688, "is_bot": True, "first_name": "Channel", "username": "Channel_Bot"}
+            return self._message(chat_id, sender, "New channel post", sender_chat=channel, is_automatic_forward=True)
+        if kind == "command":
+            command = self.random.choice(["/top", "/filters", "/pinned"])
+            return self._message(chat_id, self._user(), command,
+                                 entities=[{"type": "bot_command", "offset": 0, "length": len(command)}])
+        if kind == "join":
+            update_id, _ = self._ids()
+            user = self._user()
+            return {"update_id": update_id, "chat_member": {
+                "chat": {"id": chat_id, "type": "supergroup", "title": "Bench"},
+                "from": user, "date": int(time.time()),
+                "old_chat_member": {"status": "left", "user": user},
+                "new_chat_member": {"status": "member", "user": user},
+            }}
+        raise ValueError(f"Unknown update kind: {kind}")
+
+    def stream(self, count: int, mix: dict):
+        kinds, weights = zip(*mix.items())
+        for kind in self.random.choices(kinds, weights=weights, k=count):
+            yield kind, self.make(kind)
+
+
+class Timings:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, label, callback):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                self.samples[label].append(time.perf_counter() - started)
+        timed.__name__ = getattr(callback, "__name__", label)
+        return timed
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples: dict) -> dict:
+    return {
+        label: {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+        for label, values in sorted(samples.items())
+        if values
+    }
+
+
+def _instrument(application, timings: Timings) -> None:
+    for group, handlers in application.handlers.items():
+        for handler in handlers:
+            handler.callback = timings.wrap(f"group {group}", handler.callback)
+    pipeline.STAGES = tuple(
+        (flag, text_only, timings.wrap(f"stage {stage.__name__}", stage))
+        for flag, text_only, stage in pipeline.STAGES
+    )
+
+
+def _seed_chat_data(application, chats) -> None:
+    for chat_id in chats:
+        chat_data = application.chat_data[chat_id]
+        chat_data.update(nobots_enabled=True, cleanlinked_enabled=True, antichannelpin_enabled=True)
+        chat_data["filters"] = {f"trigger{index}": f"reply {index}" for index in range(200)}
+        chat_data["filters"].update({"airdrop": "No airdrops here.", "wen": "Soon."})
+
+
+async def run_benchmark(updates: int = 2000, latency: float = 0.0, chats: int = 50, users: int = 5000,
+                        shards: int = 8, rate_limit: bool = False, mix: dict = None, seed: int = 0) -> dict:
+    """Runs the benchmark and returns the throughput and latency summary."""
+    from moderation_bot.main import rate_limiter
+
+    api = FakeBotAPI(latency)
+    application = build_application("1000:bench", request=api, limiter=rate_limiter if rate_limit else None,
+                                     shards=shards)
+    factory = UpdateFactory(chats, users, seed)
+    timings = Timings()
+    original_stages = pipeline.STAGES
+    _instrument(application, timings)
+    _seed_chat_data(application, factory.chats)
+
+    batch = [(kind, Update.de_json(data, application.bot)) for kind, data in factory.stream(updates, mix or DEFAULT_MIX)]
+    per_kind = defaultdict(list)
+
+    async def feed(kind, update):
+        started = time.perf_counter()
+        await application.update_processor.process_update(update, application.process_update(update))
+        per_kind[f"update {kind}"].append(time.perf_counter() - started)
+
+    try:
+        await application.initialize()
+        started = time.perf_counter()
+        await asyncio.gather(*(feed(kind, update) for kind, update in batch))
+        elapsed = time.perf_counter() - started
+    finally:
+        pipeline.STAGES = original_stages
+        await deletion_batcher.flush_all()
+        await welcome_batcher.flush_all()
+        await application.shutdown()
+
+    return {
+        "updates": updates,
+        "seconds": elapsed,
+        "updates_per_second": updates / elapsed if elapsed else float("inf"),
+        "api_calls": dict(api.calls),
+        "latency": summarize({**timings.samples, **per_kind}),
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(f"{report['updates']} updates in {report['seconds']:.3f}s "
+          f"-> {report['updates_per_second']:.0f} updates/s")
+    print(f"{'':40} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, row in report["latency"].items():
+        print(f"{label:40} {row['count']:>7} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+    print("API calls:", ", ".join(f"{endpoint}={count}" for endpoint, count in sorted(report["api_calls"].items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated Bot API latency")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the outbound rate limiter enabled")
+    parser.add_argument("--mix", type=json.loads, default=None, help='e.g. \'{"text": 90, "bot": 10}\'')
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's own logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL))
+
+    report = asyncio.run(run_benchmark(
+        updates=args.updates, latency=args.latency_ms / 1000, chats=args.chats, users=args.users,
+        shards=args.shards, rate_limit=args.rate_limit, mix=args.mix,
+    ))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Cold start benchmark: time from a fresh interpreter to the first processed update.
+
+Each run is a new Python process that imports ``moderation_bot.main``,
+builds the Application on top of a fake Bot API, initializes it and handles
+one ``/help`` command, with handler modules imported eagerly or lazily.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+HELP_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1, "date": 0, "text": "/help",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        "chat": {"id": -100, "type": "supergroup", "title": "Bench"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Admin"},
+    },
+}
+
+
+def _child(lazy: bool) -> dict:
+    started = time.perf_counter()
+    import asyncio
+    import logging
+
+    import structlog
+    from telegram import Update
+    from telegram.request import BaseRequest
+
+    from moderation_bot.main import build_application
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL))
+    imported = time.perf_counter()
+
+    class FakeBotAPI(BaseRequest):
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self) -> None:
+            pass
+
+        async def shutdown(self) -> None:
+            pass
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            if url.endswith("/getMe"):
+                result = {"id": 1000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+            else:
+                result = {"message_id": 2, "date": 0, "chat": {"id": -100, "type": "supergroup"}}
+            return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    async def run() -> dict:
+        api = FakeBotAPI()
+        application = build_application("1000:bench", request=api, limiter=None, lazy=lazy)
+        built = time.perf_counter()
+        await application.initialize()
+        initialized = time.perf_counter()
+        await application.process_update(Update.de_json(HELP_UPDATE, application.bot))
+        processed = time.perf_counter()
+        await application.shutdown()
+        return {
+            "import_ms": (imported - started) * 1000,
+            "build_ms": (built - imported) * 1000,
+            "initialize_ms": (initialized - built) * 1000,
+            "first_update_ms": (processed - initialized) * 1000,
+            "total_ms": (processed - started) * 1000,
+        }
+
+    return asyncio.run(run())
+
+
+def run_benchmark(runs: int = 5) -> dict:
+    """Runs ``runs`` cold starts per mode and returns the median of every phase."""
+    report = {}
+    for mode in ("eager", "lazy"):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_startup", "--child", mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        report[mode] = {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--child", choices=("eager", "lazy"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child == "lazy")))
+        return
+
+    report = run_benchmark(args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    phases = list(report["eager"])
+    print(f"{'':8}" + "".join(f"{phase:>18}" for phase in phases))
+    for mode, row in report.items():
+        print(f"{mode:8}" + "".join(f"{row[phase]:>18.1f}" for phase in phases))
+
+
+if __name__ == "__main__":
+    main()
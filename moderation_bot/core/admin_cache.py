@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_CHATS = 1024
+
+
+class AdminCache:
+    """Per-chat cache of administrator user IDs.
+
+    Entries expire after ``ttl`` seconds and the least recently used chat is
+    evicted once more than ``max_chats`` chats are cached. Concurrent lookups
+    for the same chat share a single in-flight ``get_chat_administrators`` call.
+
+    With a ``coordinator`` (see :mod:`moderation_bot.core.coordination`),
+    invalidations are published to other processes through its generation
+    counters, and entries filled before a newer invalidation are ignored.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_chats: int = DEFAULT_MAX_CHATS, coordinator=None):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.coordinator = coordinator
+        self._entries = OrderedDict()  # chat_id -> (expires_at, frozenset of admin ids, generation)
+        self._in_flight = {}  # chat_id -> asyncio.Future
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get_admin_ids(self, bot, chat_id) -> frozenset:
+        """Returns the admin IDs for a chat, fetching them from the API on a miss."""
+        generation = self._generation(chat_id)
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            expires_at, admin_ids, entry_generation = entry
+            if expires_at > time.monotonic() and entry_generation == generation:
+                self._entries.move_to_end(chat_id)
+                self.hits += 1
+                return admin_ids
+            del self._entries[chat_id]
+
+        pending = self._in_flight.get(chat_id)
+        if pending is not None:
+            # Another lookup for this chat is already talking to the API.
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        logger.debug("Admin cache miss", chat_id=chat_id, hits=self.hits, misses=self.misses)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[chat_id] = future
+        try:
+            chat_admins = await bot.get_chat_administrators(chat_id)
+            admin_ids = frozenset(admin.user.id for admin in chat_admins)
+        except BaseException as e:
+            if self._in_flight.get(chat_id) is future:
+                del self._in_flight[chat_id]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception as retrieved in case nobody else was waiting on it.
+                future.exception()
+            raise
+
+        # Only cache the result if the chat was not invalidated while we were waiting.
+        if self._in_flight.get(chat_id) is future:
+            del self._in_flight[chat_id]
+            self._store(chat_id, admin_ids, generation)
+        future.set_result(admin_ids)
+        return admin_ids
+
+    def _generation(self, chat_id) -> int:
+        return self.coordinator.generation(chat_id) if self.coordinator is not None else 0
+
+    def _store(self, chat_id, admin_ids: frozenset, generation: int = 0) -> None:
+        self._entries[chat_id] = (time.monotonic() + self.ttl, admin_ids, generation)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_chats:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id) -> None:
+        """Drops the cached admin set of a chat so the next lookup refetches it."""
+        self._in_flight.pop(chat_id, None)
+        if self.coordinator is not None:
+            self.coordinator.bump(chat_id)
+        if self._entries.pop(chat_id, None) is not None:
+            self.invalidations += 1
+            logger.debug("Admin cache invalidated", chat_id=chat_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._in_flight.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the current number of cached chats."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "cached_chats": len(self._entries),
+        }
+
+
+admin_cache = AdminCache()
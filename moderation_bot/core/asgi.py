@@ -0,0 +1,142 @@
+import asyncio
+
+import structlog
+
+from moderation_bot.core.metrics import registry
+from moderation_bot.core.startup import (
+    SECRET_HEADER, EarlyWebhook, check_webhook, run_application, startup_profile, wait_for_stop_signal,
+)
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is in requirements.txt, json is the fallback
+    import json
+    loads = json.loads
+
+logger = structlog.get_logger(__name__)
+
+# Telegram updates are a few KB; anything far bigger is not from Telegram
+DEFAULT_MAX_BODY = 1 << 20
+
+_SECRET_HEADER = SECRET_HEADER.lower().encode()
+_EMPTY = {"type": "http.response.body", "body": b""}
+_TEXT_HEADERS = [(b"content-type", b"text/plain; charset=utf-8")]
+
+webhook_requests = registry.counter(
+    "bot_webhook_requests_total", "Webhook POSTs by HTTP status answered.", ("status",)
+)
+
+
+class AsgiWebhook(EarlyWebhook):
+    """Webhook ingress as a raw ASGI app, for running under uvicorn.
+
+    Checks the secret token header before reading the body, refuses bodies
+    over ``max_body`` bytes (by ``Content-Length`` up front, and while
+    reading for chunked uploads), acknowledges, and only then decodes the
+    body (with orjson when it is installed) and puts the update on
+    ``application.update_queue``. Malformed bodies are logged and dropped.
+    ``GET /metrics`` serves the metrics registry on the same port.
+    """
+
+    loads = staticmethod(loads)
+
+    def __init__(self, application, url_path: str, secret_token: str = None, max_body: int = DEFAULT_MAX_BODY):
+        super().__init__(application, secret_token)
+        self.path = f"/{url_path}"
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            # No lifespan handling: the application's lifecycle is run by serve_asgi_webhook
+            return
+        path = scope["path"].rstrip("/")
+        method = scope["method"]
+        if method == "POST" and path == self.path:
+            status, body = await self._webhook(scope, receive)
+            webhook_requests.inc(str(status))
+            await send({"type": "http.response.start", "status": status, "headers": []})
+            await send(_EMPTY)
+            if body is not None:
+                # Building the Update is most of the work, so Telegram gets its answer first
+                self.dispatch(body)
+        elif method == "GET" and path == "/metrics":
+            body = registry.render().encode()
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+        else:
+            await send({"type": "http.response.start", "status": 404, "headers": _TEXT_HEADERS})
+            await send({"type": "http.response.body", "body": b"Not Found\n"})
+
+    async def _webhook(self, scope, receive):
+        """Checks and reads a webhook POST; returns the status to answer with and the body to dispatch."""
+        secret = length = None
+        for name, value in scope["headers"]:
+            if name == _SECRET_HEADER:
+                secret = value.decode("latin-1")
+            elif name == b"content-length":
+                length = value
+        if not self.check_secret(secret):
+            return 403, None
+        if length is not None and (not length.isdigit() or int(length) > self.max_body):
+            return 413, None
+
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return 400, None
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                return 413, None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return 200, chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+async def serve_asgi_webhook(application, listen: str, port: int, url_path: str, webhook_url: str,
+                             allowed_updates=None, secret_token: str = None,
+                             max_body: int = DEFAULT_MAX_BODY) -> None:
+    """Runs the application behind :class:`AsgiWebhook` on uvicorn.
+
+    Follows :func:`~moderation_bot.core.startup.serve_fast_webhook`: uvicorn
+    listens before ``initialize()`` and the webhook is checked in the
+    background afterwards.
+    """
+    import uvicorn
+
+    webhook = AsgiWebhook(application, url_path, secret_token, max_body)
+    # httptools and uvloop are picked up when installed ("auto")
+    config = uvicorn.Config(webhook, host=listen, port=port, lifespan="off", access_log=False,
+                            log_level="warning", server_header=False, date_header=False)
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            await serving  # raises why uvicorn could not start
+            return
+        await asyncio.sleep(0.01)
+    startup_profile.mark("listen")
+    logger.info("ASGI webhook listening", port=port, max_body=max_body, json=loads.__module__)
+
+    async def serve() -> None:
+        registration = application.create_task(
+            check_webhook(application.bot, webhook_url, allowed_updates, secret_token)
+        )
+        # uvicorn handles SIGINT/SIGTERM while it serves; this covers the gap before and after
+        stopping = asyncio.create_task(wait_for_stop_signal())
+        try:
+            await asyncio.wait((serving, stopping), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            server.should_exit = True
+            stopping.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            registration.cancel()
+
+    await run_application(application, serve)
+    logger.info("ASGI webhook stopped", received=webhook.received)
@@ -0,0 +1,222 @@
+import asyncio
+import time
+import uuid
+
+import structlog
+from telegram.error import RetryAfter
+
+from .ratelimit import retry_after_seconds
+
+logger = structlog.get_logger(__name__)
+
+TAGS_KEY = "broadcast_tags"  # chat_data key holding a chat's tags
+AUDIENCE_ALL = "all"
+TAG_PREFIX = "tag:"
+
+DEFAULT_CONCURRENCY = 8
+CHECKPOINT_EVERY = 25  # deliveries between two persistence writes
+LEASE_SECONDS = 300  # how long a broadcast stays with its process without a checkpoint
+DEFAULT_OWNER = "main"
+MAX_RETRY_AFTER = 3  # 429s a single chat may answer before it is given up on
+
+
+def is_audience(arg: str) -> bool:
+    """Tells whether the first /announce argument selects broadcast recipients."""
+    return arg == AUDIENCE_ALL or (arg.startswith(TAG_PREFIX) and len(arg) > len(TAG_PREFIX))
+
+
+def resolve_audience(chat_data, audience: str) -> list:
+    """Returns the group chats known to the bot that ``audience`` selects, in a stable order."""
+    tag = None if audience == AUDIENCE_ALL else audience[len(TAG_PREFIX):].lower()
+    chat_ids = []
+    for chat_id, data in chat_data.items():
+        if chat_id >= 0:  # private chats with admins, not groups
+            continue
+        if tag is None or tag in data.get(TAGS_KEY, ()):
+            chat_ids.append(chat_id)
+    return sorted(chat_ids)
+
+
+def summarize(job: dict) -> str:
+    failed = job["failed"]
+    text = (
+        f"📣 Broadcast {job['id']} to {job['audience']} finished: "
+        f"{len(job['done']) - len(failed)} of {len(job['targets'])} chats reached."
+    )
+    if failed:
+        reasons = {}
+        for reason in failed.values():
+            reasons[reason] = reasons.get(reason, 0) + 1
+        text += "\nFailed: " + "; ".join(f"{reason} ({count})" for reason, count in sorted(reasons.items()))
+    return text
+
+
+class LeaseLost(Exception):
+    """Another process took a broadcast over; this one must stop sending it."""
+
+
+def _job_store(application):
+    """Returns the persistence if it can store broadcasts, else None (broadcasts then live in memory only)."""
+    persistence = application.persistence
+    return persistence if hasattr(persistence, "claim_jobs") else None
+
+
+class Broadcaster:
+    """Sends one message to many chats with a bounded pool of workers.
+
+    Each broadcast is a job with its target chats and the set of chats
+    already done. With a persistence that supports jobs (see
+    :meth:`~moderation_bot.core.persistence.SQLitePersistence.claim_jobs`)
+    the job is written to it when it is submitted and then at every
+    checkpoint, waiting for the write each time, so it survives restarts:
+    :meth:`resume` picks unfinished jobs up again and only the chats that
+    were not done yet are sent to, minus the deliveries since the last
+    checkpoint (fewer than ``checkpoint_every``, plus those in flight).
+
+    When several processes share the database, each job is leased to the one
+    sending it under the name ``owner``, and every checkpoint renews the
+    lease. On start a process only resumes its own jobs and those whose lease
+    ran out, so a job is never sent by two processes at once. The audience is
+    resolved from every chat in the database, not only those the process owns.
+
+    Rate limits are left to the bot's rate limiter: every message takes a
+    token from the global budget and from its chat's budget. A chat that
+    still answers with ``RetryAfter`` once the limiter gave up is retried
+    after the requested delay, and only then counted as failed.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, checkpoint_every: int = CHECKPOINT_EVERY,
+                 owner: str = DEFAULT_OWNER, lease: float = LEASE_SECONDS):
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.owner = owner
+        self.lease = lease
+        self._tasks = {}  # job id -> asyncio.Task
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    async def audience(self, application, audience: str) -> list:
+        """Returns the group chats ``audience`` selects, including those other processes own."""
+        chat_data = application.chat_data
+        store = _job_store(application)
+        if store is not None:
+            stored = await store.get_chat_values(TAGS_KEY)
+            # The process's own chat_data is more recent than what was last written
+            chat_data = {chat_id: {TAGS_KEY: tags} if tags else {} for chat_id, tags in stored.items()}
+            chat_data.update(application.chat_data)
+        return resolve_audience(chat_data, audience)
+
+    async def submit(self, application, text: str, audience: str, admin_chat_id: int) -> dict:
+        """Stores a new broadcast job and starts sending it; returns the job."""
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "text": text,
+            "audience": audience,
+            "admin_chat_id": admin_chat_id,
+            "targets": await self.audience(application, audience),
+            "done": set(),
+            "failed": {},  # chat_id -> reason
+            "created": time.time(),
+        }
+        await self._checkpoint(application, job)
+        self._start(application, job)
+        return job
+
+    async def resume(self, application) -> int:
+        """Restarts the broadcasts no running process is sending (called from post_init)."""
+        store = _job_store(application)
+        if store is None:
+            return 0
+        jobs = await store.claim_jobs(self.owner, time.time() + self.lease)
+        for job in jobs:
+            if job["id"] not in self._tasks:
+                logger.info("Resuming broadcast", job=job["id"], done=len(job["done"]), total=len(job["targets"]))
+                self._start(application, job)
+        return len(jobs)
+
+    def _start(self, application, job: dict) -> None:
+        task = asyncio.get_running_loop().create_task(self.run(application, job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+
+    async def _checkpoint(self, application, job: dict, release: bool = False) -> None:
+        """Writes the job's progress and renews its lease (or gives it up, with ``release``)."""
+        store = _job_store(application)
+        if store is None:
+            return
+        lease_until = 0.0 if release else time.time() + self.lease
+        if not await store.save_job(job["id"], job, self.owner, lease_until):
+            raise LeaseLost(job["id"])
+
+    async def run(self, application, job: dict) -> None:
+        """Delivers a job to every chat it has not reached yet, then reports to the admin."""
+        pending = iter([chat_id for chat_id in job["targets"] if chat_id not in job["done"]])
+        progress = {"since_checkpoint": 0}
+
+        async def worker() -> None:
+            # Workers share the iterator, so every chat is taken exactly once
+            for chat_id in pending:
+                await self._deliver(application.bot, job, chat_id)
+                progress["since_checkpoint"] += 1
+                if progress["since_checkpoint"] >= self.checkpoint_every:
+                    progress["since_checkpoint"] = 0
+                    await self._checkpoint(application, job)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except LeaseLost:
+            for task in workers:
+                task.cancel()
+            logger.warning("Broadcast taken over by another process", job=job["id"], owner=self.owner)
+            return
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            # Paused (or failed): keep the progress, and let whichever process starts next resume it
+            await self._checkpoint(application, job, release=True)
+            raise
+
+        store = _job_store(application)
+        if store is not None:
+            await store.drop_job(job["id"])
+        logger.info("Broadcast finished", job=job["id"], total=len(job["targets"]), failed=len(job["failed"]))
+        try:
+            await application.bot.send_message(job["admin_chat_id"], summarize(job))
+        except Exception as e:
+            logger.error("Failed to send broadcast summary", job=job["id"], error=e)
+
+    async def _deliver(self, bot, job: dict, chat_id: int) -> None:
+        for attempt in range(MAX_RETRY_AFTER + 1):
+            try:
+                await bot.send_message(chat_id, job["text"])
+                self.sent += 1
+                break
+            except RetryAfter as e:
+                if attempt == MAX_RETRY_AFTER:
+                    job["failed"][chat_id] = "flood control"
+                    self.failed += 1
+                    break
+                await asyncio.sleep(retry_after_seconds(e))
+            except Exception as e:
+                # Typically Forbidden (bot removed) or BadRequest (chat gone): retrying won't help
+                logger.warning("Broadcast delivery failed", job=job["id"], chat_id=chat_id, error=e)
+                job["failed"][chat_id] = type(e).__name__
+                self.failed += 1
+                break
+        job["done"].add(chat_id)
+
+    async def stop(self) -> None:
+        """Pauses running broadcasts; their progress is kept and they resume on the next start."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+broadcaster = Broadcaster()
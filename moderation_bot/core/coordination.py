@@ -0,0 +1,82 @@
+import multiprocessing
+import time
+from contextlib import nullcontext
+
+DEFAULT_GENERATION_SLOTS = 4096
+
+# Indices into the token bucket state
+_TOKENS = 0
+_UPDATED = 1
+_BLOCKED_UNTIL = 2
+
+
+class LocalCoordinator:
+    """State shared by everything that talks to the Bot API with one token, within one process.
+
+    Two things are coordinated:
+
+    - the global request budget: a token bucket refilled at ``global_rate``
+      per second. :meth:`try_acquire` takes a token or says how long to wait,
+      and :meth:`block` pauses everyone after a global 429;
+    - cache invalidation: :meth:`bump` increments a generation counter for a
+      key (e.g. a chat ID) and caches compare :meth:`generation` against the
+      value they saw when filling an entry. Keys are hashed into ``slots``
+      counters, so a collision only causes an extra refetch.
+
+    This implementation keeps the state in plain Python objects. It is what a
+    single-process bot and the tests use; :class:`SharedCoordinator` keeps the
+    same state in shared memory for worker processes.
+    """
+
+    def __init__(self, global_rate: float = 30.0, slots: int = DEFAULT_GENERATION_SLOTS):
+        self.global_rate = global_rate
+        self.slots = slots
+        self._lock = nullcontext()
+        self._state = [float(global_rate), time.monotonic(), 0.0]
+        self._generations = [0] * slots
+
+    def try_acquire(self) -> float:
+        """Takes a token from the global budget; returns 0, or the seconds to wait before retrying."""
+        with self._lock:
+            state = self._state
+            now = time.monotonic()
+            if now < state[_BLOCKED_UNTIL]:
+                state[_UPDATED] = now
+                return state[_BLOCKED_UNTIL] - now
+            state[_TOKENS] = min(self.global_rate, state[_TOKENS] + (now - state[_UPDATED]) * self.global_rate)
+            state[_UPDATED] = now
+            if state[_TOKENS] >= 1:
+                state[_TOKENS] -= 1
+                return 0.0
+            return (1 - state[_TOKENS]) / self.global_rate
+
+    def block(self, seconds: float) -> None:
+        """Stops handing out tokens for ``seconds`` (a global ``retry_after``)."""
+        with self._lock:
+            self._state[_BLOCKED_UNTIL] = max(self._state[_BLOCKED_UNTIL], time.monotonic() + seconds)
+            self._state[_TOKENS] = 0.0
+
+    def bump(self, key) -> None:
+        """Invalidates ``key`` everywhere by moving its generation forward."""
+        with self._lock:
+            self._generations[hash(key) % self.slots] += 1
+
+    def generation(self, key) -> int:
+        return self._generations[hash(key) % self.slots]
+
+
+class SharedCoordinator(LocalCoordinator):
+    """:class:`LocalCoordinator` backed by shared memory, for the worker processes of one bot.
+
+    Create it in the parent process and pass it to the workers when they are
+    started. ``time.monotonic`` is system-wide, so all processes agree on the
+    bucket's clock.
+    """
+
+    def __init__(self, global_rate: float = 30.0, slots: int = DEFAULT_GENERATION_SLOTS, context=None):
+        context = context or multiprocessing.get_context("spawn")
+        self.global_rate = global_rate
+        self.slots = slots
+        self._lock = context.Lock()
+        self._state = context.RawArray("d", [float(global_rate), time.monotonic(), 0.0])
+        self._generations = context.RawArray("q", slots)
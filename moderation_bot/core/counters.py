@@ -0,0 +1,185 @@
+import heapq
+import struct
+from array import array
+
+_MAGIC = b"ACT1"
+_HEADER = struct.Struct("<4sQ")
+
+LEADERBOARD_SIZE = 5
+
+
+class TopK:
+    """The ``k`` highest ``(user_id, count)`` pairs, kept sorted by count.
+
+    Counts only ever grow, so a user outside the board can only enter it by
+    overtaking the current last place. Each offer is therefore O(k).
+    """
+
+    __slots__ = ("k", "_entries")
+
+    def __init__(self, k: int = LEADERBOARD_SIZE):
+        self.k = k
+        self._entries = []  # [user_id, count], highest count first
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def offer(self, user_id: int, count: int) -> None:
+        """Records a user's new count."""
+        entries = self._entries
+        for position, entry in enumerate(entries):
+            if entry[0] == user_id:
+                entry[1] = count
+                break
+        else:
+            if len(entries) < self.k:
+                position = len(entries)
+                entries.append([user_id, count])
+            elif count > entries[-1][1]:
+                position = len(entries) - 1
+                entries[position] = [user_id, count]
+            else:
+                return
+
+        # Bubble the updated entry up past everyone it has now overtaken.
+        while position > 0 and entries[position - 1][1] < entries[position][1]:
+            entries[position - 1], entries[position] = entries[position], entries[position - 1]
+            position -= 1
+
+    def rebuild(self, pairs) -> None:
+        self._entries = [list(pair) for pair in heapq.nlargest(self.k, pairs, key=lambda item: item[1])]
+
+    def items(self):
+        return [tuple(entry) for entry in self._entries]
+
+
+class ActivityCounter:
+    """Compact per-user message counter.
+
+    User IDs and counts live in two dense ``array('q')`` columns; a dict maps
+    each user ID to its slot. Increments are O(1) and the arrays can be dumped
+    to (and restored from) a flat byte snapshot without pickling every entry.
+    A small leaderboard of the top users is maintained on every increment.
+    ``version`` changes with every increment, so a snapshot taken earlier can
+    be reused while it stays the same.
+    """
+
+    __slots__ = ("_ids", "_counts", "_index", "_top", "version")
+
+    def __init__(self, counts=None):
+        self._ids = array("q")
+        self._counts = array("q")
+        self._index = {}
+        self._top = TopK()
+        self.version = 0
+        if counts:
+            self.merge(counts)
+
+    # --- Mapping-style access -----------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._index
+
+    def __getitem__(self, user_id) -> int:
+        return self._counts[self._index[user_id]]
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ActivityCounter):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ActivityCounter(users={len(self)}, messages={self.total()})"
+
+    def get(self, user_id, default: int = 0) -> int:
+        slot = self._index.get(user_id)
+        return default if slot is None else self._counts[slot]
+
+    def items(self):
+        """Iterates over ``(user_id, count)`` pairs in insertion order."""
+        return zip(self._ids, self._counts)
+
+    def total(self) -> int:
+        return sum(self._counts)
+
+    # --- Updates ------------------------------------------------------------------------
+
+    def increment(self, user_id: int, amount: int = 1) -> int:
+        """Adds a positive ``amount`` to a user's count and returns the new count."""
+        slot = self._index.get(user_id)
+        if slot is None:
+            self._index[user_id] = len(self._ids)
+            self._ids.append(user_id)
+            self._counts.append(amount)
+            count = amount
+        else:
+            self._counts[slot] += amount
+            count = self._counts[slot]
+        self._top.offer(user_id, count)
+        self.version += 1
+        return count
+
+    def merge(self, other) -> None:
+        """Adds the counts of another counter (or a ``{user_id: count}`` mapping) to this one."""
+        pairs = other.items()
+        for user_id, count in pairs:
+            self.increment(user_id, count)
+
+    def top(self, n: int = LEADERBOARD_SIZE):
+        """Returns the ``n`` users with the highest counts as ``(user_id, count)`` pairs."""
+        if n <= self._top.k:
+            return self._top.items()[:n]
+        return heapq.nlargest(n, self.items(), key=lambda item: item[1])
+
+    # --- Snapshots ----------------------------------------------------------------------
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, len(self._ids)) + self._ids.tobytes() + self._counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ActivityCounter":
+        magic, size = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not an activity counter snapshot")
+        counter = cls()
+        column = size * counter._ids.itemsize
+        offset = _HEADER.size
+        counter._ids.frombytes(data[offset:offset + column])
+        counter._counts.frombytes(data[offset + column:offset + 2 * column])
+        counter._index = {user_id: slot for slot, user_id in enumerate(counter._ids)}
+        counter._top.rebuild(counter.items())
+        return counter
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "ActivityCounter":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def __getstate__(self):
+        # The slot index and leaderboard are derived data; only the two columns are pickled.
+        return self.to_bytes()
+
+    def __setstate__(self, state) -> None:
+        restored = ActivityCounter.from_bytes(state)
+        self._ids, self._counts, self._index, self._top = (
+            restored._ids, restored._counts, restored._index, restored._top
+        )
+        self.version = 0
+
+    def __deepcopy__(self, memo):
+        copy = ActivityCounter()
+        copy._ids = array("q", self._ids)
+        copy._counts = array("q", self._counts)
+        copy._index = self._index.copy()
+        copy._top.rebuild(self._top.items())
+        return copy
@@ -0,0 +1,106 @@
+import time
+
+import structlog
+
+from .metrics import registry
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_WINDOW = 10_000
+LAST_UPDATE_ID_KEY = "last_update_id"
+# Telegram picks the next update ID at random after a week without updates, so an older
+# watermark says nothing about the IDs to come
+MAX_CHECKPOINT_AGE = 6 * 86400
+
+PROCESSING = 1
+DONE = 2
+
+duplicate_updates = registry.counter("bot_duplicate_updates_total", "Redelivered updates that were skipped.")
+
+
+class UpdateDeduplicator:
+    """Remembers the last ``window`` update IDs so redelivered updates are not processed twice.
+
+    IDs live in a ring buffer (for eviction order) plus a dict from ID to
+    processing state (for O(1) lookups). An update is claimed with
+    :meth:`begin` and released with :meth:`finish`; a redelivery that arrives
+    while the original is still running, or after it finished, is rejected.
+    If processing fails, the ID is forgotten so a redelivery can try again.
+
+    :meth:`watermark` is the highest update ID below which everything seen has
+    been processed: it never passes the lowest ID still in flight, whichever
+    shard finished what. :meth:`checkpoint` pairs it with the time it last
+    moved; stored across restarts (main registers it as persistence state
+    under ``state_key``, written whenever the persistence writes a batch) and
+    passed back to :meth:`restore`, it makes the bot skip updates it already
+    handled before going down. A checkpoint older than
+    ``MAX_CHECKPOINT_AGE`` is ignored, since Telegram may have started over
+    from a random, possibly lower, update ID since.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, state_key: str = LAST_UPDATE_ID_KEY, clock=time.time):
+        self.window = window
+        self.state_key = state_key
+        self._clock = clock
+        self._checkpoint = (0, 0.0)
+        self._ring = [None] * window
+        self._position = 0
+        self._states = {}  # update_id -> PROCESSING | DONE
+        self._processing = set()
+        self._highest_done = 0
+        self._restored = 0
+        self.duplicates = 0
+
+    def restore(self, checkpoint) -> None:
+        """Skips every update up to and including the watermark of ``checkpoint`` from now on."""
+        if not checkpoint:
+            return
+        watermark, written_at = checkpoint
+        age = self._clock() - written_at
+        if age > MAX_CHECKPOINT_AGE:
+            logger.info("Ignoring stale update watermark", watermark=watermark, age_days=round(age / 86400, 1))
+            return
+        self._restored = max(self._restored, int(watermark))
+        self._highest_done = max(self._highest_done, self._restored)
+
+    def begin(self, update_id: int) -> bool:
+        """Claims an update; returns False if it was already seen and must not be processed."""
+        if update_id <= self._restored or update_id in self._states:
+            self.duplicates += 1
+            duplicate_updates.inc()
+            logger.info("Skipping redelivered update", update_id=update_id)
+            return False
+
+        evicted = self._ring[self._position]
+        if evicted is not None:
+            self._states.pop(evicted, None)
+        self._ring[self._position] = update_id
+        self._position = (self._position + 1) % self.window
+        self._states[update_id] = PROCESSING
+        self._processing.add(update_id)
+        return True
+
+    def finish(self, update_id: int, success: bool = True) -> None:
+        self._processing.discard(update_id)
+        if success:
+            if update_id in self._states:
+                self._states[update_id] = DONE
+            self._highest_done = max(self._highest_done, update_id)
+        else:
+            self._states.pop(update_id, None)
+
+    def state(self, update_id: int):
+        return self._states.get(update_id)
+
+    def watermark(self) -> int:
+        if self._processing:
+            return min(self._highest_done, min(self._processing) - 1)
+        return self._highest_done
+
+    def checkpoint(self) -> tuple:
+        """Returns ``(watermark, time the watermark last moved)``, the state to persist."""
+        watermark = self.watermark()
+        if watermark != self._checkpoint[0]:
+            self._checkpoint = (watermark, self._clock())
+        return self._checkpoint
+
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+MAX_BATCH = 100  # deleteMessages accepts at most 100 IDs per call
+DEFAULT_PURGE_CONCURRENCY = 4
+
+
+class DeletionBatcher:
+    """Collects message IDs per chat and deletes them with bulk ``deleteMessages`` calls.
+
+    A chat's buffer is flushed ``window`` seconds after its first pending ID,
+    or immediately once it holds ``max_batch`` IDs. If a bulk call fails the
+    messages are deleted one by one instead.
+    """
+
+    def __init__(self, window: float = 1.0, max_batch: int = MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # chat_id -> (bot, list of message ids)
+        self._timers = {}  # chat_id -> asyncio.TimerHandle
+        self._tasks = set()
+
+        self.batches = 0
+        self.messages = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.max_batch_size = 0
+        self.total_latency = 0.0
+
+    def schedule(self, bot, chat_id, message_id: int) -> None:
+        """Queues a message for deletion without waiting for the API."""
+        _, message_ids = self._pending.setdefault(chat_id, (bot, []))
+        message_ids.append(message_id)
+        if len(message_ids) >= self.max_batch:
+            self._start_flush(chat_id)
+        elif chat_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[chat_id] = loop.call_later(self.window, self._start_flush, chat_id)
+
+    def _start_flush(self, chat_id) -> None:
+        task = asyncio.get_running_loop().create_task(self.flush(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, chat_id) -> None:
+        """Deletes everything currently buffered for a chat."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(chat_id, None)
+        if pending is None:
+            return
+
+        bot, message_ids = pending
+        for start in range(0, len(message_ids), self.max_batch):
+            await self.delete_now(bot, chat_id, message_ids[start:start + self.max_batch])
+
+    async def flush_all(self) -> None:
+        await asyncio.gather(*(self.flush(chat_id) for chat_id in list(self._pending)))
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def delete_now(self, bot, chat_id, message_ids: list) -> int:
+        """Deletes up to ``max_batch`` messages with one call, falling back to single deletes.
+
+        Returns the number of messages that could not be deleted.
+        """
+        started = time.monotonic()
+        try:
+            if not await bot.delete_messages(chat_id, message_ids):
+                raise RuntimeError("deleteMessages returned False")
+            failed = 0
+        except Exception as e:
+            logger.warning("Bulk delete failed, deleting one by one", chat_id=chat_id, count=len(message_ids), error=e)
+            self.fallbacks += 1
+            results = await asyncio.gather(
+                *(bot.delete_message(chat_id, message_id) for message_id in message_ids),
+                return_exceptions=True,
+            )
+            failed = sum(1 for result in results if isinstance(result, Exception) or result is False)
+            self.failures += failed
+
+        latency = time.monotonic() - started
+        self.batches += 1
+        self.messages += len(message_ids)
+        self.max_batch_size = max(self.max_batch_size, len(message_ids))
+        self.total_latency += latency
+        logger.info("Deleted message batch", chat_id=chat_id, count=len(message_ids), failed=failed, latency=latency)
+        return failed
+
+    async def purge(self, bot, chat_id, message_ids: list, concurrency: int = DEFAULT_PURGE_CONCURRENCY,
+                    progress=None) -> int:
+        """Deletes many messages at once: ``max_batch`` IDs per call, ``concurrency`` calls at a time.
+
+        Unlike :meth:`delete_now` there is no one-by-one fallback: a purge covers
+        thousands of IDs, many of them already gone, which ``deleteMessages`` skips.
+        ``progress(done, total)`` is awaited after every chunk. Returns the number
+        of IDs in chunks that failed.
+        """
+        chunks = [message_ids[start:start + self.max_batch] for start in range(0, len(message_ids), self.max_batch)]
+        semaphore = asyncio.Semaphore(concurrency)
+        done = 0
+        failed = 0
+
+        async def delete_chunk(chunk) -> None:
+            nonlocal done, failed
+            async with semaphore:
+                try:
+                    if not await bot.delete_messages(chat_id, chunk):
+                        raise RuntimeError("deleteMessages returned False")
+                except Exception as e:
+                    logger.warning("Purge chunk failed", chat_id=chat_id, count=len(chunk), error=e)
+                    failed += len(chunk)
+                self.batches += 1
+                self.messages += len(chunk)
+                done += len(chunk)
+                if progress is not None:
+                    await progress(done, len(message_ids))
+
+        started = time.monotonic()
+        await asyncio.gather(*(delete_chunk(chunk) for chunk in chunks))
+        self.failures += failed
+        logger.info("Purged messages", chat_id=chat_id, count=len(message_ids), failed=failed,
+                    calls=len(chunks), seconds=time.monotonic() - started)
+        return failed
+
+    def stats(self) -> dict:
+        """Returns batch size, latency and failure counters."""
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "avg_batch_size": self.messages / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "avg_latency": self.total_latency / self.batches if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+            "pending_chats": len(self._pending),
+        }
+
+
+deletion_batcher = DeletionBatcher()
@@ -0,0 +1,242 @@
+import asyncio
+import heapq
+import re
+import time
+
+import structlog
+from telegram import ChatPermissions
+
+logger = structlog.get_logger(__name__)
+
+EXPIRIES_KEY = "expiries"  # chat_data key holding the chat's pending expiries, {(user_id, action): due}
+UNMUTE = "unmute"
+UNBAN = "unban"
+
+CATCH_UP_CONCURRENCY = 8
+MAX_DURATION = 366 * 86400
+# Telegram treats restrictions shorter than 30s or longer than 366 days as permanent
+MIN_UNTIL_DATE = 30
+# Shortest timed restriction accepted, with room for the time it takes to reach Telegram
+MIN_DURATION = 60
+# A lift that failed is retried after RETRY_DELAY seconds, doubling up to MAX_RETRY_DELAY
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 3600
+MAX_ATTEMPTS = 8
+
+_DURATION_PART = re.compile(r"(\d+)([smhdw])")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_duration(text: str):
+    """Parses durations like ``90s``, ``10m``, ``2h``, ``1d12h`` or ``1w`` into seconds; None if invalid."""
+    text = text.lower()
+    parts = _DURATION_PART.findall(text)
+    if not parts or "".join(number + unit for number, unit in parts) != text:
+        return None
+    seconds = sum(int(number) * _UNITS[unit] for number, unit in parts)
+    return seconds if 0 < seconds <= MAX_DURATION else None
+
+
+def format_duration(seconds: int) -> str:
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        if seconds >= size:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return "".join(parts) or "0s"
+
+
+def telegram_until_date(due: float):
+    """Returns ``due`` as an until_date Telegram honors, or None where it would mean 'forever'."""
+    remaining = due - time.time()
+    return int(due) if MIN_UNTIL_DATE <= remaining <= MAX_DURATION else None
+
+
+class ExpiryScheduler:
+    """Lifts timed mutes and bans when they run out, across restarts.
+
+    Pending expiries live in the chat_data of their chat, as
+    ``{(user_id, action): due}`` with ``due`` a wall-clock time, so they are
+    persisted by (and, behind the webhook ingress, loaded into) the process
+    that owns the chat. In memory they are indexed by a min-heap of
+    ``(due, chat_id, user_id, action)``. A single timer is armed for the
+    earliest entry; when it fires, every entry that is due is handled in one
+    batch and the timer is re-armed for the next one. After downtime,
+    :meth:`start` handles everything that fell due meanwhile in one
+    concurrent batch.
+
+    Scheduling the same action for the same user again supersedes the
+    earlier entry (it stays in the heap and is skipped when popped). An
+    entry is only removed once the lift succeeded; a failed lift is retried
+    with exponential backoff, up to ``MAX_ATTEMPTS`` times. When the
+    application has a JobQueue the timer is a job on it, otherwise a plain
+    event loop timer.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._application = None
+        self._heap = []
+        self._due = {}  # (chat_id, user_id, action) -> due time of the entry that counts
+        self._attempts = {}  # (chat_id, user_id, action) -> failed lifts so far
+        self._timer = None  # asyncio.TimerHandle or telegram.ext.Job
+        self._timer_due = None
+        self._tasks = set()
+        self.lifted = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    async def start(self, application) -> int:
+        """Indexes the expiries in ``chat_data``, lifts what expired while the bot was down and arms the timer."""
+        self._application = application
+        self._due = {}
+        self._attempts = {}
+        for chat_id, data in application.chat_data.items():
+            for (user_id, action), due in data.get(EXPIRIES_KEY, {}).items():
+                self._due[(chat_id, user_id, action)] = due
+        self._heap = [(due, *key) for key, due in self._due.items()]
+        heapq.heapify(self._heap)
+
+        caught_up = await self._run_due()
+        if caught_up:
+            logger.info("Caught up on expired restrictions", count=caught_up, pending=len(self))
+        self._arm()
+        return caught_up
+
+    def stop(self) -> None:
+        self._disarm()
+        self._application = None
+
+    def schedule(self, chat_id: int, user_id: int, action: str, seconds: float) -> float:
+        """Adds an expiry ``seconds`` from now and returns its due time (a UNIX timestamp)."""
+        due = self._clock() + seconds
+        self._attempts.pop((chat_id, user_id, action), None)
+        self._store(chat_id, user_id, action, due)
+        heapq.heappush(self._heap, (due, chat_id, user_id, action))
+        if self._timer_due is None or due < self._timer_due:
+            self._arm()
+        return due
+
+    def cancel(self, chat_id: int, user_id: int, action: str) -> bool:
+        """Forgets a pending expiry, e.g. after a manual /unban. Returns False if there was none."""
+        key = (chat_id, user_id, action)
+        if key not in self._due:
+            return False
+        # The heap entry is skipped when popped
+        self._forget(key)
+        return True
+
+    def _store(self, chat_id: int, user_id: int, action: str, due: float) -> None:
+        self._due[(chat_id, user_id, action)] = due
+        self._application.chat_data[chat_id].setdefault(EXPIRIES_KEY, {})[(user_id, action)] = due
+        self._application.mark_data_for_update_persistence(chat_ids=chat_id)
+
+    def _forget(self, key) -> None:
+        chat_id, user_id, action = key
+        del self._due[key]
+        self._attempts.pop(key, None)
+        data = self._application.chat_data.get(chat_id)
+        pending = data.get(EXPIRIES_KEY) if data is not None else None
+        if pending is not None:
+            pending.pop((user_id, action), None)
+            if not pending:
+                del data[EXPIRIES_KEY]
+            self._application.mark_data_for_update_persistence(chat_ids=chat_id)
+
+    def _pop_due(self) -> list:
+        """Pops the entries that are due and still count, as ``(key, due)``; they stay pending until lifted."""
+        now = self._clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry_due, *key = heapq.heappop(self._heap)
+            key = tuple(key)
+            if self._due.get(key) == entry_due:
+                due.append((key, entry_due))
+        return due
+
+    def _retry(self, key) -> None:
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            logger.error("Giving up on lifting timed restriction", chat_id=key[0], user_id=key[1], action=key[2],
+                         attempts=attempts)
+            self._forget(key)
+            return
+        retry_at = self._clock() + min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+        self._store(*key, retry_at)
+        self._attempts[key] = attempts
+        heapq.heappush(self._heap, (retry_at, *key))
+
+    async def _run_due(self) -> int:
+        due = self._pop_due()
+        if not due:
+            return 0
+        bot = self._application.bot
+        semaphore = asyncio.Semaphore(CATCH_UP_CONCURRENCY)
+
+        async def lift(key, entry_due) -> None:
+            chat_id, user_id, action = key
+            async with semaphore:
+                try:
+                    if action == UNMUTE:
+                        await bot.restrict_chat_member(chat_id, user_id, permissions=ChatPermissions.all_permissions())
+                    else:
+                        await bot.unban_chat_member(chat_id, user_id, only_if_banned=True)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error("Failed to lift timed restriction", chat_id=chat_id, user_id=user_id,
+                                 action=action, error=e)
+                    if self._due.get(key) == entry_due:
+                        self._retry(key)
+                    return
+            self.lifted += 1
+            logger.info("Timed restriction expired", chat_id=chat_id, user_id=user_id, action=action)
+            # Unless it was rescheduled while the call was in flight
+            if self._due.get(key) == entry_due:
+                self._forget(key)
+
+        await asyncio.gather(*(lift(key, entry_due) for key, entry_due in due))
+        return len(due)
+
+    def _arm(self) -> None:
+        self._disarm()
+        if self._application is None or not self._heap:
+            return
+        self._timer_due = self._heap[0][0]
+        delay = max(0.0, self._timer_due - self._clock())
+        job_queue = getattr(self._application, "job_queue", None)
+        if job_queue is not None:
+            self._timer = job_queue.run_once(self._on_job, delay, name="expiries")
+        else:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _disarm(self) -> None:
+        if self._timer is not None:
+            if hasattr(self._timer, "schedule_removal"):
+                self._timer.schedule_removal()
+            else:
+                self._timer.cancel()
+        self._timer = None
+        self._timer_due = None
+
+    async def _on_job(self, context) -> None:
+        self._timer = None
+        await self._fire()
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        task = asyncio.get_running_loop().create_task(self._fire())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fire(self) -> None:
+        self._timer_due = None
+        try:
+            await self._run_due()
+        finally:
+            if self._timer is None:
+                self._arm()
+
+
+expiry_scheduler = ExpiryScheduler()
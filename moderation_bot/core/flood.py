@@ -0,0 +1,84 @@
+import time
+from array import array
+from collections import OrderedDict
+
+DEFAULT_LIMIT = 5  # messages allowed...
+DEFAULT_WINDOW = 3.0  # ...within this many seconds
+DEFAULT_MAX_USERS = 50_000
+
+
+class FloodDetector:
+    """Sliding-window message rate check per (chat, user) in O(1) per message.
+
+    Each active user gets a ring holding the times of their last ``limit``
+    messages. A new message is a flood if the oldest entry in the ring (the
+    message ``limit`` messages ago) is less than ``window`` seconds old.
+
+    Users are kept in least-recently-active order. Entries whose last message
+    is older than ``window`` can no longer trigger anything and are evicted
+    from the front as new messages come in, as are the least recently active
+    users beyond ``max_users``, so memory follows the number of users posting
+    right now rather than the number who ever posted.
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, window: float = DEFAULT_WINDOW,
+                 max_users: int = DEFAULT_MAX_USERS, clock=time.monotonic):
+        if limit < 1:
+            raise ValueError("`limit` must be a positive integer!")
+        self.limit = limit
+        self.window = window
+        self.max_users = max_users
+        self._clock = clock
+        # (chat_id, user_id) -> [next ring position, last message time, muted until, ring]
+        self._users = OrderedDict()
+        self.floods = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def hit(self, chat_id, user_id) -> bool:
+        """Records a message; returns True if it puts the user over the limit."""
+        now = self._clock()
+        key = (chat_id, user_id)
+        entry = self._users.get(key)
+        if entry is None:
+            entry = self._users[key] = [0, now, 0.0, array("d", [float("-inf")]) * self.limit]
+        else:
+            self._users.move_to_end(key)
+        entry[1] = now
+        self._evict(now, key)
+
+        position, _, muted_until, ring = entry
+        oldest = ring[position]
+        ring[position] = now
+        entry[0] = (position + 1) % self.limit
+        if now < muted_until:
+            return False
+        if now - oldest < self.window:
+            self.floods += 1
+            return True
+        return False
+
+    def mute(self, chat_id, user_id, seconds: float) -> None:
+        """Stops reporting a user while their restriction is in place."""
+        entry = self._users.get((chat_id, user_id))
+        if entry is not None:
+            entry[2] = self._clock() + seconds
+
+    def _evict(self, now: float, current) -> None:
+        """Drops users from the front; ``current`` (the user being hit, at the back) is never dropped."""
+        users = self._users
+        while len(users) > max(self.max_users, 1):
+            users.popitem(last=False)
+        # At most a couple of idle users per message keeps the cost constant
+        for _ in range(2):
+            key = next(iter(users))
+            if key == current:
+                break
+            _, last_seen, muted_until, _ = users[key]
+            if now - last_seen < self.window or now < muted_until:
+                break
+            del users[key]
+
+
+flood_detector = FloodDetector()
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import multiprocessing
+import queue
+import signal
+
+import structlog
+
+from moderation_bot.core.startup import WebhookEndpoint, run_application, wait_for_stop_signal
+
+logger = structlog.get_logger(__name__)
+
+# Update fields that carry a chat, and where the chat ID sits in them
+_CHAT_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post", "business_message",
+    "edited_business_message", "message_reaction", "message_reaction_count", "chat_member",
+    "my_chat_member", "chat_join_request", "chat_boost", "removed_chat_boost",
+)
+_USER_FIELDS = (
+    "callback_query", "inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+    "poll_answer", "purchased_paid_media",
+)
+
+
+def update_chat_id(data: dict) -> int:
+    """Returns the ID an update is routed by: its chat, else its user, else 0.
+
+    Works on the raw JSON so the ingress process never builds ``Update`` objects.
+    """
+    for field in _CHAT_FIELDS:
+        payload = data.get(field)
+        if payload:
+            chat = payload.get("chat")
+            if chat:
+                return chat["id"]
+    callback_query = data.get("callback_query")
+    if callback_query and callback_query.get("message"):
+        return callback_query["message"]["chat"]["id"]
+    for field in _USER_FIELDS:
+        payload = data.get(field)
+        if payload:
+            user = payload.get("from") or payload.get("user")
+            if user:
+                return user["id"]
+    return 0
+
+
+# The worker that owns bot_data and user_data
+PRIMARY_WORKER = 0
+
+
+def worker_index(chat_id: int, workers: int) -> int:
+    return chat_id % workers
+
+
+def worker_persistence(path: str, index: int, workers: int):
+    """Returns the persistence of worker ``index``, which loads and writes only what the worker owns.
+
+    Every worker keeps the chat_data of the chats routed to it. bot_data and
+    user_data are not split by chat, so they belong to worker
+    :data:`PRIMARY_WORKER` alone; the other workers keep theirs in memory
+    only, instead of overwriting the primary's rows with their own copies.
+    """
+    from telegram.ext import PersistenceInput
+
+    from moderation_bot.core.persistence import SQLitePersistence
+
+    primary = index == PRIMARY_WORKER
+    return SQLitePersistence(
+        path,
+        store_data=PersistenceInput(bot_data=primary, chat_data=True, user_data=primary, callback_data=primary),
+        chat_filter=lambda chat_id: worker_index(chat_id, workers) == index,
+    )
+
+
+def run_worker(index: int, workers: int, token: str, inbox, coordinator, persistence_path: str, shards: int,
+               metrics_port: int = None) -> None:
+    """Entry point of a worker process: runs the full handler set on the updates routed to it.
+
+    With ``metrics_port`` set, worker ``index`` serves its metrics on ``metrics_port + index``.
+    """
+    asyncio.run(_serve_worker(index, workers, token, inbox, coordinator, persistence_path, shards, metrics_port))
+
+
+async def _serve_worker(index, workers, token, inbox, coordinator, persistence_path, shards, metrics_port) -> None:
+    # Imported here: the ingress is started from main, and workers are fresh (spawned) interpreters
+    from telegram import Update
+
+    from moderation_bot.core.admin_cache import admin_cache
+    from moderation_bot.core.broadcast import broadcaster
+    from moderation_bot.main import build_application, rate_limiter
+
+    # The ingress process tells us when to stop, after it stopped accepting updates
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    admin_cache.coordinator = coordinator
+    rate_limiter.coordinator = coordinator
+    broadcaster.owner = f"worker-{index}"
+    persistence = worker_persistence(persistence_path, index, workers) if persistence_path else None
+    application = build_application(
+        token, persistence=persistence, shards=shards,
+        metrics_port=metrics_port + index if metrics_port else None,
+    )
+
+    # Each worker sees its own subset of update IDs, so each keeps its own watermark
+    application.update_processor.deduplicator.state_key = f"last_update_id:{index}"
+
+    loop = asyncio.get_running_loop()
+
+    async def serve() -> None:
+        logger.info("Worker started", worker=index)
+        while True:
+            body = await loop.run_in_executor(None, inbox.get)
+            if body is None:
+                break
+            try:
+                update = Update.de_json(json.loads(body), application.bot)
+            except Exception as e:
+                logger.error("Dropping malformed update", worker=index, error=e)
+                continue
+            await application.update_queue.put(update)
+
+    await run_application(application, serve)
+    logger.info("Worker stopped", worker=index)
+
+
+class WebhookIngress(WebhookEndpoint):
+    """Receives webhook POSTs and hands each update to the worker process that owns its chat.
+
+    Updates are routed by ``chat_id % workers``, so all updates of a chat land
+    in the same worker, in the order they were received, and that worker is
+    the only one holding the chat's ``chat_data``. The ingress only parses
+    JSON far enough to find the chat; everything else happens in the workers.
+    Workers share the global rate budget and admin cache invalidations through
+    a :class:`~moderation_bot.core.coordination.SharedCoordinator`, and one
+    SQLite file in which each writes only what it owns (see
+    :func:`worker_persistence`).
+    """
+
+    def __init__(self, token: str, workers: int, coordinator, persistence_path: str = None, shards: int = 8,
+                 secret_token: str = None, max_queue: int = 10_000, metrics_port: int = None, context=None):
+        super().__init__(secret_token)
+        self.token = token
+        self.workers = workers
+        self.coordinator = coordinator
+        self.persistence_path = persistence_path
+        self.shards = shards
+        self.max_queue = max_queue
+        self.metrics_port = metrics_port
+        self._context = context or multiprocessing.get_context("spawn")
+        self._inboxes = []
+        self._processes = []
+        self.received = 0
+        self.rejected = 0
+
+    def start_workers(self) -> None:
+        for index in range(self.workers):
+            inbox = self._context.Queue(self.max_queue)
+            process = self._context.Process(
+                target=run_worker,
+                args=(index, self.workers, self.token, inbox, self.coordinator, self.persistence_path,
+                      self.shards, self.metrics_port),
+                name=f"moderation-bot-worker-{index}",
+            )
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+
+    def stop_workers(self, timeout: float = 30.0) -> None:
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker did not stop in time, killing it", pid=process.pid)
+                process.kill()
+        self._inboxes = []
+        self._processes = []
+
+    def dispatch(self, body: bytes) -> int:
+        """Routes one webhook body to its worker and returns the HTTP status to answer with."""
+        try:
+            data = json.loads(body)
+            chat_id = update_chat_id(data)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            self.rejected += 1
+            return 400
+        try:
+            self._inboxes[worker_index(chat_id, self.workers)].put_nowait(body)
+        except queue.Full:
+            # Telegram redelivers on errors; better than blocking the ingress
+            self.rejected += 1
+            return 503
+        self.received += 1
+        return 200
+
+    async def serve(self, listen: str, port: int, url_path: str, webhook_url: str, allowed_updates=None) -> None:
+        """Starts the workers, registers the webhook and serves until SIGINT/SIGTERM."""
+        from telegram import Bot
+
+        self.start_workers()
+        server = self.make_app(url_path).listen(port, address=listen)
+        try:
+            async with Bot(self.token) as bot:
+                await bot.set_webhook(webhook_url, allowed_updates=allowed_updates, secret_token=self.secret_token)
+            logger.info("Webhook ingress listening", port=port, workers=self.workers)
+            await wait_for_stop_signal()
+        finally:
+            server.stop()
+            await asyncio.get_running_loop().run_in_executor(None, self.stop_workers)
+            logger.info("Webhook ingress stopped", received=self.received, rejected=self.rejected)
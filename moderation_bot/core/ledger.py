@@ -0,0 +1,177 @@
+import time
+from collections import deque
+
+WARNINGS_KEY = "warnings"  # chat_data key holding the chat's WarningLedger
+MUTE = "mute"
+BAN = "ban"
+
+DEFAULT_LIMIT = 3
+DEFAULT_WINDOW = 7 * 86400
+DEFAULT_ACTION = MUTE
+DEFAULT_DURATION = 86400
+# Dead log rows tolerated before the log is compacted
+COMPACT_MIN = 1024
+
+
+class WarningLedger:
+    """A chat's warnings plus the policy that escalates them.
+
+    Warnings are appended to a log of ``(timestamp, user_id, admin_id,
+    reason)`` rows; each user has a deque of positions into the log, oldest
+    first. Warnings older than ``window`` seconds expire: they are dropped
+    from the front of a user's deque whenever the user is looked at, so
+    counting a user's active warnings is O(1) amortized no matter how long
+    the chat's history is. Since the log is in time order, expired rows are
+    also swept from its head on every write and on ``len()``, so warnings of
+    users who never come back stop counting too. Expired and reset rows stay
+    in the log until they outnumber the live ones, then the log is compacted
+    in one pass.
+
+    After ``limit`` active warnings the user gets ``action`` (mute or ban)
+    for ``duration`` seconds (None: permanently). Only live rows and the
+    policy are pickled; the index is rebuilt on load. ``version`` changes
+    whenever a warning is added or reset or the policy is changed.
+    """
+
+    __slots__ = ("limit", "window", "action", "duration", "_clock", "_log", "_index", "_live", "_head", "version")
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, window: int = DEFAULT_WINDOW, action: str = DEFAULT_ACTION,
+                 duration=DEFAULT_DURATION, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.action = action
+        self.duration = duration
+        self._clock = clock
+        self._log = []
+        self._index = {}  # user_id -> deque of log positions of the user's active warnings
+        self._live = 0
+        self._head = 0  # rows before this log position are expired or reset
+        self.version = 0
+
+    def __len__(self) -> int:
+        self._sweep()
+        return self._live
+
+    def __repr__(self) -> str:
+        return f"WarningLedger(users={len(self._index)}, warnings={self._live})"
+
+    # --- Lookups ------------------------------------------------------------------------
+
+    def _active(self, user_id):
+        """Returns the user's deque after dropping expired warnings, or None if they have none."""
+        positions = self._index.get(user_id)
+        if positions is None:
+            return None
+        cutoff = self._clock() - self.window
+        log = self._log
+        while positions and log[positions[0]][0] <= cutoff:
+            positions.popleft()
+            self._live -= 1
+        if not positions:
+            del self._index[user_id]
+            return None
+        return positions
+
+    def count(self, user_id: int) -> int:
+        positions = self._active(user_id)
+        return len(positions) if positions else 0
+
+    def warnings(self, user_id: int) -> list:
+        """Returns the user's active warnings as ``(timestamp, admin_id, reason)``, oldest first."""
+        positions = self._active(user_id)
+        if not positions:
+            return []
+        return [self._log[position][0:1] + self._log[position][2:] for position in positions]
+
+    # --- Updates ------------------------------------------------------------------------
+
+    def add(self, user_id: int, admin_id: int, reason: str) -> int:
+        """Records a warning and returns the user's number of active warnings."""
+        self._sweep()
+        self._maybe_compact()
+        self._append((self._clock(), user_id, admin_id, reason))
+        self.version += 1
+        return len(self._active(user_id))
+
+    def reset(self, user_id: int) -> int:
+        """Forgets the user's warnings and returns how many were active."""
+        positions = self._active(user_id)
+        if not positions:
+            return 0
+        del self._index[user_id]
+        self._live -= len(positions)
+        self.version += 1
+        self._maybe_compact()
+        return len(positions)
+
+    def configure(self, limit: int, window: int, action: str, duration) -> None:
+        self.limit = limit
+        self.window = window
+        self.action = action
+        self.duration = duration
+        self.version += 1
+
+    def _append(self, row) -> None:
+        self._index.setdefault(row[1], deque()).append(len(self._log))
+        self._log.append(row)
+        self._live += 1
+
+    def _sweep(self) -> None:
+        """Drops expired warnings from the head of the log, whoever they belong to."""
+        cutoff = self._clock() - self.window
+        log = self._log
+        head = self._head
+        while head < len(log) and log[head][0] <= cutoff:
+            user_id = log[head][1]
+            positions = self._index.get(user_id)
+            # Earlier rows are all behind the head, so a live row here is its user's oldest
+            if positions and positions[0] == head:
+                positions.popleft()
+                self._live -= 1
+                if not positions:
+                    del self._index[user_id]
+            head += 1
+        self._head = head
+
+    def _live_rows(self) -> list:
+        cutoff = self._clock() - self.window
+        log = self._log
+        positions = sorted(position for user in self._index.values() for position in user)
+        return [log[position] for position in positions if log[position][0] > cutoff]
+
+    def _maybe_compact(self) -> None:
+        if len(self._log) - self._live > max(COMPACT_MIN, self._live):
+            self._rebuild(self._live_rows())
+
+    def _rebuild(self, rows) -> None:
+        self._log = []
+        self._index = {}
+        self._live = 0
+        self._head = 0
+        for row in rows:
+            self._append(row)
+
+    # --- Persistence --------------------------------------------------------------------
+
+    def __getstate__(self):
+        return (self.limit, self.window, self.action, self.duration, self._live_rows())
+
+    def __setstate__(self, state) -> None:
+        self.limit, self.window, self.action, self.duration, rows = state
+        self._clock = time.time
+        self.version = 0
+        self._rebuild(rows)
+
+    def __deepcopy__(self, memo):
+        # Rows are tuples of immutables, so they can be shared with the copy.
+        copy = WarningLedger(self.limit, self.window, self.action, self.duration, self._clock)
+        copy._rebuild(self._live_rows())
+        return copy
+
+
+def get_warning_ledger(chat_data: dict) -> WarningLedger:
+    """Returns the chat's warning ledger, creating it with the default policy."""
+    ledger = chat_data.get(WARNINGS_KEY)
+    if not isinstance(ledger, WarningLedger):
+        ledger = chat_data[WARNINGS_KEY] = WarningLedger()
+    return ledger
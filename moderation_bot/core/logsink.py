@@ -0,0 +1,211 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import structlog
+
+# Hot events and how much of them to keep: (fraction sampled, max events per second or None)
+DEFAULT_SAMPLING = {
+    "Tracked activity": (0.01, 10),
+    "Filter applied": (1.0, 20),
+}
+
+_STOP = object()
+
+
+class EventSampler:
+    """structlog processor that samples and rate limits selected events by name.
+
+    Events without a rule pass untouched. Kept events get a ``sampled`` key
+    with the sampling fraction so totals can be estimated from the logs;
+    ``dropped`` counts what was discarded per event.
+    """
+
+    def __init__(self, rules: dict = None, clock=time.monotonic, random=random.random):
+        self.rules = dict(DEFAULT_SAMPLING if rules is None else rules)
+        self.dropped = {}
+        self._clock = clock
+        self._random = random
+        self._windows = {}  # event -> [window start second, events kept in it]
+
+    def __call__(self, logger, method_name, event_dict):
+        rule = self.rules.get(event_dict.get("event"))
+        if rule is None:
+            return event_dict
+        event = event_dict["event"]
+        fraction, per_second = rule
+        if fraction < 1.0 and self._random() >= fraction:
+            self._drop(event)
+        if per_second is not None:
+            second = int(self._clock())
+            window = self._windows.get(event)
+            if window is None or window[0] != second:
+                window = self._windows[event] = [second, 0]
+            if window[1] >= per_second:
+                self._drop(event)
+            window[1] += 1
+        if fraction < 1.0:
+            event_dict["sampled"] = fraction
+        return event_dict
+
+    def _drop(self, event):
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        raise structlog.DropEvent
+
+
+def parse_sampling(spec: str) -> dict:
+    """Parses ``LOG_SAMPLING``, e.g. ``"Tracked activity=0.01:10;Filter applied=1:20"``.
+
+    Each entry is ``event=fraction[:max per second]``.
+    """
+    rules = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        event, _, value = entry.rpartition("=")
+        fraction, _, per_second = value.partition(":")
+        rules[event.strip()] = (float(fraction), int(per_second) if per_second else None)
+    return rules
+
+
+def capture_exc_info(logger, method_name, event_dict):
+    """Resolves ``exc_info=True`` on the calling thread, where the exception is still current."""
+    exc_info = event_dict.get("exc_info")
+    if exc_info is True:
+        event_dict["exc_info"] = sys.exc_info()
+    elif isinstance(exc_info, BaseException):
+        event_dict["exc_info"] = (type(exc_info), exc_info, exc_info.__traceback__)
+    return event_dict
+
+
+def stamp(logger, method_name, event_dict):
+    """Records the event time; it is formatted on the writer thread."""
+    event_dict["timestamp"] = time.time()
+    return event_dict
+
+
+class QueueLogSink:
+    """Renders and writes log events on a background thread.
+
+    The event loop only puts the event dict on a bounded queue. If the
+    writer falls behind and the queue fills up, new events are dropped and
+    counted rather than blocking the caller.
+    """
+
+    def __init__(self, file=None, max_queue: int = 10000):
+        self.file = file
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._renderer = structlog.processors.JSONRenderer()
+        self._format_exc_info = structlog.processors.format_exc_info
+
+    def put(self, method_name: str, event_dict: dict) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((method_name, event_dict))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="QueueLogSink", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            method_name, event_dict = item
+            try:
+                line = self.render(method_name, event_dict)
+                file = self.file or sys.stdout
+                file.write(line + "\n")
+                if self._queue.empty():
+                    file.flush()
+            except Exception:
+                # Never let a bad event kill the writer thread
+                pass
+
+    def render(self, method_name: str, event_dict: dict) -> str:
+        timestamp = event_dict.get("timestamp")
+        if isinstance(timestamp, float):
+            event_dict["timestamp"] = datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+        if "exc_info" in event_dict:
+            event_dict = self._format_exc_info(None, method_name, event_dict)
+        return self._renderer(None, method_name, event_dict)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Writes out what is queued and stops the thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+
+class QueueLogger:
+    """structlog logger that hands events to a :class:`QueueLogSink`."""
+
+    def __init__(self, sink: QueueLogSink):
+        self._sink = sink
+
+    def _make_method(method_name):
+        def method(self, **event_dict):
+            self._sink.put(method_name, event_dict)
+        method.__name__ = method_name
+        return method
+
+    msg = _make_method("info")
+    debug = _make_method("debug")
+    info = _make_method("info")
+    warning = warn = _make_method("warning")
+    error = err = _make_method("error")
+    critical = fatal = exception = _make_method("critical")
+    del _make_method
+
+
+class QueueLoggerFactory:
+    def __init__(self, sink: QueueLogSink):
+        self.sink = sink
+
+    def __call__(self, *args) -> QueueLogger:
+        return QueueLogger(self.sink)
+
+
+sink = QueueLogSink()
+sampler = EventSampler()
+
+
+def configure_logging(level: str = None, sampling: str = None) -> None:
+    """Configures structlog for the bot.
+
+    ``level`` (default ``LOG_LEVEL`` or INFO) is compiled into the bound
+    logger class, so calls below it are no-ops. ``sampling`` (default
+    ``LOG_SAMPLING``) overrides the sampling rules, see :func:`parse_sampling`.
+    """
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    sampling = sampling if sampling is not None else os.getenv("LOG_SAMPLING")
+    if sampling:
+        sampler.rules = parse_sampling(sampling)
+    structlog.configure(
+        processors=[
+            structlog.processors.add_log_level,
+            sampler,
+            capture_exc_info,
+            stamp,
+        ],
+        wrapper_class=structlog.make_filtering_bound_logger(getattr(logging, level.upper())),
+        logger_factory=QueueLoggerFactory(sink),
+        cache_logger_on_first_use=True,
+    )
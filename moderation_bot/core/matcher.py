@@ -0,0 +1,92 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher built from a fixed set of patterns.
+
+    The automaton is compiled once and then scans a text in a single pass,
+    regardless of how many patterns it holds.
+    """
+
+    __slots__ = ("patterns", "_goto", "_fail", "_out", "_max_len")
+
+    def __init__(self, patterns):
+        # Sorted so that the automaton (and therefore tie-breaking) does not
+        # depend on dict insertion order.
+        self.patterns = tuple(sorted({p for p in patterns if p}))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._max_len = max((len(p) for p in self.patterns), default=0)
+        self._build()
+
+    def _build(self) -> None:
+        goto, out = self._goto, self._out
+        for pattern in self.patterns:
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    self._fail.append(0)
+                    out.append(())
+                state = next_state
+            out[state] = (pattern,)
+
+        # Breadth-first pass to fill in failure links and merge outputs.
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = goto[fallback].get(char, 0)
+                self._fail[next_state] = link if link != next_state else 0
+                out[next_state] = out[next_state] + out[self._fail[next_state]]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def iter_matches(self, text: str):
+        """Yields ``(start, pattern)`` for every occurrence of every pattern in ``text``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in out[state]:
+                yield index - len(pattern) + 1, pattern
+
+    def find_first(self, text: str):
+        """Returns the pattern that occurs first in ``text``, or None.
+
+        "First" means the occurrence with the smallest start offset; ties are
+        broken by preferring the longer pattern. The scan stops as soon as no
+        later occurrence could start before the best one found so far.
+        """
+        if not self.patterns:
+            return None
+
+        goto, fail, out = self._goto, self._fail, self._out
+        best_start = best_pattern = None
+        state = 0
+        for index, char in enumerate(text):
+            if best_start is not None and index - self._max_len + 1 > best_start:
+                break
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in out[state]:
+                start = index - len(pattern) + 1
+                if (
+                    best_start is None
+                    or start < best_start
+                    or (start == best_start and len(pattern) > len(best_pattern))
+                ):
+                    best_start, best_pattern = start, pattern
+        return best_pattern
@@ -0,0 +1,256 @@
+import asyncio
+import time
+from bisect import bisect_left
+
+import structlog
+from telegram import Update
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter. Recording is a single dict update; formatting happens at scrape time."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for labelvalues, value in list(self._values.items()):
+            yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+class Gauge:
+    """Value read from a callback when metrics are scraped."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if not self.labelnames:
+            yield self.name, "", value
+            return
+        # Labelled gauges return {label values tuple: value}
+        for labelvalues, sample in value.items():
+            yield self.name, _format_labels(self.labelnames, labelvalues), sample
+
+
+class Histogram:
+    """Fixed-bucket histogram; each observation bumps one bucket, cumulation happens at scrape."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum]
+
+    def observe(self, value: float, *labelvalues) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labelvalues, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labelnames + ("le",), labelvalues + (le,)),
+                    cumulative,
+                )
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, callback, labelnames))
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {value}")
+            except Exception as e:
+                logger.warning("Failed to collect metric", metric=metric.name, error=e)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Time spent in each handler or pipeline stage.", ("handler",)
+)
+api_requests = registry.counter(
+    "bot_api_requests_total", "Bot API calls by method and outcome (ok, error, retry_after).", ("method", "outcome")
+)
+updates_received = registry.counter("bot_updates_total", "Updates processed, by update type.", ("type",))
+
+# The most frequent types first, so the lookup usually stops after one or two attributes
+_COMMON_UPDATE_TYPES = ("message", "chat_member", "edited_message", "callback_query", "my_chat_member")
+_UPDATE_TYPES = _COMMON_UPDATE_TYPES + tuple(
+    str(name) for name in Update.ALL_TYPES if name not in _COMMON_UPDATE_TYPES
+)
+
+
+class EventLoopMonitor:
+    """Measures how late the event loop wakes up a task that sleeps for ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="EventLoopMonitor")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - started - self.interval)
+
+
+loop_monitor = EventLoopMonitor()
+registry.gauge("bot_event_loop_lag_seconds", "Delay of the last event loop wake-up.", lambda: loop_monitor.lag)
+
+
+def timed_callback(label: str, callback):
+    """Wraps an async handler callback so its duration is recorded in ``handler_latency``."""
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        finally:
+            handler_latency.observe(time.perf_counter() - started, label)
+    timed.__name__ = getattr(callback, "__name__", label)
+    timed.__doc__ = getattr(callback, "__doc__", None)
+    return timed
+
+
+def instrument_application(application) -> None:
+    """Times every registered handler and exposes the update processor's load as gauges."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed_callback(getattr(handler.callback, "__name__", "handler"), handler.callback)
+    processor = application.update_processor
+    if hasattr(processor, "in_flight"):
+        registry.gauge("bot_updates_in_flight", "Updates queued or being handled.", lambda: processor.in_flight)
+    if hasattr(processor, "queue_depths"):
+        registry.gauge(
+            "bot_shard_queue_depth", "Updates waiting per processor shard.",
+            lambda: {(str(index),): depth for index, depth in enumerate(processor.queue_depths())},
+            ("shard",),
+        )
+
+
+def update_type(update) -> str:
+    """Returns the name of the field that is set on an update, e.g. ``message``."""
+    for name in _UPDATE_TYPES:
+        if getattr(update, name, None) is not None:
+            return name
+    return "unknown"
+
+
+class MetricsServer:
+    """Minimal HTTP server answering ``GET /metrics`` from inside the bot's event loop."""
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 9000, registry: Registry = registry):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Metrics endpoint listening", host=self.host, port=self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers; the request body (if any) is ignored.
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
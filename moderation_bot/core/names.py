@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 50_000
+
+
+class NameCache:
+    """Bounded LRU of display names, keyed by ``(chat_id, user_id)``.
+
+    It is filled passively from the senders of incoming messages so that
+    commands like /top rarely have to ask the API who someone is.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._names = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def remember(self, chat_id, user_id, name: str) -> None:
+        key = (chat_id, user_id)
+        self._names[key] = name
+        self._names.move_to_end(key)
+        if len(self._names) > self.max_entries:
+            self._names.popitem(last=False)
+
+    def get(self, chat_id, user_id):
+        return self._names.get((chat_id, user_id))
+
+    def forget(self, chat_id, user_id) -> None:
+        self._names.pop((chat_id, user_id), None)
+
+    def clear(self) -> None:
+        self._names.clear()
+
+
+name_cache = NameCache()
@@ -0,0 +1,370 @@
+import asyncio
+import hashlib
+import pickle
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import structlog
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = structlog.get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data (
+    kind TEXT NOT NULL,
+    owner INTEGER NOT NULL,
+    key BLOB NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (kind, owner, key)
+);
+CREATE TABLE IF NOT EXISTS callback_data (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    lease_until REAL NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key BLOB NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+CHAT, USER, BOT = "chat", "user", "bot"
+_DROPPED = object()
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+def _snapshot(data: dict, previous: dict) -> tuple:
+    """Pickles every top-level key and value of ``data`` as it is right now.
+
+    Values with a ``version`` attribute (activity counters, warning ledgers)
+    are only pickled again if they are a different object or their version
+    moved since ``previous``, the cache returned for the same owner last time.
+    Returns the pickled rows and the cache for next time.
+    """
+    rows, cache = {}, {}
+    for key, value in data.items():
+        version = getattr(value, "version", None)
+        cached = previous.get(key) if version is not None else None
+        if cached is not None and cached[0] is value and cached[1] == version:
+            key_blob, value_blob = cached[2], cached[3]
+        else:
+            key_blob = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+            value_blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if version is not None:
+            cache[key] = (value, version, key_blob, value_blob)
+        rows[key_blob] = value_blob
+    return rows, cache
+
+
+class SQLitePersistence(BasePersistence):
+    """Stores chat, user and bot data in a local SQLite database (WAL mode).
+
+    Updates handed over by the application are pickled right away, on the
+    event loop, and the bytes are buffered in memory and written in a single
+    transaction once ``max_batch`` owners are dirty or ``flush_interval``
+    seconds have passed. The writer thread never touches the data dicts
+    themselves, which handlers keep changing meanwhile. Every top-level key of
+    a data dict is stored in its own row and only rows whose pickled value
+    changed since the last write are touched. Large values that keep a
+    ``version`` are not even pickled again until it changes.
+
+    Small values that change with every update (such as how far update
+    processing got) are registered with :meth:`register_state` instead: they
+    are read when a batch is written, so they cost nothing per update.
+
+    With ``chat_filter`` set, only the chats it returns True for are loaded;
+    several processes can then share one database, each owning a set of chats.
+    Long-running jobs that any of them may pick up after a restart are kept
+    in a table of their own, each leased to one process at a time (see
+    :meth:`claim_jobs`); unlike the data dicts, they are written right away.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        store_data: PersistenceInput = None,
+        update_interval: float = 10,
+        flush_interval: float = 5,
+        max_batch: int = 500,
+        chat_filter=None,
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.path = path
+        self.chat_filter = chat_filter
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        # Single writer thread: the connection is only ever used from there.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-persistence")
+        self._conn = None
+        self._pending = {}  # (kind, owner) -> {pickled key: pickled value}, or _DROPPED
+        self._written = {}  # (kind, owner) -> {pickled key: digest of pickled value}
+        self._pickled = {}  # (kind, owner) -> {key: (value, version, pickled key, pickled value)}
+        self._states = {}  # state key -> callback returning its current value
+        self._written_states = {}  # state key -> pickled value last written
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    # --- Threaded database access -------------------------------------------------------
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load(self, kind: str) -> dict:
+        rows = self._connect().execute("SELECT owner, key, value FROM data WHERE kind = ?", (kind,))
+        result = {}
+        for owner, key_blob, value_blob in rows:
+            if kind == CHAT and self.chat_filter is not None and not self.chat_filter(owner):
+                continue
+            result.setdefault(owner, {})[pickle.loads(key_blob)] = pickle.loads(value_blob)
+            self._written.setdefault((kind, owner), {})[key_blob] = _digest(value_blob)
+        return result
+
+    def _write_batch(self, batch: dict, states: dict = None) -> int:
+        upserts, deletes, drops = [], [], []
+        states = states or {}
+        staged = {}  # digests to remember once the transaction has committed
+        for (kind, owner), snapshot in batch.items():
+            if snapshot is _DROPPED:
+                drops.append((kind, owner))
+                staged[(kind, owner)] = {}
+                continue
+
+            written = self._written.get((kind, owner), {})
+            current = {}
+            for key_blob, value_blob in snapshot.items():
+                current[key_blob] = _digest(value_blob)
+                if written.get(key_blob) != current[key_blob]:
+                    upserts.append((kind, owner, key_blob, value_blob))
+            deletes.extend((kind, owner, key_blob) for key_blob in written if key_blob not in current)
+            staged[(kind, owner)] = current
+
+        if upserts or deletes or drops or states:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", states.items())
+                conn.executemany(
+                    "INSERT INTO data (kind, owner, key, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, owner, key) DO UPDATE SET value = excluded.value",
+                    upserts,
+                )
+                conn.executemany("DELETE FROM data WHERE kind = ? AND owner = ? AND key = ?", deletes)
+                conn.executemany("DELETE FROM data WHERE kind = ? AND owner = ?", drops)
+        self._written.update(staged)
+        return len(upserts) + len(deletes) + len(drops) + len(states)
+
+    def _execute(self, sql: str, params: tuple) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(sql, params)
+
+    def _fetchall(self, sql: str, params: tuple) -> list:
+        return self._connect().execute(sql, params).fetchall()
+
+    def _chat_values(self, key_blob: bytes) -> dict:
+        conn = self._connect()
+        values = dict.fromkeys(owner for (owner,) in conn.execute(
+            "SELECT DISTINCT owner FROM data WHERE kind = ?", (CHAT,)
+        ))
+        for owner, value_blob in conn.execute("SELECT owner, value FROM data WHERE kind = ? AND key = ?", (CHAT, key_blob)):
+            values[owner] = pickle.loads(value_blob)
+        return values
+
+    def _save_job(self, job_id: str, value_blob: bytes, owner: str, lease_until: float) -> bool:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (id, owner, lease_until, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET lease_until = excluded.lease_until, value = excluded.value "
+                "WHERE jobs.owner = excluded.owner",
+                (job_id, owner, lease_until, value_blob),
+            )
+        return cursor.rowcount > 0
+
+    def _claim_jobs(self, owner: str, lease_until: float, now: float) -> list:
+        conn = self._connect()
+        with conn:
+            # Taking the write lock first makes claiming atomic between processes
+            conn.execute("UPDATE jobs SET owner = ?, lease_until = ? WHERE owner = ? OR lease_until < ?",
+                         (owner, lease_until, owner, now))
+            rows = conn.execute("SELECT value FROM jobs WHERE owner = ? ORDER BY id", (owner,)).fetchall()
+        return [pickle.loads(value_blob) for (value_blob,) in rows]
+
+    # --- Write-behind buffer ------------------------------------------------------------
+
+    async def _buffer(self, kind: str, owner: int, data) -> None:
+        if data is _DROPPED:
+            self._pickled.pop((kind, owner), None)
+            self._pending[(kind, owner)] = data
+        else:
+            rows, self._pickled[(kind, owner)] = _snapshot(data, self._pickled.get((kind, owner), {}))
+            self._pending[(kind, owner)] = rows
+        if len(self._pending) >= self.max_batch:
+            await self._flush_pending()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self._flush_pending()
+
+    def _changed_states(self) -> dict:
+        states = {}
+        for key, callback in self._states.items():
+            value_blob = pickle.dumps(callback(), protocol=pickle.HIGHEST_PROTOCOL)
+            if self._written_states.get(key) != value_blob:
+                states[key] = value_blob
+        return states
+
+    async def _flush_pending(self) -> None:
+        async with self._flush_lock:
+            states = self._changed_states()
+            if not self._pending and not states:
+                return
+
+            batch, self._pending = self._pending, {}
+            try:
+                rows = await self._run(self._write_batch, batch, states)
+            except Exception as e:
+                # Put the batch back (newer buffered data wins) so it is retried next time.
+                self._pending = {**batch, **self._pending}
+                logger.error("Failed to write persistence batch", error=e, owners=len(batch))
+                return
+
+            self._written_states.update(states)
+            self.flushes += 1
+            self.rows_written += rows
+            logger.debug("Persistence batch written", owners=len(batch), rows=rows)
+
+    # --- Process state ------------------------------------------------------------------
+
+    def register_state(self, key: str, callback) -> None:
+        """Stores ``callback()`` under ``key`` whenever a batch is written, and on :meth:`flush`."""
+        self._states[key] = callback
+
+    async def get_state(self, key: str, default=None):
+        rows = await self._run(self._fetchall, "SELECT value FROM state WHERE key = ?", (key,))
+        return pickle.loads(rows[0][0]) if rows else default
+
+    # --- Leased jobs --------------------------------------------------------------------
+
+    async def save_job(self, job_id: str, job, owner: str, lease_until: float) -> bool:
+        """Stores a job leased to ``owner`` until ``lease_until`` (a :func:`time.time`).
+
+        Returns False, without writing anything, if another owner holds the job.
+        """
+        value_blob = pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL)
+        return await self._run(self._save_job, job_id, value_blob, owner, lease_until)
+
+    async def claim_jobs(self, owner: str, lease_until: float) -> list:
+        """Leases ``owner`` the jobs it already holds and those whose lease ran out; returns them."""
+        return await self._run(self._claim_jobs, owner, lease_until, time.time())
+
+    async def drop_job(self, job_id: str) -> None:
+        await self._run(self._execute, "DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    async def get_chat_values(self, key) -> dict:
+        """Returns ``{chat_id: chat_data.get(key)}`` for every chat stored, the filtered-out ones included.
+
+        Reads what was last written, so chats owned by other processes may lag
+        behind by up to ``flush_interval`` seconds.
+        """
+        key_blob = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+        return await self._run(self._chat_values, key_blob)
+
+    # --- BasePersistence interface ------------------------------------------------------
+
+    async def get_chat_data(self) -> dict:
+        return await self._run(self._load, CHAT)
+
+    async def get_user_data(self) -> dict:
+        return await self._run(self._load, USER)
+
+    async def get_bot_data(self) -> dict:
+        return (await self._run(self._load, BOT)).get(0, {})
+
+    async def get_callback_data(self):
+        rows = await self._run(self._fetchall, "SELECT value FROM callback_data WHERE id = 0", ())
+        return pickle.loads(rows[0][0]) if rows else None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await self._run(self._fetchall, "SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {pickle.loads(key): pickle.loads(state) for key, state in rows}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        await self._buffer(CHAT, chat_id, data)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await self._buffer(USER, user_id, data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        await self._buffer(BOT, 0, data)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._buffer(CHAT, chat_id, _DROPPED)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._buffer(USER, user_id, _DROPPED)
+
+    async def update_callback_data(self, data) -> None:
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO callback_data (id, value) VALUES (0, ?)",
+            (pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),),
+        )
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        key_blob = pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+        if new_state is None:
+            await self._run(self._execute, "DELETE FROM conversations WHERE name = ? AND key = ?", (name, key_blob))
+        else:
+            await self._run(
+                self._execute,
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                (name, key_blob, pickle.dumps(new_state, protocol=pickle.HIGHEST_PROTOCOL)),
+            )
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Writes everything still buffered and closes the database."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._flush_pending()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        logger.info("Persistence flushed", flushes=self.flushes, rows_written=self.rows_written)
@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_TTL = 3600.0
+DEFAULT_MAX_CHATS = 4096
+
+
+def _message_text(message):
+    if message is None:
+        return None
+    return getattr(message, "text", None) or getattr(message, "caption", None)
+
+
+class PinTracker:
+    """Per-chat memory of the currently pinned message.
+
+    Kept up to date by ``pinned_message`` service messages and by the bot's
+    own pin and unpin calls, so most questions about a chat's pin are
+    answered without calling ``getChat``. Entries are trusted for ``ttl``
+    seconds (pins by other bots or from the channel side can go unnoticed),
+    then refetched; the least recently used chat is dropped beyond
+    ``max_chats``.
+
+    Unpinning the current message makes the previous pin current again,
+    which we don't know, so that forgets the chat instead.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_chats: int = DEFAULT_MAX_CHATS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self._clock = clock
+        self._entries = OrderedDict()  # chat_id -> (expires_at, pinned message id or None, text)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, chat_id):
+        """Returns ``(message_id, text)`` of the chat's pin if known (``message_id`` None when
+        nothing is pinned), or None if the chat's state is unknown or stale."""
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, message_id, text = entry
+        if expires_at <= self._clock():
+            del self._entries[chat_id]
+            return None
+        self._entries.move_to_end(chat_id)
+        return message_id, text
+
+    async def get(self, bot, chat_id):
+        """Returns ``(message_id, text)`` of the chat's pin, asking ``getChat`` if it is not known."""
+        state = self.peek(chat_id)
+        if state is not None:
+            self.hits += 1
+            return state
+        self.misses += 1
+        chat = await bot.get_chat(chat_id)
+        self.pinned(chat_id, chat.pinned_message)
+        return self.peek(chat_id)
+
+    def pinned(self, chat_id, message) -> None:
+        """Records ``message`` (or None: nothing) as the chat's pinned message."""
+        message_id = message.message_id if message is not None else None
+        self._entries[chat_id] = (self._clock() + self.ttl, message_id, _message_text(message))
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_chats:
+            self._entries.popitem(last=False)
+
+    def unpinned(self, chat_id, message_id=None) -> None:
+        """Records an unpin of ``message_id`` (None: the latest pin)."""
+        entry = self._entries.get(chat_id)
+        if entry is not None and (message_id is None or entry[1] == message_id):
+            del self._entries[chat_id]
+
+    def cleared(self, chat_id) -> None:
+        """Records that every message of the chat was unpinned."""
+        self.pinned(chat_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "cached_chats": len(self._entries),
+        }
+
+
+pin_tracker = PinTracker()
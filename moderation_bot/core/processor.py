@@ -0,0 +1,103 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from .metrics import update_type, updates_received
+
+_STOP = object()
+
+
+def update_shard_key(update) -> int:
+    """Returns the ID updates are sharded by: the chat, else the user, else 0."""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+    return 0
+
+
+class ChatShardedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different chats in parallel, and of the same chat in order.
+
+    Every update is routed by chat ID to one of ``shards`` queues, each drained
+    by a single worker. Updates of one chat therefore never overlap, which
+    keeps read-modify-write access to ``chat_data`` race-free, while a slow
+    handler only holds up the chats that share its shard.
+
+    ``max_pending`` bounds how many updates may be queued or running at once.
+    The application enters :meth:`do_process_update` in arrival order (the
+    semaphore guarding it is FIFO), and the update is queued before the first
+    ``await``, so arrival order within a chat is preserved.
+
+    With a ``deduplicator`` (see :mod:`moderation_bot.core.dedup`), updates
+    whose ID was already seen are acknowledged without running the handlers.
+    """
+
+    def __init__(self, shards: int = 8, max_pending: int = 256, deduplicator=None):
+        # A limit of 1 would make the application process updates inline, so enforce 2.
+        super().__init__(max(max_pending, shards, 2))
+        if shards < 1:
+            raise ValueError("`shards` must be a positive integer!")
+        self.shards = shards
+        self.deduplicator = deduplicator
+        self._queues = []
+        self._workers = []
+        self.in_flight = 0
+
+    async def initialize(self) -> None:
+        self._queues = [asyncio.Queue() for _ in range(self.shards)]
+        self._workers = [
+            asyncio.create_task(self._work(queue), name=f"ChatShardedUpdateProcessor:shard-{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+
+    async def shutdown(self) -> None:
+        for queue in self._queues:
+            queue.put_nowait(_STOP)
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
+
+    async def do_process_update(self, update, coroutine) -> None:
+        update_id = update.update_id if self.deduplicator is not None and isinstance(update, Update) else None
+        if update_id is not None and not self.deduplicator.begin(update_id):
+            coroutine.close()
+            return
+
+        queue = self._queues[update_shard_key(update) % self.shards]
+        done = asyncio.get_running_loop().create_future()
+        queue.put_nowait((coroutine, done))
+        updates_received.inc(update_type(update))
+        self.in_flight += 1
+        success = False
+        try:
+            await done
+            success = True
+        finally:
+            self.in_flight -= 1
+            if update_id is not None:
+                self.deduplicator.finish(update_id, success)
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                return
+            coroutine, done = item
+            try:
+                await coroutine
+            except Exception as e:
+                # Handler errors never get here (the application routes them to the error
+                # handlers); this is for failures of the processing machinery itself.
+                if not done.done():
+                    done.set_exception(e)
+                continue
+            if not done.done():
+                done.set_result(None)
+
+    def queue_depths(self) -> list:
+        """Returns the number of updates waiting in each shard."""
+        return [queue.qsize() for queue in self._queues]
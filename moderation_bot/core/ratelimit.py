@@ -0,0 +1,268 @@
+import asyncio
+import heapq
+import itertools
+import time
+import warnings
+from datetime import timedelta
+
+import structlog
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from telegram.warnings import PTBDeprecationWarning
+
+from .metrics import api_requests
+
+logger = structlog.get_logger(__name__)
+
+# Priority classes, lower runs first.
+PRIORITY_MODERATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+
+_ENDPOINT_PRIORITIES = {
+    "deleteMessage": PRIORITY_MODERATION,
+    "deleteMessages": PRIORITY_MODERATION,
+    "banChatMember": PRIORITY_MODERATION,
+    "banChatSenderChat": PRIORITY_MODERATION,
+    "restrictChatMember": PRIORITY_MODERATION,
+    "unbanChatMember": PRIORITY_MODERATION,
+    "unpinChatMessage": PRIORITY_MODERATION,
+    "getChatAdministrators": PRIORITY_MODERATION,
+    "sendMessage": PRIORITY_BULK,
+    "sendChatAction": PRIORITY_BULK,
+}
+
+# Only endpoints that post something into a chat count against the per-chat limit.
+_CHAT_LIMITED_ENDPOINTS = frozenset({
+    "sendMessage", "sendPhoto", "sendVideo", "sendAnimation", "sendDocument", "sendAudio",
+    "sendVoice", "sendSticker", "sendMediaGroup", "sendPoll", "sendDice", "sendLocation",
+    "copyMessage", "copyMessages", "forwardMessage", "forwardMessages",
+})
+
+
+def retry_after_seconds(exc: RetryAfter) -> float:
+    """Returns how long a 429 asked us to wait, in seconds."""
+    # PTB 22.2+ warns that the public accessor will return a timedelta instead of an int
+    # (unless PTB_TIMEDELTA is set); both are handled here, so the warning is noise.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", PTBDeprecationWarning)
+        retry_after = exc.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class PriorityTokenBucket:
+    """Token bucket whose waiters are served by priority, then arrival order.
+
+    ``block(seconds)`` empties the bucket and stops handing out tokens until
+    the given time has passed, which is how a 429 ``retry_after`` is honored.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._drainer = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return not self._waiters and self._tokens >= self.capacity
+
+    def _refill(self, now: float) -> None:
+        if now < self._blocked_until:
+            self._updated = now
+            return
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self) -> float:
+        """Takes a token and returns 0, or returns how long to wait for the next one."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: int = PRIORITY_DEFAULT) -> None:
+        if not self._waiters and self._try_take() == 0.0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.create_task(self._drain())
+        await future
+
+    async def _drain(self) -> None:
+        while self._waiters:
+            if self._waiters[0][2].done():  # cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._try_take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    def blocked_for(self) -> float:
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    def block(self, seconds: float) -> None:
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def cancel(self) -> None:
+        if self._drainer is not None:
+            self._drainer.cancel()
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+
+class ScheduledRateLimiter(BaseRateLimiter):
+    """Schedules every outbound Bot API call through global and per-chat token buckets.
+
+    All calls share a global bucket (~30 requests/s). Calls that post into a
+    chat additionally take a token from that chat's bucket (~20/min for
+    groups, ~1/s for private chats). Moderation calls (deletes, bans,
+    restrictions) are served before replies and welcomes when the buckets
+    run dry. A 429 blocks only the affected chat (or everyone, for calls
+    without a chat) for ``retry_after`` seconds and the call is queued again.
+
+    When several processes share one bot token, pass a ``coordinator`` (see
+    :mod:`moderation_bot.core.coordination`): every call then also takes a
+    token from the shared global budget, and global 429s pause all processes.
+    Per-chat budgets stay local because each chat is handled by one process.
+    """
+
+    def __init__(
+        self,
+        overall_rate: float = 30,
+        group_rate_per_minute: float = 20,
+        private_rate: float = 1,
+        max_retries: int = 3,
+        max_idle_chats: int = 10_000,
+        coordinator=None,
+    ):
+        self.overall_rate = overall_rate
+        self.group_rate_per_minute = group_rate_per_minute
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        self.coordinator = coordinator
+
+        self._global = PriorityTokenBucket(overall_rate, overall_rate)
+        self._chats = {}
+
+        self.requests = 0
+        self.retry_after_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._global.cancel()
+        for bucket in self._chats.values():
+            bucket.cancel()
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id) -> PriorityTokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_chats:
+                self._chats = {key: b for key, b in self._chats.items() if not b.idle}
+            if isinstance(chat_id, str) or chat_id < 0:
+                # Groups, supergroups and channels (string IDs are always @channel/@supergroup)
+                bucket = PriorityTokenBucket(self.group_rate_per_minute / 60, self.group_rate_per_minute)
+            else:
+                bucket = PriorityTokenBucket(self.private_rate, self.private_rate)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        """Waits for the buckets, runs the request and requeues it after a 429.
+
+        ``rate_limit_args`` may be a dict with ``priority`` and/or ``max_retries``.
+        """
+        options = rate_limit_args or {}
+        priority = options.get("priority", _ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_DEFAULT))
+        max_retries = options.get("max_retries", self.max_retries)
+
+        chat_id = data.get("chat_id")
+        if isinstance(chat_id, str):
+            try:
+                chat_id = int(chat_id)
+            except ValueError:
+                pass
+        chat_bucket = None
+        if chat_id is not None:
+            chat_bucket = self._chat_bucket(chat_id)
+
+        self.requests += 1
+        for attempt in range(max_retries + 1):
+            started = time.monotonic()
+            if chat_bucket is not None and endpoint in _CHAT_LIMITED_ENDPOINTS:
+                await chat_bucket.acquire(priority)
+            elif chat_bucket is not None and chat_bucket.blocked_for():
+                # Not counted against the chat, but still honor a pending retry_after.
+                await asyncio.sleep(chat_bucket.blocked_for())
+            await self._global.acquire(priority)
+            if self.coordinator is not None:
+                while (wait := self.coordinator.try_acquire()) > 0:
+                    await asyncio.sleep(wait)
+            waited = time.monotonic() - started
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                api_requests.inc(endpoint, "retry_after")
+                self.retry_after_count += 1
+                retry_after = retry_after_seconds(exc)
+                if attempt == max_retries:
+                    logger.error(
+                        "Rate limit hit after maximum retries",
+                        endpoint=endpoint, chat_id=chat_id, retries=max_retries,
+                    )
+                    raise
+                (chat_bucket or self._global).block(retry_after)
+                if chat_bucket is None and self.coordinator is not None:
+                    self.coordinator.block(retry_after)
+                logger.warning(
+                    "Rate limit hit, requeueing request",
+                    endpoint=endpoint, chat_id=chat_id, retry_after=retry_after,
+                )
+            except Exception:
+                api_requests.inc(endpoint, "error")
+                raise
+            else:
+                api_requests.inc(endpoint, "ok")
+                return result
+
+    def stats(self) -> dict:
+        """Returns queue depth, wait times and 429 counters."""
+        return {
+            "requests": self.requests,
+            "retry_after": self.retry_after_count,
+            "global_queue_depth": self._global.depth,
+            "chat_queue_depth": sum(bucket.depth for bucket in self._chats.values()),
+            "tracked_chats": len(self._chats),
+            "avg_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+        }
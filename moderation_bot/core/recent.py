@@ -0,0 +1,55 @@
+from array import array
+from collections import OrderedDict
+
+DEFAULT_PER_CHAT = 2000
+DEFAULT_MAX_CHATS = 512
+
+
+class RecentMessages:
+    """Remembers who sent each of the last ``per_chat`` messages of recently active chats.
+
+    The Bot API cannot list a chat's history, so this is what lets /purge find
+    a user's recent messages. Each chat keeps two fixed-size rings of message
+    and sender IDs (16 bytes per message); the least recently active chats
+    are dropped beyond ``max_chats``.
+    """
+
+    def __init__(self, per_chat: int = DEFAULT_PER_CHAT, max_chats: int = DEFAULT_MAX_CHATS):
+        self.per_chat = per_chat
+        self.max_chats = max_chats
+        self._chats = OrderedDict()  # chat_id -> [next position, count, message id ring, sender id ring]
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def add(self, chat_id, message_id: int, sender_id: int) -> None:
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [0, 0, array("q", [0]) * self.per_chat, array("q", [0]) * self.per_chat]
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        position = entry[0]
+        entry[2][position] = message_id
+        entry[3][position] = sender_id
+        entry[0] = (position + 1) % self.per_chat
+        entry[1] = min(entry[1] + 1, self.per_chat)
+
+    def from_sender(self, chat_id, sender_id: int, limit: int) -> list:
+        """Returns up to ``limit`` of the sender's remembered message IDs in the chat, newest first."""
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            return []
+        position, count, message_ids, sender_ids = entry
+        found = []
+        for step in range(1, count + 1):
+            index = (position - step) % self.per_chat
+            if sender_ids[index] == sender_id:
+                found.append(message_ids[index])
+                if len(found) >= limit:
+                    break
+        return found
+
+
+recent_messages = RecentMessages()
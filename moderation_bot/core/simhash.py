@@ -0,0 +1,179 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+MIN_TEXT_LENGTH = 40  # shorter messages ("gm", "thanks!") repeat legitimately
+MAX_FEATURES = 256
+BANDS = 5
+MAX_DISTANCE = BANDS - 1  # a near-duplicate is guaranteed to share at least one band
+BUCKET_SIZE = 8
+
+DEFAULT_THRESHOLD = 3
+DEFAULT_WINDOW = 600.0
+DEFAULT_MAX_CLUSTERS = 20_000
+
+_NON_WORD = re.compile(r"[\W_]+")
+_NUMBERS = re.compile(r"\d+")
+_LANE = 16  # bits per column counter when summing feature hashes
+_LANE_MASK = (1 << _LANE) - 1
+# Spreads the 8 bits of a byte into 8 counter lanes
+_SPREAD = tuple(sum(((byte >> bit) & 1) << (_LANE * bit) for bit in range(8)) for byte in range(256))
+# (shift, mask) of each band; 64 bits don't split evenly into 5, the last band is narrower
+_BAND_WIDTH = -(-64 // BANDS)
+_BAND_LAYOUT = tuple(
+    (band * _BAND_WIDTH, (1 << min(_BAND_WIDTH, 64 - band * _BAND_WIDTH)) - 1) for band in range(BANDS)
+)
+
+
+def normalize(text: str) -> list:
+    """Lowercases, folds numbers and drops punctuation and emoji, so light edits hash alike."""
+    return _NON_WORD.sub(" ", _NUMBERS.sub("0", text.casefold())).split()
+
+
+@lru_cache(maxsize=16384)
+def _word_hash(word: str) -> int:
+    # Chat vocabulary repeats a lot, so most words are hashed once
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+
+
+def simhash(text: str):
+    """Returns a 64-bit SimHash of the words in ``text``, or None if it is too short to judge.
+
+    Words are hashed with BLAKE2b rather than Python's per-process randomized
+    ``hash()``, so signatures match across workers and restarts.
+    """
+    words = normalize(text)
+    if sum(len(word) for word in words) + len(words) < MIN_TEXT_LENGTH:
+        return None
+    del words[MAX_FEATURES:]
+
+    # Sum every word hash's bits column-wise in one big integer (64 lanes of 16 bits)
+    spread = _SPREAD
+    word_hash = _word_hash
+    columns = 0
+    for word in words:
+        h = word_hash(word)
+        columns += (
+            spread[h & 255]
+            | spread[(h >> 8) & 255] << 128
+            | spread[(h >> 16) & 255] << 256
+            | spread[(h >> 24) & 255] << 384
+            | spread[(h >> 32) & 255] << 512
+            | spread[(h >> 40) & 255] << 640
+            | spread[(h >> 48) & 255] << 768
+            | spread[h >> 56] << 896
+        )
+
+    half = len(words) / 2
+    signature = 0
+    for bit in range(64):
+        if ((columns >> (_LANE * bit)) & _LANE_MASK) > half:
+            signature |= 1 << bit
+    return signature
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _Cluster:
+    __slots__ = ("signature", "bands", "times", "messages", "flagged")
+
+    def __init__(self, signature: int, bands: tuple, threshold: int):
+        self.signature = signature
+        self.bands = bands
+        self.times = deque(maxlen=threshold + 1)
+        self.messages = deque(maxlen=threshold + 1)
+        self.flagged = False
+
+
+class DuplicateIndex:
+    """Bounded index of recent message fingerprints, shared by all chats.
+
+    Near-identical messages (SimHash within ``MAX_DISTANCE`` bits) are grouped
+    into clusters. Each 64-bit signature is split into ``BANDS`` bands and a
+    cluster is filed under each band, so a lookup is ``BANDS`` dict lookups
+    plus at most ``BUCKET_SIZE`` comparisons per band: constant per message.
+
+    When a cluster sees more than ``threshold`` messages within ``window``
+    seconds it is flagged, and every message of it that is still remembered
+    (and every later one) is reported for deletion. Clusters are kept in LRU
+    order and the least recently seen are dropped beyond ``max_clusters``.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, window: float = DEFAULT_WINDOW,
+                 max_clusters: int = DEFAULT_MAX_CLUSTERS, clock=time.monotonic):
+        self.threshold = threshold
+        self.window = window
+        self.max_clusters = max_clusters
+        self._clock = clock
+        self._clusters = OrderedDict()  # cluster id -> _Cluster
+        self._bands = {}  # (band number, band value) -> list of cluster ids
+        self._next_id = 0
+        self.flagged = 0
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def _find(self, signature: int, bands: tuple):
+        for band in bands:
+            for cluster_id in self._bands.get(band, ()):
+                cluster = self._clusters[cluster_id]
+                if hamming(cluster.signature, signature) <= MAX_DISTANCE:
+                    return cluster_id, cluster
+        return None, None
+
+    def _add_cluster(self, signature: int, bands: tuple):
+        cluster_id = self._next_id
+        self._next_id += 1
+        cluster = self._clusters[cluster_id] = _Cluster(signature, bands, self.threshold)
+        for band in bands:
+            bucket = self._bands.setdefault(band, [])
+            if len(bucket) >= BUCKET_SIZE:
+                bucket.pop(0)  # the oldest cluster stays findable through its other bands
+            bucket.append(cluster_id)
+        while len(self._clusters) > self.max_clusters:
+            self._remove(*self._clusters.popitem(last=False))
+        return cluster_id, cluster
+
+    def _remove(self, cluster_id, cluster) -> None:
+        for band in cluster.bands:
+            bucket = self._bands.get(band)
+            if bucket is not None and cluster_id in bucket:
+                bucket.remove(cluster_id)
+                if not bucket:
+                    del self._bands[band]
+
+    def add(self, text: str, chat_id, message_id) -> list:
+        """Records a message; returns the ``(chat_id, message_id)`` pairs to delete, if any."""
+        signature = simhash(text)
+        if signature is None:
+            return []
+        bands = tuple((band, (signature >> shift) & mask) for band, (shift, mask) in enumerate(_BAND_LAYOUT))
+        now = self._clock()
+
+        cluster_id, cluster = self._find(signature, bands)
+        if cluster is None:
+            cluster_id, cluster = self._add_cluster(signature, bands)
+        else:
+            self._clusters.move_to_end(cluster_id)
+            if cluster.times and now - cluster.times[-1] > self.window:
+                # Quiet for a whole window: start counting (and judging) afresh
+                cluster.times.clear()
+                cluster.messages.clear()
+                cluster.flagged = False
+
+        cluster.times.append(now)
+        cluster.messages.append((chat_id, message_id))
+        if cluster.flagged:
+            return [(chat_id, message_id)]
+        if len(cluster.times) > self.threshold and now - cluster.times[0] <= self.window:
+            cluster.flagged = True
+            self.flagged += 1
+            return list(cluster.messages)
+        return []
+
+
+duplicate_index = DuplicateIndex()
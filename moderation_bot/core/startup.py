@@ -0,0 +1,241 @@
+import asyncio
+import hmac
+import importlib
+import json
+import signal
+import time
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class StartupProfile:
+    """Records how long each startup phase took, measured from when this module was imported.
+
+    ``mark(phase)`` closes the current phase; ``report()`` logs the breakdown
+    (main calls it from post_init), and ``first_update()`` logs the time until
+    the first update went through all handlers.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self._last = self.started
+        self.phases = {}  # phase -> seconds, in the order they ran
+        self.first_update_at = None
+
+    def mark(self, phase: str) -> float:
+        now = self._clock()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+        return now - self.started
+
+    def elapsed(self) -> float:
+        return self._clock() - self.started
+
+    def report(self) -> None:
+        logger.info(
+            "Startup profile",
+            total_ms=round(self.elapsed() * 1000, 1),
+            **{f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+        )
+
+    async def first_update(self, update, context) -> None:
+        """Handler (last group) that logs the time to the first processed update, once."""
+        if self.first_update_at is None:
+            self.first_update_at = self.elapsed()
+            logger.info("First update processed", seconds_since_start=round(self.first_update_at, 3))
+
+
+startup_profile = StartupProfile()
+
+
+def lazy_callback(module: str, name: str):
+    """Returns a handler callback that imports ``module`` the first time it is called.
+
+    Lets the bot register every handler without importing the modules behind
+    them, so it can start answering sooner; each module costs its import
+    once, on the first update that needs it.
+    """
+    callback = None
+
+    async def stub(update, context):
+        nonlocal callback
+        if callback is None:
+            started = time.perf_counter()
+            callback = getattr(importlib.import_module(module), name)
+            logger.info("Handler module loaded", module=module, ms=round((time.perf_counter() - started) * 1000, 1))
+        return await callback(update, context)
+
+    stub.__name__ = stub.__qualname__ = name
+    stub.__module__ = module
+    return stub
+
+
+def load_callback(module: str, name: str, lazy: bool = False):
+    """Resolves a handler callback now, or returns a :func:`lazy_callback` stub for it."""
+    if lazy:
+        return lazy_callback(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+async def ensure_webhook(bot, webhook_url: str, allowed_updates=None, secret_token: str = None) -> bool:
+    """Registers the webhook unless Telegram already has exactly this one; returns True if it was set.
+
+    Telegram does not report the secret token, so with one configured the webhook is always set.
+    """
+    if not secret_token:
+        info = await bot.get_webhook_info()
+        wanted = sorted(allowed_updates) if allowed_updates is not None else None
+        current = sorted(info.allowed_updates) if info.allowed_updates else None
+        if info.url == webhook_url and (wanted is None or current == wanted):
+            return False
+    await bot.set_webhook(webhook_url, allowed_updates=allowed_updates, secret_token=secret_token)
+    return True
+
+
+async def check_webhook(bot, webhook_url: str, allowed_updates=None, secret_token: str = None) -> None:
+    """Runs :func:`ensure_webhook` and logs the outcome instead of raising; meant to run in the background."""
+    started = time.perf_counter()
+    try:
+        changed = await ensure_webhook(bot, webhook_url, allowed_updates, secret_token)
+        logger.info("Webhook checked", changed=changed, ms=round((time.perf_counter() - started) * 1000, 1))
+    except Exception as e:
+        logger.error("Failed to register the webhook", error=e)
+
+
+async def wait_for_stop_signal() -> None:
+    """Returns once the process gets SIGINT or SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+
+
+async def run_application(application, serve) -> None:
+    """Runs ``application`` around ``await serve()`` with the lifecycle ``run_webhook`` uses.
+
+    ``initialize()``, post_init and ``start()`` come first; once ``serve()``
+    returns or raises, ``stop()``, post_stop, ``shutdown()`` and post_shutdown
+    follow. ``serve`` feeds the application updates and should stop taking
+    new ones before it returns.
+    """
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await serve()
+    finally:
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+class WebhookEndpoint:
+    """What every webhook server of the bot shares: the secret token check and the tornado app.
+
+    Subclasses implement ``dispatch(body)``, which takes a request body that
+    passed the check and returns the HTTP status to answer with. The app also
+    serves the metrics registry on ``GET /metrics``, so hosts that expose a
+    single port (Render only routes PORT) can still be scraped.
+    """
+
+    def __init__(self, secret_token: str = None):
+        self.secret_token = secret_token
+
+    def check_secret(self, header_value) -> bool:
+        if not self.secret_token:
+            return True
+        return header_value is not None and hmac.compare_digest(header_value, self.secret_token)
+
+    def dispatch(self, body: bytes) -> int:
+        raise NotImplementedError
+
+    def make_app(self, url_path: str):
+        from tornado.web import Application, RequestHandler
+
+        endpoint = self
+
+        class WebhookHandler(RequestHandler):
+            def post(self):
+                if not endpoint.check_secret(self.request.headers.get(SECRET_HEADER)):
+                    self.set_status(403)
+                    return
+                self.set_status(endpoint.dispatch(self.request.body))
+
+        class MetricsHandler(RequestHandler):
+            def get(self):
+                from moderation_bot.core.metrics import registry
+
+                self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.write(registry.render())
+
+        return Application([(rf"/{url_path}/?", WebhookHandler), (r"/metrics", MetricsHandler)])
+
+
+class EarlyWebhook(WebhookEndpoint):
+    """Accepts webhook updates before the application has finished starting.
+
+    Updates are parsed and put on ``application.update_queue`` as soon as the
+    HTTP server listens; the application drains the queue once it started.
+    """
+
+    loads = staticmethod(json.loads)
+
+    def __init__(self, application, secret_token: str = None):
+        super().__init__(secret_token)
+        self.application = application
+        self.received = 0
+
+    def dispatch(self, body: bytes) -> int:
+        """Queues one webhook body and returns the HTTP status to answer with."""
+        from telegram import Update
+
+        try:
+            update = Update.de_json(self.loads(body), self.application.bot)
+        except Exception as e:
+            logger.error("Dropping malformed update", error=e)
+            return 400
+        self.application.update_queue.put_nowait(update)
+        self.received += 1
+        return 200
+
+
+async def serve_fast_webhook(application, listen: str, port: int, url_path: str, webhook_url: str,
+                             allowed_updates=None, secret_token: str = None) -> None:
+    """Runs the application behind a webhook, listening before anything else is set up.
+
+    Unlike ``run_webhook``, the HTTP server is up before ``initialize()`` (which
+    calls getMe and loads persistence), and the webhook is only (re)registered
+    afterwards, in the background, if Telegram does not already have it. This
+    is the order that matters after a cold start, when the update that woke
+    the service is waiting for an answer.
+    """
+    webhook = EarlyWebhook(application, secret_token)
+    server = webhook.make_app(url_path).listen(port, address=listen)
+    startup_profile.mark("listen")
+
+    async def serve() -> None:
+        registration = application.create_task(
+            check_webhook(application.bot, webhook_url, allowed_updates, secret_token)
+        )
+        try:
+            await wait_for_stop_signal()
+        finally:
+            server.stop()
+            registration.cancel()
+
+    await run_application(application, serve)
@@ -0,0 +1,271 @@
+import re
+import time
+
+import regex
+import structlog
+
+from .matcher import AhoCorasick
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+logger = structlog.get_logger(__name__)
+
+# Trigger kinds, written as "<kind>:<pattern>" in /filter; a bare trigger is a substring
+SUBSTRING = "substring"
+WORD = "word"
+PREFIX = "prefix"
+REGEX = "re"
+GLOB = "glob"
+TRIGGER_KINDS = (WORD, PREFIX, REGEX, GLOB)
+
+MAX_PATTERN_LENGTH = 200
+MAX_REGEX_INPUT = 1024  # regex triggers only look at the start of long messages
+REGEX_TIMEOUT = 0.02  # hard limit for one search, enforced by the regex engine
+SLOW_REGEX_STRIKES = 3
+REGEX_COOLDOWN = 600.0
+# Characters repeated over a whole message when probing a new pattern for slowness
+_PROBE_CHARACTERS = "a0 .-"
+
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+_UNBOUNDED = sre_constants.MAXREPEAT
+
+
+class TriggerError(ValueError):
+    """Raised for a trigger that cannot be used, with a message meant for the admin."""
+
+
+def parse_trigger(trigger: str):
+    """Splits a stored trigger into ``(kind, pattern)``."""
+    kind, separator, pattern = trigger.partition(":")
+    if separator and kind in TRIGGER_KINDS and pattern:
+        return kind, pattern
+    return SUBSTRING, trigger
+
+
+def normalize_trigger(trigger: str) -> str:
+    """Returns the form a trigger is stored in: lowercase, except for regex patterns."""
+    kind, pattern = parse_trigger(trigger)
+    if kind == SUBSTRING:
+        return trigger.lower()
+    if kind == REGEX:
+        return f"{kind}:{pattern}"
+    return f"{kind}:{pattern.lower()}"
+
+
+def _check_complexity(items, inside_repeat: bool = False) -> None:
+    for op, value in items:
+        if op == sre_constants.GROUPREF or op == sre_constants.GROUPREF_EXISTS:
+            raise TriggerError("Backreferences are not allowed in regex triggers.")
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_complexity(value[1], inside_repeat)
+        elif op in _REPEATS:
+            low, high, body = value
+            repeats = high == _UNBOUNDED or high > 1
+            if repeats and inside_repeat:
+                raise TriggerError("Nested repetition like (a+)+ is not allowed in regex triggers.")
+            _check_complexity(body, inside_repeat or repeats)
+        elif op == sre_constants.SUBPATTERN:
+            _check_complexity(value[-1], inside_repeat)
+        elif op == sre_constants.BRANCH:
+            for branch in value[1]:
+                _check_complexity(branch, inside_repeat)
+
+
+def compile_regex(pattern: str):
+    """Compiles a regex trigger after rejecting patterns that can backtrack catastrophically.
+
+    Patterns are checked with the standard library's parser and compiled with
+    the ``regex`` module, whose searches accept a timeout.
+    """
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise TriggerError(f"Regex triggers are limited to {MAX_PATTERN_LENGTH} characters.")
+    if "(?P<" in pattern or "(?P=" in pattern:
+        raise TriggerError("Named groups are not allowed in regex triggers.")
+    try:
+        parsed = sre_parse.parse(pattern)
+        if parsed.state.flags & ~sre_constants.SRE_FLAG_UNICODE:
+            # They would end up in the middle of the combined pattern, where they are an error
+            raise TriggerError(
+                "Inline flags like (?i) are not allowed in regex triggers (they already ignore case); "
+                "use a scoped group like (?s:...) instead."
+            )
+        _check_complexity(parsed)
+        return regex.compile(pattern, regex.IGNORECASE | regex.V0)
+    except (re.error, regex.error) as e:
+        raise TriggerError(f"Invalid regex: {e}") from e
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translates a glob trigger (``*`` any run of characters, ``?`` one character) to a regex."""
+    parts = []
+    for char in pattern:
+        if char == "*":
+            if not parts or parts[-1] != ".*?":
+                parts.append(".*?")
+        elif char == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return "".join(parts)
+
+
+def _pattern_source(kind: str, pattern: str) -> str:
+    if kind == REGEX:
+        return compile_regex(pattern).pattern
+    return glob_to_regex(pattern.lower())
+
+
+def combine_patterns(sources):
+    """Compiles ``sources`` into the one alternation a :class:`FilterEngine` searches (group ``t<i>``
+    matches ``sources[i]``), or returns None if there are none."""
+    if not sources:
+        return None
+    return regex.compile(
+        "|".join(f"(?P<t{index}>{source})" for index, source in enumerate(sources)),
+        regex.IGNORECASE | regex.V0,
+    )
+
+
+def _probe(combined, pattern: str) -> None:
+    """Raises :class:`TriggerError` if ``combined`` hits the timeout on long runs of one character."""
+    mentioned = [char for char in dict.fromkeys(pattern.lower()) if char.isalnum()]
+    for char in dict.fromkeys(mentioned[:6] + list(_PROBE_CHARACTERS)):
+        try:
+            combined.search(char * MAX_REGEX_INPUT + "\x00", 0, MAX_REGEX_INPUT + 1, timeout=REGEX_TIMEOUT)
+        except TimeoutError:
+            raise TriggerError("This pattern is too slow to match against long messages.") from None
+
+
+def validate_trigger(trigger: str, existing=()) -> None:
+    """Raises :class:`TriggerError` if ``trigger`` cannot be used alongside the chat's ``existing`` triggers.
+
+    Regex and glob triggers are compiled together with the chat's other ones
+    into the alternation the chat will search, which is then timed against
+    long runs of the characters the pattern mentions: what can break or stall
+    the combined pattern is never stored.
+    """
+    kind, pattern = parse_trigger(trigger)
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise TriggerError(f"Triggers are limited to {MAX_PATTERN_LENGTH} characters.")
+    if kind not in (REGEX, GLOB):
+        return
+    sources = [_pattern_source(kind, pattern)]
+    for other in existing:
+        other_kind, other_pattern = parse_trigger(other)
+        if other_kind in (REGEX, GLOB) and other != trigger:
+            try:
+                sources.append(_pattern_source(other_kind, other_pattern))
+            except TriggerError:
+                continue  # stored before it was rejected; FilterEngine skips it too
+    try:
+        combined = combine_patterns(sources)
+    except regex.error as e:
+        raise TriggerError(f"Invalid regex: {e}") from e
+    _probe(combined, pattern)
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class FilterEngine:
+    """Matches a chat's typed triggers against a message in (at most) two passes.
+
+    Substring, whole-word and word-prefix triggers share one Aho-Corasick
+    automaton; boundaries are checked only where a pattern occurs. Regex and
+    glob triggers are combined into a single alternation. The earliest match
+    in the message wins, then the longest.
+
+    Regex and glob triggers are checked for catastrophic backtracking when
+    added, and only see the first ``MAX_REGEX_INPUT`` characters. Each search
+    is stopped by the regex engine after ``REGEX_TIMEOUT`` seconds and counts
+    as no match; after ``SLOW_REGEX_STRIKES`` timeouts in a row the regex
+    triggers are switched off for this chat for ``REGEX_COOLDOWN`` seconds.
+    """
+
+    def __init__(self, triggers, chat_id=None, clock=time.monotonic):
+        self.chat_id = chat_id
+        self._clock = clock
+        self._literal_kinds = {}  # lowercased pattern -> tuple of (kind, trigger)
+        regex_sources = []
+        self._regex_triggers = {}  # group name -> trigger
+        for trigger in sorted(triggers):
+            kind, pattern = parse_trigger(trigger)
+            if kind in (SUBSTRING, WORD, PREFIX):
+                key = pattern.lower()
+                self._literal_kinds[key] = self._literal_kinds.get(key, ()) + ((kind, trigger),)
+                continue
+            try:
+                source = _pattern_source(kind, pattern)
+            except TriggerError as e:
+                logger.warning("Skipping unusable filter trigger", chat_id=chat_id, trigger=trigger, error=str(e))
+                continue
+            self._regex_triggers[f"t{len(regex_sources)}"] = trigger
+            regex_sources.append(source)
+
+        self._automaton = AhoCorasick(self._literal_kinds)
+        self._max_literal = max((len(pattern) for pattern in self._literal_kinds), default=0)
+        try:
+            self._regex = combine_patterns(regex_sources)
+        except regex.error as e:
+            # Only triggers stored before validation compiled the combination can get here
+            logger.error("Regex filters unusable for this chat", chat_id=chat_id, error=str(e))
+            self._regex = None
+            self._regex_triggers = {}
+        self._strikes = 0
+        self._regex_disabled_until = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(kinds) for kinds in self._literal_kinds.values()) + len(self._regex_triggers)
+
+    @property
+    def regex_enabled(self) -> bool:
+        return self._regex is not None and self._clock() >= self._regex_disabled_until
+
+    def _find_literal(self, text: str):
+        lowered = text.lower()
+        best = None  # (start, -length, trigger)
+        for start, pattern in self._automaton.iter_matches(lowered):
+            end = start + len(pattern)
+            if best is not None and end - self._max_literal > best[0]:
+                break  # every later match starts after the best one
+            for kind, trigger in self._literal_kinds[pattern]:
+                if kind != SUBSTRING:
+                    if start > 0 and _is_word_char(lowered[start - 1]):
+                        continue
+                    if kind == WORD and end < len(lowered) and _is_word_char(lowered[end]):
+                        continue
+                candidate = (start, -len(pattern), trigger)
+                if best is None or candidate < best:
+                    best = candidate
+        return best
+
+    def _find_regex(self, text: str):
+        if not self.regex_enabled:
+            return None
+        try:
+            match = self._regex.search(text, 0, MAX_REGEX_INPUT, timeout=REGEX_TIMEOUT)
+        except TimeoutError:
+            self._strikes += 1
+            logger.warning("Regex filters timed out", chat_id=self.chat_id, strikes=self._strikes)
+            if self._strikes >= SLOW_REGEX_STRIKES:
+                self._regex_disabled_until = self._clock() + REGEX_COOLDOWN
+                self._strikes = 0
+                logger.error("Regex filters disabled for this chat", chat_id=self.chat_id, cooldown=REGEX_COOLDOWN)
+            return None
+        self._strikes = 0
+        if match is None:
+            return None
+        return match.start(), -(match.end() - match.start()), self._regex_triggers[match.lastgroup]
+
+    def find_first(self, text: str):
+        """Returns the trigger that matches earliest in ``text`` (longest on ties), or None."""
+        candidates = [c for c in (self._find_literal(text), self._find_regex(text)) if c is not None]
+        if not candidates:
+            return None
+        return min(candidates)[2]
@@ -0,0 +1,152 @@
+import asyncio
+from string import Formatter
+
+import structlog
+from telegram.constants import MessageLimit
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_WINDOW = 2.0
+MAX_MESSAGE_LENGTH = MessageLimit.MAX_TEXT_LENGTH  # 4096
+PLACEHOLDER = "username"
+MENTION_SEPARATOR = ", "
+
+
+class WelcomeTemplate:
+    """A welcome message split once around its ``{username}`` placeholders.
+
+    Rendering is a join of precomputed literal parts, so nothing is parsed
+    per join. Other ``{fields}`` are kept as written and ``{{``/``}}``
+    escape braces, as with ``str.format``.
+    """
+
+    __slots__ = ("source", "_parts", "_literal_length", "_placeholders")
+
+    def __init__(self, source: str):
+        self.source = source
+        parts = []  # literal strings, with None wherever the mentions go
+        literal = []
+        try:
+            parsed = list(Formatter().parse(source))
+        except ValueError:
+            # Unbalanced braces: str.format would have failed, send the text as written
+            parsed = [(source, None, None, None)]
+        for text, field, spec, conversion in parsed:
+            literal.append(text)
+            if field is None:
+                continue
+            if field == PLACEHOLDER:
+                parts.append("".join(literal))
+                parts.append(None)
+                literal = []
+            else:
+                suffix = (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "")
+                literal.append("{" + field + suffix + "}")
+        parts.append("".join(literal))
+        self._parts = tuple(part for part in parts if part != "")
+        self._placeholders = sum(1 for part in self._parts if part is None)
+        self._literal_length = sum(len(part) for part in self._parts if part is not None)
+
+    def render(self, mentions: str) -> str:
+        return "".join(mentions if part is None else part for part in self._parts)
+
+    def rendered_length(self, mentions_length: int) -> int:
+        return self._literal_length + self._placeholders * mentions_length
+
+
+# Compiled custom templates per chat: chat_id -> WelcomeTemplate
+_templates = {}
+
+
+def compile_welcome(chat_id, source: str) -> WelcomeTemplate:
+    """Compiles and caches a chat's custom welcome message (called from /setwelcome)."""
+    template = _templates[chat_id] = WelcomeTemplate(source)
+    return template
+
+
+def template_for(chat_id, chat_data: dict, default: WelcomeTemplate) -> WelcomeTemplate:
+    """Returns the chat's compiled welcome template, or ``default`` if none is set."""
+    source = chat_data.get('welcome_message')
+    if not source:
+        return default
+    template = _templates.get(chat_id)
+    # chat_data may have been loaded from persistence without going through /setwelcome
+    if template is None or template.source != source:
+        template = compile_welcome(chat_id, source)
+    return template
+
+
+def pack_mentions(template: WelcomeTemplate, mentions: list, limit: int = MAX_MESSAGE_LENGTH) -> list:
+    """Renders ``mentions`` into as few messages of at most ``limit`` characters as possible."""
+    messages = []
+    batch = []
+    batch_length = 0
+    for mention in mentions:
+        added = len(mention) + (len(MENTION_SEPARATOR) if batch else 0)
+        if batch and template.rendered_length(batch_length + added) > limit:
+            messages.append(template.render(MENTION_SEPARATOR.join(batch)))
+            batch, batch_length, added = [], 0, len(mention)
+        batch.append(mention)
+        batch_length += added
+    if batch:
+        messages.append(template.render(MENTION_SEPARATOR.join(batch)))
+    return messages
+
+
+class JoinCoalescer:
+    """Collects joins per chat for ``window`` seconds and greets them in one message.
+
+    The first join in a quiet chat starts the window; everyone who joins
+    before it closes is mentioned in the same welcome. Long lists are split
+    so every message stays within Telegram's length limit.
+    """
+
+    def __init__(self, window: float = DEFAULT_WINDOW):
+        self.window = window
+        self._pending = {}  # chat_id -> (chat, template, list of mentions)
+        self._timers = {}  # chat_id -> asyncio.TimerHandle
+        self._tasks = set()
+        self.joins = 0
+        self.messages = 0
+
+    def add(self, chat, template: WelcomeTemplate, mention: str) -> None:
+        """Queues a welcome for one new member of ``chat``."""
+        _, _, mentions = self._pending.get(chat.id, (None, None, []))
+        mentions.append(mention)
+        # The latest template wins, in case /setwelcome ran during the window
+        self._pending[chat.id] = (chat, template, mentions)
+        self.joins += 1
+        if chat.id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[chat.id] = loop.call_later(self.window, self._start_flush, chat.id)
+
+    def _start_flush(self, chat_id) -> None:
+        task = asyncio.get_running_loop().create_task(self.flush(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, chat_id) -> None:
+        """Sends the welcome for everyone waiting in a chat."""
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(chat_id, None)
+        if pending is None:
+            return
+
+        chat, template, mentions = pending
+        for text in pack_mentions(template, mentions):
+            try:
+                await chat.send_message(text, parse_mode='HTML')
+                self.messages += 1
+            except Exception as e:
+                logger.error("Failed to send welcome message", chat_id=chat_id, error=e)
+        logger.info("Welcomed new members", chat_id=chat_id, count=len(mentions))
+
+    async def flush_all(self) -> None:
+        await asyncio.gather(*(self.flush(chat_id) for chat_id in list(self._pending)))
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+welcome_batcher = JoinCoalescer()
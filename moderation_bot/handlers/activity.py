@@ -1,45 +1,71 @@
+import asyncio
 import structlog
 from telegram import Update
 from telegram.ext import CallbackContext
+from telegram.helpers import mention_html
+
+from moderation_bot.core.counters import ActivityCounter
+from moderation_bot.core.names import name_cache
 
 logger = structlog.get_logger(__name__)
 
+def get_activity_counter(chat_data: dict) -> ActivityCounter:
+    """Returns the chat's activity counter, upgrading a legacy ``{user_id: count}`` dict."""
+    counter = chat_data.get('user_activity')
+    if not isinstance(counter, ActivityCounter):
+        counter = ActivityCounter(counter)
+        chat_data['user_activity'] = counter
+    return counter
+
 async def track_activity(update: Update, context: CallbackContext) -> None:
     """Tracks user activity by counting messages."""
-    user_id = update.effective_user.id
-    if 'user_activity' not in context.chat_data:
-        context.chat_data['user_activity'] = {}
-    
-    context.chat_data['user_activity'][user_id] = context.chat_data['user_activity'].get(user_id, 0) + 1
-    logger.debug("Tracked activity", user_id=user_id, chat_id=update.effective_chat.id)
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    get_activity_counter(context.chat_data).increment(user.id)
+    name_cache.remember(chat_id, user.id, user.full_name)
+    logger.debug("Tracked activity", user_id=user.id, chat_id=chat_id)
+
+async def _fetch_mention(context: CallbackContext, chat_id, user_id):
+    """Looks up a user's mention through the API, or returns None if they can't be found."""
+    try:
+        member = await context.bot.get_chat_member(chat_id, user_id)
+    except Exception:
+        # This can happen if the user has left the chat
+        logger.warning("Could not find user for top list", user_id=user_id, chat_id=chat_id)
+        return None
+    name_cache.remember(chat_id, user_id, member.user.full_name)
+    return member.user.mention_html()
 
 async def top_command(update: Update, context: CallbackContext) -> None:
     """Displays the top N most active users in the chat."""
     chat_id = update.effective_chat.id
-    if 'user_activity' not in context.chat_data or not context.chat_data['user_activity']:
+    counter = get_activity_counter(context.chat_data)
+    if not counter:
         await update.message.reply_text("No activity has been recorded in this chat yet.")
         return
 
-    # Sort users by message count in descending order
-    sorted_activity = sorted(
-        context.chat_data['user_activity'].items(),
-        key=lambda item: item[1],
-        reverse=True
-    )
+    # Show the top 5 users (or fewer), highest message count first
+    top_users = counter.top(5)
 
-    # Determine how many top users to show (e.g., top 5 or less)
-    top_n = min(len(sorted_activity), 5)
-    top_users = sorted_activity[:top_n]
+    # Names of recently active users are usually cached; look up the rest concurrently
+    mentions = {}
+    missing = []
+    for user_id, _ in top_users:
+        name = name_cache.get(chat_id, user_id)
+        if name is None:
+            missing.append(user_id)
+        else:
+            mentions[user_id] = mention_html(user_id, name)
+    if missing:
+        fetched = await asyncio.gather(*(_fetch_mention(context, chat_id, user_id) for user_id in missing))
+        mentions.update(zip(missing, fetched))
 
     message = "<b>🏆 Top Active Users 🏆</b>\n\n"
     for i, (user_id, count) in enumerate(top_users):
-        try:
-            member = await context.bot.get_chat_member(chat_id, user_id)
-            user_name = member.user.mention_html()
+        user_name = mentions[user_id]
+        if user_name is not None:
             message += f"{i + 1}. {user_name} - {count} messages\n"
-        except Exception:
-            # This can happen if the user has left the chat
+        else:
             message += f"{i + 1}. User ID {user_id} - {count} messages (user not found)\n"
-            logger.warning("Could not find user for top list", user_id=user_id, chat_id=chat_id)
-            
+
     await update.message.reply_html(message)
@@ -2,10 +2,32 @@ import structlog
 from telegram import Update
 from telegram.ext import CallbackContext
 from telegram.constants import ChatAction
+from moderation_bot.core.triggers import FilterEngine, TriggerError, normalize_trigger, validate_trigger
 from .moderation import _is_user_admin # Assuming _is_user_admin is in moderation.py
 
 logger = structlog.get_logger(__name__)
 
+# Compiled trigger engines per chat: chat_id -> (filters dict, trigger count, engine)
+_matchers = {}
+
+def _get_matcher(chat_id, filters_data: dict) -> FilterEngine:
+    """Returns the chat's compiled matcher, (re)building it if the filter set changed."""
+    cached = _matchers.get(chat_id)
+    if cached is not None:
+        source, size, matcher = cached
+        # chat_data may have been replaced (e.g. loaded from persistence) without going
+        # through the filter commands, so double-check we are looking at the same set.
+        if source is filters_data and size == len(filters_data):
+            return matcher
+
+    matcher = FilterEngine(filters_data, chat_id=chat_id)
+    _matchers[chat_id] = (filters_data, len(filters_data), matcher)
+    logger.debug("Filter matcher compiled", chat_id=chat_id, triggers=len(matcher))
+    return matcher
+
+def _invalidate_matcher(chat_id) -> None:
+    _matchers.pop(chat_id, None)
+
 async def add_filter(update: Update, context: CallbackContext) -> None:
     """Adds a new filter to the chat."""
     chat_id = update.effective_chat.id
@@ -14,16 +36,26 @@ async def add_filter(update: Update, context: CallbackContext) -> None:
         return
 
     if not context.args or len(context.args) < 2:
-        await update.message.reply_text("Usage: /filter <trigger> <reply>")
+        await update.message.reply_text(
+            "Usage: /filter <trigger> <reply>\n"
+            "Triggers match anywhere in a message, or use word:<word>, prefix:<start of a word>, "
+            "glob:<pattern with * and ?> or re:<regex>."
+        )
         return
 
-    trigger = context.args[0].lower()
+    trigger = normalize_trigger(context.args[0])
     reply = " ".join(context.args[1:])
+    try:
+        validate_trigger(trigger, context.chat_data.get('filters', {}))
+    except TriggerError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
 
     if 'filters' not in context.chat_data:
         context.chat_data['filters'] = {}
 
     context.chat_data['filters'][trigger] = reply
+    _invalidate_matcher(chat_id)
     await update.message.reply_text(f"✅ Filter '{trigger}' added.")
     logger.info("Filter added", chat_id=chat_id, trigger=trigger)
 
@@ -54,11 +86,12 @@ async def stop_filter(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("Usage: /stop <trigger>")
         return
 
-    trigger = context.args[0].lower()
+    trigger = normalize_trigger(context.args[0])
     filters_data = context.chat_data.get('filters', {})
 
     if trigger in filters_data:
         del filters_data[trigger]
+        _invalidate_matcher(chat_id)
         await update.message.reply_text(f"✅ Filter '{trigger}' stopped.")
         logger.info("Filter stopped", chat_id=chat_id, trigger=trigger)
     else:
@@ -73,6 +106,7 @@ async def stop_all_filters(update: Update, context: CallbackContext) -> None:
 
     if 'filters' in context.chat_data:
         del context.chat_data['filters']
+        _invalidate_matcher(chat_id)
         await update.message.reply_text("✅ All filters stopped for this chat.")
         logger.info("All filters stopped", chat_id=chat_id)
     else:
@@ -83,13 +117,23 @@ async def apply_filters(update: Update, context: CallbackContext) -> None:
     if not update.message or not update.message.text:
         return
 
+    filters_data = context.chat_data.get('filters')
+    if not filters_data:
+        return
+
     chat_id = update.effective_chat.id
-    message_text = update.message.text.lower()
-    filters_data = context.chat_data.get('filters', {})
+    message_text = update.message.text
+
+    # Only one filter is applied per message: the trigger that matches earliest in the
+    # text, preferring the longest match when several start at the same position.
+    trigger = _get_matcher(chat_id, filters_data).find_first(message_text)
+    if trigger is not None and trigger not in filters_data:
+        # The set was edited behind our back; recompile and try again.
+        _invalidate_matcher(chat_id)
+        trigger = _get_matcher(chat_id, filters_data).find_first(message_text)
+    if trigger is None:
+        return
 
-    for trigger, reply in filters_data.items():
-        if trigger in message_text:
-            await update.effective_chat.send_action(ChatAction.TYPING)
-            await update.message.reply_text(reply)
-            logger.info("Filter applied", chat_id=chat_id, trigger=trigger)
-            return # Only apply one filter per message
+    await update.effective_chat.send_action(ChatAction.TYPING)
+    await update.message.reply_text(filters_data[trigger])
+    logger.info("Filter applied", chat_id=chat_id, trigger=trigger)
@@ -2,9 +2,17 @@ from telegram import Update
 from telegram.ext import CallbackContext
 from telegram.constants import ChatMemberStatus
 import structlog
+from moderation_bot.core.welcome import WelcomeTemplate, template_for, welcome_batcher
 
 logger = structlog.get_logger(__name__)
 
+# Default welcome message (adapted from Node.js bot)
+DEFAULT_WELCOME = WelcomeTemplate(
+    "Yoh-koh-so, {username}! ☠️\n\n"
+    "Cult’s runes have spoken, the spirits nods rituals initiated\n\n"
+    "Prove your devotion… the Cult watches. 👁️"
+)
+
 def _extract_status_change(chat_member_update):
     """Takes a ChatMemberUpdated instance and extracts whether the user was added
     and if they are a new member."""
@@ -28,18 +36,8 @@ async def welcome_new_member(update: Update, context: CallbackContext) -> None:
 
     if not was_member and is_member:
         new_member = update.chat_member.new_chat_member.user
-        
-        custom_welcome_message = context.chat_data.get('welcome_message')
-        if custom_welcome_message:
-            # Replace placeholder if present
-            welcome_text = custom_welcome_message.format(username=new_member.mention_html())
-        else:
-            # Default welcome message (adapted from Node.js bot)
-            welcome_text = (
-                f"Yoh-koh-so, {new_member.mention_html()}! ☠️\n\n"
-                "Cult’s runes have spoken, the spirits nods rituals initiated\n\n"
-                "Prove your devotion… the Cult watches. 👁️"
-            )
-            
-        await update.effective_chat.send_message(welcome_text, parse_mode='HTML')
-        logger.info("Welcomed new member", user_id=new_member.id, chat_id=update.effective_chat.id)
+        chat = update.effective_chat
+        template = template_for(chat.id, context.chat_data, DEFAULT_WELCOME)
+        # Joins are collected for a moment so a wave of them gets a single welcome
+        welcome_batcher.add(chat, template, new_member.mention_html())
+        logger.info("Queued welcome for new member", user_id=new_member.id, chat_id=chat.id)
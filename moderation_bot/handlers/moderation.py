@@ -1,10 +1,26 @@
 import os
-from telegram import Update
+import time
+from telegram import ChatPermissions, Update
 from telegram.ext import CallbackContext
+from telegram.constants import ChatMemberStatus
 import structlog
 
+from moderation_bot.core.admin_cache import admin_cache
+from moderation_bot.core.broadcast import TAGS_KEY, broadcaster, is_audience
+from moderation_bot.core.deletion import deletion_batcher
+from moderation_bot.core.expiry import (
+    MIN_DURATION, UNBAN, UNMUTE, expiry_scheduler, format_duration, parse_duration, telegram_until_date,
+)
+from moderation_bot.core.ledger import BAN, MUTE, get_warning_ledger
+from moderation_bot.core.recent import recent_messages
+from moderation_bot.core.welcome import compile_welcome
+
 logger = structlog.get_logger(__name__)
 
+_ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+MAX_PURGE = 10_000
+PURGE_PROGRESS_INTERVAL = 2.0  # seconds between progress edits
+
 async def _is_user_admin(update: Update, context: CallbackContext) -> bool:
     """Helper function to check if the user is a chat admin or a bot admin."""
     ADMIN_USER_IDS = [int(i) for i in os.getenv("ADMIN_USER_IDS", "").split(',') if i]
@@ -12,11 +28,29 @@ async def _is_user_admin(update: Update, context: CallbackContext) -> bool:
     if user_id in ADMIN_USER_IDS:
         return True
     
-    chat_admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-    return user_id in [admin.user.id for admin in chat_admins]
+    admin_ids = await admin_cache.get_admin_ids(context.bot, update.effective_chat.id)
+    return user_id in admin_ids
+
+async def track_admin_changes(update: Update, context: CallbackContext) -> None:
+    """Invalidates the cached admin list of a chat when someone is promoted or demoted."""
+    member_update = update.chat_member or update.my_chat_member
+    if member_update is None:
+        return
+
+    old_status = member_update.old_chat_member.status
+    new_status = member_update.new_chat_member.status
+    if (old_status in _ADMIN_STATUSES) != (new_status in _ADMIN_STATUSES):
+        admin_cache.invalidate(member_update.chat.id)
+        logger.info(
+            "Admin list changed",
+            chat_id=member_update.chat.id,
+            user_id=member_update.new_chat_member.user.id,
+            old_status=old_status,
+            new_status=new_status,
+        )
 
 async def warn_user(update: Update, context: CallbackContext) -> None:
-    """Warns a user. Must be a reply to the user's message."""
+    """Warns a user and escalates once they reach the chat's warning limit. Must be a reply."""
     # 1. Check if the command user is an admin
     if not await _is_user_admin(update, context):
         await update.message.reply_text("This command can only be used by admins.")
@@ -31,13 +65,134 @@ async def warn_user(update: Update, context: CallbackContext) -> None:
     warned_user = update.message.reply_to_message.from_user
     reason = " ".join(context.args) if context.args else "No reason specified."
 
-    # 4. Send the warning message
+    # 4. Record the warning; the ledger answers the count without scanning history
+    ledger = get_warning_ledger(context.chat_data)
+    count = ledger.add(warned_user.id, update.effective_user.id, reason)
+
+    # 5. Send the warning message
     warning_message = (
-        f"⚠️ {warned_user.mention_html()} has been warned.\n"
+        f"⚠️ {warned_user.mention_html()} has been warned ({count}/{ledger.limit}).\n"
         f"<b>Reason:</b> {reason}"
     )
     await update.message.reply_html(warning_message)
-    logger.info("User warned", admin=update.effective_user.id, warned_user=warned_user.id, reason=reason)
+    logger.info("User warned", admin=update.effective_user.id, warned_user=warned_user.id, reason=reason, count=count)
+
+    if count >= ledger.limit:
+        await _escalate(update, context, ledger, warned_user)
+
+async def _escalate(update: Update, context: CallbackContext, ledger, user) -> None:
+    """Applies the chat's warning policy to a user who reached the limit, then clears their warnings."""
+    chat_id = update.effective_chat.id
+    seconds = ledger.duration
+    try:
+        until_date = None
+        if ledger.action == MUTE:
+            if seconds:
+                until_date = telegram_until_date(expiry_scheduler.schedule(chat_id, user.id, UNMUTE, seconds))
+            await context.bot.restrict_chat_member(
+                chat_id, user.id, permissions=ChatPermissions.no_permissions(), until_date=until_date
+            )
+            verb = "muted"
+        else:
+            if seconds:
+                until_date = telegram_until_date(expiry_scheduler.schedule(chat_id, user.id, UNBAN, seconds))
+            await context.bot.ban_chat_member(chat_id, user.id, until_date=until_date)
+            verb = "banned"
+        if not seconds:
+            # Permanent: an expiry left by an earlier /tmute or /tban must not lift it
+            expiry_scheduler.cancel(chat_id, user.id, UNMUTE if ledger.action == MUTE else UNBAN)
+    except Exception as e:
+        if seconds:
+            expiry_scheduler.cancel(chat_id, user.id, UNMUTE if ledger.action == MUTE else UNBAN)
+        logger.error("Failed to apply warning limit", error=e)
+        await update.message.reply_text(f"Warning limit reached, but the {ledger.action} failed. Reason: {e}")
+        return
+
+    ledger.reset(user.id)
+    period = f"for {format_duration(seconds)}" if seconds else "permanently"
+    await update.message.reply_html(
+        f"{'🔇' if ledger.action == MUTE else '🚫'} {user.mention_html()} reached {ledger.limit} warnings "
+        f"and has been {verb} {period}."
+    )
+    logger.info("Warning limit reached", chat_id=chat_id, user_id=user.id, action=ledger.action, seconds=seconds)
+
+def _warned_user_id(update: Update, context: CallbackContext):
+    """The user a /warns or /resetwarns call is about: the replied-to user, or a user ID argument."""
+    if update.message.reply_to_message:
+        return update.message.reply_to_message.from_user.id
+    if context.args and context.args[0].isdigit():
+        return int(context.args[0])
+    return None
+
+async def list_warnings(update: Update, context: CallbackContext) -> None:
+    """Lists a user's active warnings. Reply to them or pass their user ID."""
+    user_id = _warned_user_id(update, context)
+    if user_id is None:
+        await update.message.reply_text("Reply to a user's message or use /warns <user_id>.")
+        return
+
+    ledger = get_warning_ledger(context.chat_data)
+    warnings = ledger.warnings(user_id)
+    if not warnings:
+        await update.message.reply_text(f"User {user_id} has no active warnings.")
+        return
+    now = time.time()
+    lines = [f"User {user_id} has {len(warnings)}/{ledger.limit} warnings:"]
+    for timestamp, _, reason in warnings:
+        lines.append(f"- {reason} ({format_duration(int(now - timestamp))} ago)")
+    await update.message.reply_text("\n".join(lines))
+
+async def reset_warnings(update: Update, context: CallbackContext) -> None:
+    """Clears a user's warnings. Reply to them or pass their user ID."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
+
+    user_id = _warned_user_id(update, context)
+    if user_id is None:
+        await update.message.reply_text("Reply to a user's message or use /resetwarns <user_id>.")
+        return
+
+    cleared = get_warning_ledger(context.chat_data).reset(user_id)
+    await update.message.reply_text(f"✅ Cleared {cleared} warning(s) of user {user_id}.")
+    logger.info("Warnings reset", admin=update.effective_user.id, user_id=user_id, cleared=cleared)
+
+async def set_warn_policy(update: Update, context: CallbackContext) -> None:
+    """Shows or sets what happens after too many warnings (/warnpolicy <count> <period> <mute|ban> [duration])."""
+    ledger = get_warning_ledger(context.chat_data)
+    if not context.args:
+        period = f"for {format_duration(ledger.duration)}" if ledger.duration else "permanently"
+        await update.message.reply_text(
+            f"{ledger.limit} warnings within {format_duration(ledger.window)}: {ledger.action} {period}."
+        )
+        return
+
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
+
+    usage = "Usage: /warnpolicy <count> <period> <mute|ban> [duration], e.g. /warnpolicy 3 7d mute 1d"
+    args = context.args
+    if len(args) not in (3, 4) or not args[0].isdigit() or int(args[0]) < 1 or args[2].lower() not in (MUTE, BAN):
+        await update.message.reply_text(usage)
+        return
+    window = parse_duration(args[1])
+    duration = parse_duration(args[3]) if len(args) == 4 else None
+    if window is None or (len(args) == 4 and duration is None):
+        await update.message.reply_text(usage)
+        return
+    if duration is not None and duration < MIN_DURATION:
+        await update.message.reply_text(f"Timed mutes and bans must last at least {format_duration(MIN_DURATION)}.")
+        return
+
+    ledger.configure(int(args[0]), window, args[2].lower(), duration)
+    period = f"for {format_duration(duration)}" if duration else "permanently"
+    verb = "muted" if ledger.action == MUTE else "banned"
+    await update.message.reply_text(
+        f"✅ After {ledger.limit} warnings within {format_duration(window)}, users will be {verb} {period}."
+    )
+    logger.info("Warning policy changed", admin=update.effective_user.id, chat_id=update.effective_chat.id,
+                limit=ledger.limit, window=window, action=ledger.action, duration=duration)
 
 async def kick_user(update: Update, context: CallbackContext) -> None:
     """Kicks a user from the chat. Must be a reply."""
@@ -54,6 +209,7 @@ async def kick_user(update: Update, context: CallbackContext) -> None:
 
     try:
         await context.bot.kick_chat_member(chat_id, kicked_user.id)
+        expiry_scheduler.cancel(chat_id, kicked_user.id, UNBAN)
         await update.message.reply_html(f"👢 {kicked_user.mention_html()} has been kicked from the chat.")
         logger.info("User kicked", admin=update.effective_user.id, kicked_user=kicked_user.id)
     except Exception as e:
@@ -75,12 +231,80 @@ async def ban_user(update: Update, context: CallbackContext) -> None:
 
     try:
         await context.bot.ban_chat_member(chat_id, banned_user.id)
+        # The ban is permanent now: an earlier /tban must not lift it
+        expiry_scheduler.cancel(chat_id, banned_user.id, UNBAN)
         await update.message.reply_html(f"🚫 {banned_user.mention_html()} has been banned from the chat.")
         logger.info("User banned", admin=update.effective_user.id, banned_user=banned_user.id)
     except Exception as e:
         logger.error("Failed to ban user", error=e)
         await update.message.reply_text(f"Failed to ban user. Reason: {e}")
 
+async def _timed_restriction_args(update: Update, context: CallbackContext, command: str):
+    """Checks a /tmute or /tban call; returns (user, seconds, reason), or None after replying why not."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return None
+
+    usage = f"Reply to a user's message with /{command} <duration> [reason], e.g. /{command} 30m spamming. Units: s, m, h, d, w."
+    if not update.message.reply_to_message or not context.args:
+        await update.message.reply_text(usage)
+        return None
+    seconds = parse_duration(context.args[0])
+    if seconds is None:
+        await update.message.reply_text(usage)
+        return None
+    if seconds < MIN_DURATION:
+        # Telegram would take a shorter until_date as "forever"
+        await update.message.reply_text(f"Timed mutes and bans must last at least {format_duration(MIN_DURATION)}.")
+        return None
+    reason = " ".join(context.args[1:]) or "No reason specified."
+    return update.message.reply_to_message.from_user, seconds, reason
+
+async def timed_mute(update: Update, context: CallbackContext) -> None:
+    """Mutes a user for a while (/tmute <duration>). Must be a reply."""
+    args = await _timed_restriction_args(update, context, "tmute")
+    if args is None:
+        return
+    muted_user, seconds, reason = args
+    chat_id = update.effective_chat.id
+
+    try:
+        due = expiry_scheduler.schedule(chat_id, muted_user.id, UNMUTE, seconds)
+        await context.bot.restrict_chat_member(
+            chat_id, muted_user.id, permissions=ChatPermissions.no_permissions(), until_date=telegram_until_date(due)
+        )
+    except Exception as e:
+        expiry_scheduler.cancel(chat_id, muted_user.id, UNMUTE)
+        logger.error("Failed to mute user", error=e)
+        await update.message.reply_text(f"Failed to mute user. Reason: {e}")
+        return
+    await update.message.reply_html(
+        f"🔇 {muted_user.mention_html()} has been muted for {format_duration(seconds)}.\n<b>Reason:</b> {reason}"
+    )
+    logger.info("User muted", admin=update.effective_user.id, muted_user=muted_user.id, seconds=seconds, reason=reason)
+
+async def timed_ban(update: Update, context: CallbackContext) -> None:
+    """Bans a user for a while (/tban <duration>). Must be a reply."""
+    args = await _timed_restriction_args(update, context, "tban")
+    if args is None:
+        return
+    banned_user, seconds, reason = args
+    chat_id = update.effective_chat.id
+
+    try:
+        due = expiry_scheduler.schedule(chat_id, banned_user.id, UNBAN, seconds)
+        await context.bot.ban_chat_member(chat_id, banned_user.id, until_date=telegram_until_date(due))
+    except Exception as e:
+        expiry_scheduler.cancel(chat_id, banned_user.id, UNBAN)
+        logger.error("Failed to ban user", error=e)
+        await update.message.reply_text(f"Failed to ban user. Reason: {e}")
+        return
+    await update.message.reply_html(
+        f"🚫 {banned_user.mention_html()} has been banned for {format_duration(seconds)}.\n<b>Reason:</b> {reason}"
+    )
+    logger.info("User temporarily banned", admin=update.effective_user.id, banned_user=banned_user.id,
+                seconds=seconds, reason=reason)
+
 async def unban_user(update: Update, context: CallbackContext) -> None:
     """Unbans a user from the chat. Requires the user's ID."""
     if not await _is_user_admin(update, context):
@@ -96,12 +320,77 @@ async def unban_user(update: Update, context: CallbackContext) -> None:
 
     try:
         await context.bot.unban_chat_member(chat_id, user_id_to_unban)
+        expiry_scheduler.cancel(chat_id, user_id_to_unban, UNBAN)
         await update.message.reply_text(f"✅ User {user_id_to_unban} has been unbanned.")
         logger.info("User unbanned", admin=update.effective_user.id, unbanned_user_id=user_id_to_unban)
     except Exception as e:
         logger.error("Failed to unban user", error=e)
         await update.message.reply_text(f"Failed to unban user. Reason: {e}")
 
+async def purge_messages(update: Update, context: CallbackContext) -> None:
+    """Deletes every message from the replied-to one up to the command, or a user's last N messages."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
+
+    usage = (
+        "Usage: reply to a message with /purge to delete everything from there on, "
+        "reply with /purge <count> to delete that user's last messages, or use /purge <user_id> <count>."
+    )
+    chat_id = update.effective_chat.id
+    command_id = update.message.message_id
+    reply = update.message.reply_to_message
+    args = context.args or []
+
+    if reply and not args:
+        if command_id - reply.message_id >= MAX_PURGE:
+            await update.message.reply_text(f"I can purge at most {MAX_PURGE} messages at a time.")
+            return
+        # Message IDs are sequential within a chat; deleteMessages skips the ones that are already gone
+        message_ids = list(range(reply.message_id, command_id + 1))
+        target = None
+    else:
+        try:
+            if reply and len(args) == 1:
+                target = reply.sender_chat.id if reply.sender_chat else reply.from_user.id
+                count = int(args[0])
+            elif len(args) == 2:
+                target, count = int(args[0]), int(args[1])
+            else:
+                raise ValueError
+        except ValueError:
+            await update.message.reply_text(usage)
+            return
+        if count < 1:
+            await update.message.reply_text(usage)
+            return
+        message_ids = recent_messages.from_sender(chat_id, target, min(count, MAX_PURGE))
+        if not message_ids:
+            await update.message.reply_text("I don't remember any recent messages from that user in this chat.")
+            return
+        message_ids.append(command_id)
+
+    total = len(message_ids)
+    status = await update.message.reply_text(f"🧹 Purging {total} messages...")
+    last_report = time.monotonic()
+
+    async def report(done: int, total: int) -> None:
+        nonlocal last_report
+        if done < total and time.monotonic() - last_report >= PURGE_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            try:
+                await status.edit_text(f"🧹 Purging... {done}/{total}")
+            except Exception as e:
+                logger.debug("Could not update purge progress", chat_id=chat_id, error=e)
+
+    failed = await deletion_batcher.purge(context.bot, chat_id, message_ids, progress=report)
+    summary = f"🧹 Purged {total - failed} messages."
+    if failed:
+        summary += f" {failed} could not be deleted (messages older than 48 hours can't be deleted by bots)."
+    await status.edit_text(summary)
+    logger.info("Messages purged", admin=update.effective_user.id, chat_id=chat_id, target=target,
+                count=total, failed=failed)
+
 async def set_welcome_message(update: Update, context: CallbackContext) -> None:
     """Allows admins to set a custom welcome message for the chat."""
     if not await _is_user_admin(update, context):
@@ -117,6 +406,7 @@ async def set_welcome_message(update: Update, context: CallbackContext) -> None:
     chat_id = update.effective_chat.id
     
     context.chat_data['welcome_message'] = welcome_message
+    compile_welcome(chat_id, welcome_message)
     await update.message.reply_html(f"✅ Welcome message for this chat set to:\n<code>{welcome_message}</code>")
 
 async def announce_command(update: Update, context: CallbackContext) -> None:
@@ -130,7 +420,25 @@ async def announce_command(update: Update, context: CallbackContext) -> None:
     target_chat_id = os.getenv("TARGET_CHAT_ID") # Moved this line inside the function
 
     if not context.args:
-        await update.message.reply_text("Please provide the announcement text. Usage: /announce <message>")
+        await update.message.reply_text(
+            "Please provide the announcement text. Usage: /announce [all | tag:<name>] <message>"
+        )
+        return
+
+    if is_audience(context.args[0]):
+        audience = context.args[0].lower()
+        text = " ".join(context.args[1:])
+        if not text:
+            await update.message.reply_text("Please provide the announcement text. Usage: /announce all <message>")
+            return
+        job = await broadcaster.submit(context.application, text, audience, update.effective_chat.id)
+        if not job["targets"]:
+            await update.message.reply_text(f"No known group chats match {audience}.")
+            return
+        await update.message.reply_text(
+            f"📣 Broadcasting to {len(job['targets'])} chats (job {job['id']}). I'll report back when it's done."
+        )
+        logger.info("Broadcast started", admin=user_id, job=job["id"], audience=audience, chats=len(job["targets"]))
         return
 
     announcement_text = " ".join(context.args) # Original definition of announcement_text
@@ -175,6 +483,40 @@ async def toggle_cleanlinked(update: Update, context: CallbackContext) -> None:
         status_message = "✅ Deletion of linked channel messages is currently **enabled**." if current_state else "❌ Deletion of linked channel messages is currently **disabled**."
         await update.message.reply_html(status_message)
 
+async def tag_chat(update: Update, context: CallbackContext) -> None:
+    """Adds a broadcast tag to the chat (/tag <name>), or lists its tags."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
+
+    tags = context.chat_data.get(TAGS_KEY, [])
+    if not context.args:
+        if tags:
+            await update.message.reply_text("This chat is tagged: " + ", ".join(tags))
+        else:
+            await update.message.reply_text("This chat has no tags. Usage: /tag <name>")
+        return
 
+    tag = context.args[0].lower()
+    if tag not in tags:
+        context.chat_data[TAGS_KEY] = sorted(tags + [tag])
+    await update.message.reply_text(f"✅ Tagged this chat as '{tag}'. Reach it with /announce tag:{tag} <message>.")
+    logger.info("Chat tagged", admin=update.effective_user.id, chat_id=update.effective_chat.id, tag=tag)
 
+async def untag_chat(update: Update, context: CallbackContext) -> None:
+    """Removes a broadcast tag from the chat."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
 
+    if not context.args:
+        await update.message.reply_text("Usage: /untag <name>")
+        return
+
+    tag = context.args[0].lower()
+    tags = context.chat_data.get(TAGS_KEY, [])
+    if tag not in tags:
+        await update.message.reply_text(f"This chat is not tagged '{tag}'.")
+        return
+    context.chat_data[TAGS_KEY] = [t for t in tags if t != tag]
+    await update.message.reply_text(f"✅ Removed the tag '{tag}'.")
@@ -2,17 +2,18 @@ import structlog
 from telegram import Update, MessageEntity, Chat
 from telegram.ext import CallbackContext
 from telegram.constants import ChatAction
+from moderation_bot.core.pins import pin_tracker
 from .moderation import _is_user_admin # Assuming _is_user_admin is in moderation.py
 
 logger = structlog.get_logger(__name__)
 
 async def get_pinned_message(update: Update, context: CallbackContext) -> None:
-    """Fetches and displays the current pinned message."""
+    """Displays the current pinned message, from memory when the chat's pin is known."""
     chat_id = update.effective_chat.id
     try:
-        chat = await context.bot.get_chat(chat_id)
-        if chat.pinned_message:
-            await update.message.reply_text(f"📌 Current Pinned Message:\n\n{chat.pinned_message.text}", quote=True)
+        pinned_id, text = await pin_tracker.get(context.bot, chat_id)
+        if pinned_id:
+            await update.message.reply_text(f"📌 Current Pinned Message:\n\n{text}", quote=True)
         else:
             await update.message.reply_text("There is no message currently pinned in this chat.")
     except Exception as e:
@@ -53,11 +54,13 @@ async def pin_message(update: Update, context: CallbackContext) -> None:
     try:
         if message_to_pin_id:
             await context.bot.pin_chat_message(chat_id, message_to_pin_id, disable_notification=disable_notification)
+            pin_tracker.pinned(chat_id, update.message.reply_to_message)
             await update.message.reply_text("✅ Message pinned!", quote=True)
             logger.info("Message pinned", chat_id=chat_id, message_id=message_to_pin_id)
         elif text_to_pin:
             sent_message = await context.bot.send_message(chat_id, text_to_pin, parse_mode='HTML')
             await context.bot.pin_chat_message(chat_id, sent_message.message_id, disable_notification=disable_notification)
+            pin_tracker.pinned(chat_id, sent_message)
             await update.message.reply_text("✅ Custom message pinned!", quote=True)
             logger.info("Custom message pinned", chat_id=chat_id, message_id=sent_message.message_id)
     except Exception as e:
@@ -79,6 +82,7 @@ async def announce_pin(update: Update, context: CallbackContext) -> None:
     try:
         sent_message = await context.bot.send_message(chat_id, announcement_text, parse_mode='HTML')
         await context.bot.pin_chat_message(chat_id, sent_message.message_id, disable_notification=False) # Announce implies notification
+        pin_tracker.pinned(chat_id, sent_message)
         await update.message.reply_text("✅ Announcement sent and pinned!", quote=True)
         logger.info("Announcement pinned", chat_id=chat_id, message_id=sent_message.message_id)
     except Exception as e:
@@ -100,6 +104,7 @@ async def perma_pin(update: Update, context: CallbackContext) -> None:
     try:
         sent_message = await context.bot.send_message(chat_id, custom_text, parse_mode='HTML', disable_web_page_preview=True)
         await context.bot.pin_chat_message(chat_id, sent_message.message_id, disable_notification=True)
+        pin_tracker.pinned(chat_id, sent_message)
         await update.message.reply_text("✅ Custom message perma-pinned!", quote=True)
         logger.info("Custom message perma-pinned", chat_id=chat_id, message_id=sent_message.message_id)
     except Exception as e:
@@ -120,10 +125,12 @@ async def unpin_message(update: Update, context: CallbackContext) -> None:
     try:
         if message_to_unpin_id:
             await context.bot.unpin_chat_message(chat_id, message_to_unpin_id)
+            pin_tracker.unpinned(chat_id, message_to_unpin_id)
             await update.message.reply_text("✅ Message unpinned!", quote=True)
             logger.info("Specific message unpinned", chat_id=chat_id, message_id=message_to_unpin_id)
         else:
             await context.bot.unpin_chat_message(chat_id) # Unpins the last pinned message
+            pin_tracker.unpinned(chat_id)
             await update.message.reply_text("✅ Last pinned message unpinned!", quote=True)
             logger.info("Last pinned message unpinned", chat_id=chat_id)
     except Exception as e:
@@ -139,6 +146,7 @@ async def unpin_all_messages(update: Update, context: CallbackContext) -> None:
 
     try:
         await context.bot.unpin_all_chat_messages(chat_id)
+        pin_tracker.cleared(chat_id)
         await update.message.reply_text("✅ All messages unpinned!", quote=True)
         logger.info("All messages unpinned", chat_id=chat_id)
     except Exception as e:
@@ -172,6 +180,35 @@ async def toggle_antichannelpin(update: Update, context: CallbackContext) -> Non
         status_message = "✅ Anti-channel pin is currently **enabled**." if current_state else "❌ Anti-channel pin is currently **disabled**."
         await update.message.reply_html(status_message)
 
+def _is_channel_auto_forward(message) -> bool:
+    sender_chat = getattr(message, "sender_chat", None)
+    return bool(getattr(message, "is_automatic_forward", False) and sender_chat and sender_chat.type == Chat.CHANNEL)
+
+async def _unpin_auto_forward(context: CallbackContext, chat_id: int, message_id: int) -> None:
+    try:
+        await context.bot.unpin_chat_message(chat_id, message_id)
+        pin_tracker.unpinned(chat_id, message_id)
+        logger.info("Unpinned automatically forwarded message from linked channel", chat_id=chat_id, message_id=message_id)
+    except Exception as e:
+        logger.error(
+            "Failed to unpin automatically forwarded message from linked channel",
+            error=e,
+            chat_id=chat_id,
+            message_id=message_id
+        )
+
+async def track_pinned_message(update: Update, context: CallbackContext) -> None:
+    """Records pins announced by 'pinned_message' service messages, and undoes channel auto-pins."""
+    message = update.effective_message
+    if not message or not message.pinned_message:
+        return
+
+    chat_id = update.effective_chat.id
+    pinned = message.pinned_message
+    pin_tracker.pinned(chat_id, pinned)
+    if context.chat_data.get('antichannelpin_enabled', False) and _is_channel_auto_forward(pinned):
+        await _unpin_auto_forward(context, chat_id, pinned.message_id)
+
 async def prevent_channel_auto_pin(update: Update, context: CallbackContext) -> None:
     """Prevents automatic pinning of messages from linked channels if 'antichannelpin' is enabled."""
     if not update.message:
@@ -183,22 +220,10 @@ async def prevent_channel_auto_pin(update: Update, context: CallbackContext) ->
     if not context.chat_data.get('antichannelpin_enabled', False):
         return
 
-    # Check if the message is an automatic forward from a channel and it's pinned
-    if update.message.is_automatic_forward and update.message.from_chat and update.message.from_chat.type == Chat.CHANNEL:
-        try:
-            # Telegram Bot API does not provide a direct way to check if a specific message
-            # was auto-pinned. The common strategy is to simply unpin it if it's new
-            # and from a linked channel, assuming it was auto-pinned.
-            await context.bot.unpin_chat_message(chat_id, update.message.message_id)
-            logger.info(
-                "Unpinned automatically forwarded message from linked channel",
-                chat_id=chat_id,
-                message_id=update.message.message_id
-            )
-        except Exception as e:
-            logger.error(
-                "Failed to unpin automatically forwarded message from linked channel",
-                error=e,
-                chat_id=chat_id,
-                message_id=update.message.message_id
-            )
+    if not _is_channel_auto_forward(update.message):
+        return
+
+    # Telegram pins the forward without a service message, so the tracker cannot tell whether
+    # it is pinned, and asking getChat would cost as much as the unpin itself. A pin that
+    # happens after this point arrives as a service message (see track_pinned_message).
+    await _unpin_auto_forward(context, chat_id, update.message.message_id)
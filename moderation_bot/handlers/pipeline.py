@@ -0,0 +1,91 @@
+import time
+
+import structlog
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, CallbackContext, filters
+
+from moderation_bot.core.metrics import handler_latency
+from moderation_bot.core.recent import recent_messages
+from moderation_bot.core.startup import lazy_callback
+
+from .activity import track_activity
+
+logger = structlog.get_logger(__name__)
+
+# Per-chat feature bits, derived from the toggles stored in chat_data
+FEATURE_CLEANLINKED = 1 << 0
+FEATURE_ANTICHANNELPIN = 1 << 1
+FEATURE_NOBOTS = 1 << 2
+FEATURE_FILTERS = 1 << 3
+FEATURE_ANTIFLOOD = 1 << 4
+FEATURE_ANTISPAM = 1 << 5
+
+_PLAIN_TEXT = filters.TEXT & ~filters.COMMAND
+
+# (required feature bit or 0 for always, plain text only?, callback), in execution order.
+# A stage that returns True has dealt with the message and the remaining stages are skipped.
+# Stages behind a toggle import their module the first time a chat with it enabled posts,
+# so chats that use none of them never pay for filters (and the regex engine), pins or spam.
+STAGES = (
+    (FEATURE_CLEANLINKED, False, lazy_callback(__package__ + ".spam", "clean_linked_channel_messages")),
+    (FEATURE_ANTICHANNELPIN, False, lazy_callback(__package__ + ".pin", "prevent_channel_auto_pin")),
+    (FEATURE_NOBOTS, False, lazy_callback(__package__ + ".spam", "block_other_bots")),
+    (FEATURE_ANTIFLOOD, False, lazy_callback(__package__ + ".spam", "check_flood")),
+    (0, True, track_activity),
+    (FEATURE_ANTISPAM, True, lazy_callback(__package__ + ".spam", "check_duplicate_spam")),
+    (FEATURE_FILTERS, True, lazy_callback(__package__ + ".filters", "apply_filters")),
+)
+
+def feature_flags(chat_data: dict) -> int:
+    """Reads a chat's toggles into a bitmask."""
+    flags = 0
+    if chat_data.get('cleanlinked_enabled'):
+        flags |= FEATURE_CLEANLINKED
+    if chat_data.get('antichannelpin_enabled'):
+        flags |= FEATURE_ANTICHANNELPIN
+    if chat_data.get('nobots_enabled'):
+        flags |= FEATURE_NOBOTS
+    if chat_data.get('filters'):
+        flags |= FEATURE_FILTERS
+    if chat_data.get('antiflood_enabled'):
+        flags |= FEATURE_ANTIFLOOD
+    if chat_data.get('antispam_enabled'):
+        flags |= FEATURE_ANTISPAM
+    return flags
+
+async def run_message_pipeline(update: Update, context: CallbackContext) -> None:
+    """Runs every per-message stage that is enabled for the chat, in order.
+
+    This replaces one MessageHandler per stage: the chat's toggles are read
+    once, and disabled stages (or all of them) are skipped without building
+    anything. A failing stage is reported to the error handlers and the
+    remaining stages still run, as they did when each was its own group.
+    """
+    message = update.message
+    if message is not None:
+        # Remembered for /purge <user>; the Bot API can't list a chat's history
+        sender = message.sender_chat or message.from_user
+        if sender is not None:
+            recent_messages.add(message.chat_id, message.message_id, sender.id)
+
+    flags = feature_flags(context.chat_data) if context.chat_data is not None else 0
+    is_plain_text = bool(_PLAIN_TEXT.check_update(update))
+    if not flags and not is_plain_text:
+        return
+
+    for required_flag, text_only, stage in STAGES:
+        if required_flag and not flags & required_flag:
+            continue
+        if text_only and not is_plain_text:
+            continue
+        started = time.perf_counter()
+        try:
+            if await stage(update, context) is True:
+                return
+        except ApplicationHandlerStop:
+            raise
+        except Exception as e:
+            if await context.application.process_error(update, e):
+                return
+        finally:
+            handler_latency.observe(time.perf_counter() - started, stage.__name__)
@@ -1,8 +1,12 @@
 import os
+import time
 import structlog
-from telegram import Update, Chat
+from telegram import Update, Chat, ChatPermissions
 from telegram.ext import CallbackContext
 
+from moderation_bot.core.deletion import deletion_batcher
+from moderation_bot.core.flood import flood_detector
+from moderation_bot.core.simhash import duplicate_index
 from .moderation import _is_user_admin
 
 logger = structlog.get_logger(__name__)
@@ -14,15 +18,13 @@ async def block_other_bots(update: Update, context: CallbackContext) -> None:
 
     if update.effective_user and update.effective_user.is_bot:
         if update.effective_user.id != context.bot.id:
-            try:
-                await update.message.delete()
-                logger.info(
-                    "Deleted a message from another bot",
-                    bot_id=update.effective_user.id,
-                    chat_id=update.effective_chat.id
-                )
-            except Exception as e:
-                logger.error("Failed to delete bot message", error=e)
+            # Deleted together with other pending messages of this chat in one bulk call
+            deletion_batcher.schedule(context.bot, update.effective_chat.id, update.message.message_id)
+            logger.info(
+                "Queued message from another bot for deletion",
+                bot_id=update.effective_user.id,
+                chat_id=update.effective_chat.id
+            )
 
 async def toggle_nobots(update: Update, context: CallbackContext) -> None:
     """Toggles the anti-bot message feature for the chat."""
@@ -60,17 +62,101 @@ async def clean_linked_channel_messages(update: Update, context: CallbackContext
                          user_id=update.effective_user.id, chat_id=chat_id, message_id=update.message.message_id)
             return
 
-        try:
-            await update.message.delete()
-            logger.info(
-                "Deleted message from linked channel",
-                chat_id=chat_id,
-                message_id=update.message.message_id
-            )
-        except Exception as e:
-            logger.error(
-                "Failed to delete message from linked channel",
-                error=e,
-                chat_id=chat_id,
-                message_id=update.message.message_id
-            )
+        deletion_batcher.schedule(context.bot, chat_id, update.message.message_id)
+        logger.info(
+            "Queued message from linked channel for deletion",
+            chat_id=chat_id,
+            message_id=update.message.message_id
+        )
+
+async def check_flood(update: Update, context: CallbackContext) -> None:
+    """Mutes users who post faster than the flood limit if /antiflood is enabled."""
+    if not context.chat_data.get('antiflood_enabled', False):
+        return
+
+    user = update.effective_user
+    if user is None or user.id == context.bot.id or update.message is None or update.message.sender_chat:
+        return
+
+    chat_id = update.effective_chat.id
+    if not flood_detector.hit(chat_id, user.id):
+        return
+
+    # Only flagged users get the (cached) admin check, so normal traffic never pays for it
+    if await _is_user_admin(update, context):
+        return
+
+    mute_seconds = int(os.getenv("FLOOD_MUTE_SECONDS", "300"))
+    flood_detector.mute(chat_id, user.id, mute_seconds)
+    try:
+        await context.bot.restrict_chat_member(
+            chat_id,
+            user.id,
+            permissions=ChatPermissions.no_permissions(),
+            until_date=int(time.time()) + mute_seconds,
+        )
+    except Exception as e:
+        flood_detector.mute(chat_id, user.id, 0)
+        logger.error("Failed to restrict flooding user", user_id=user.id, chat_id=chat_id, error=e)
+        return
+    logger.info("Flooding user muted", user_id=user.id, chat_id=chat_id, seconds=mute_seconds)
+
+async def toggle_antiflood(update: Update, context: CallbackContext) -> None:
+    """Toggles muting users who send messages too quickly."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
+
+    new_state = not context.chat_data.get('antiflood_enabled', False)
+    context.chat_data['antiflood_enabled'] = new_state
+
+    status_message = (
+        f"✅ Anti-flood is now <b>enabled</b>. Users sending more than {flood_detector.limit} messages "
+        f"in {flood_detector.window:g} seconds will be muted."
+        if new_state else "❌ Anti-flood is now <b>disabled</b>."
+    )
+    await update.message.reply_html(status_message)
+    logger.info("Anti-flood toggled", admin=update.effective_user.id, chat_id=update.effective_chat.id, enabled=new_state)
+
+async def check_duplicate_spam(update: Update, context: CallbackContext) -> bool:
+    """Deletes messages that are pasted over and over (with light edits) if /antispam is enabled."""
+    if not context.chat_data.get('antispam_enabled', False):
+        return False
+    if not update.message or not update.message.text:
+        return False
+
+    chat_id = update.effective_chat.id
+    to_delete = duplicate_index.add(update.message.text, chat_id, update.message.message_id)
+    if not to_delete:
+        return False
+
+    # Only messages that repeat get the (cached) admin check. An admin's copy is kept, but the
+    # copies recorded before it are spam whoever happened to post the one that flagged the cluster
+    exempt = bool(update.effective_user) and await _is_user_admin(update, context)
+    if exempt:
+        own = (chat_id, update.message.message_id)
+        to_delete = [message for message in to_delete if message != own]
+
+    for spam_chat_id, message_id in to_delete:
+        deletion_batcher.schedule(context.bot, spam_chat_id, message_id)
+    if to_delete:
+        logger.info("Queued repeated spam for deletion", chat_id=chat_id, count=len(to_delete))
+    # Tells the pipeline to skip the remaining stages: no filter replies to deleted spam
+    return not exempt
+
+async def toggle_antispam(update: Update, context: CallbackContext) -> None:
+    """Toggles deleting near-duplicate messages that are posted repeatedly."""
+    if not await _is_user_admin(update, context):
+        await update.message.reply_text("This command can only be used by admins.")
+        return
+
+    new_state = not context.chat_data.get('antispam_enabled', False)
+    context.chat_data['antispam_enabled'] = new_state
+
+    status_message = (
+        f"✅ Anti-spam is now <b>enabled</b>. Messages posted more than {duplicate_index.threshold} times "
+        f"within {duplicate_index.window / 60:g} minutes (here or in other protected chats) will be deleted."
+        if new_state else "❌ Anti-spam is now <b>disabled</b>."
+    )
+    await update.message.reply_html(status_message)
+    logger.info("Anti-spam toggled", admin=update.effective_user.id, chat_id=update.effective_chat.id, enabled=new_state)
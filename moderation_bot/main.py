@@ -1,44 +1,130 @@
-import os
+# Imported first: startup phases are timed from here
+from moderation_bot.core.startup import startup_profile
+
 import asyncio
-from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, ChatMemberHandler, MessageHandler, CallbackContext
+import os
+from functools import partial
+from telegram.ext import Application, CommandHandler, ChatMemberHandler, MessageHandler, TypeHandler, CallbackContext
 import telegram
+from telegram import Update
 import structlog
 
-# Initialize logging
-structlog.configure(
-    processors=[
-        structlog.processors.add_log_level,
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer(),
-    ],
-    logger_factory=structlog.PrintLoggerFactory(),
-)
+from moderation_bot.core.logsink import configure_logging, sampler, sink
+
+# Initialize logging: events are rendered and written on a background thread,
+# below-LOG_LEVEL calls are no-ops and hot events are sampled (see LOG_SAMPLING)
+configure_logging()
 logger = structlog.get_logger()
 
-# Import handlers
-from moderation_bot.handlers.moderation import warn_user, kick_user, ban_user, unban_user, set_welcome_message, announce_command, toggle_cleanlinked
-from moderation_bot.handlers.members import welcome_new_member
-from moderation_bot.handlers.help import help_command
-from moderation_bot.handlers.activity import track_activity, top_command
-from moderation_bot.handlers.spam import block_other_bots, toggle_nobots, clean_linked_channel_messages
-from moderation_bot.handlers.filters import add_filter, list_filters, stop_filter, stop_all_filters, apply_filters
-from moderation_bot.handlers.pin import get_pinned_message, pin_message, announce_pin, perma_pin, unpin_message, unpin_all_messages, toggle_antichannelpin, prevent_channel_auto_pin
+# Handler modules are imported when their handlers are registered (see COMMANDS),
+# or on first use with LAZY_HANDLERS
+from moderation_bot.core.admin_cache import admin_cache
+from moderation_bot.core.broadcast import broadcaster
+from moderation_bot.core.dedup import UpdateDeduplicator
+from moderation_bot.core.deletion import deletion_batcher
+from moderation_bot.core.expiry import expiry_scheduler
+from moderation_bot.core.metrics import MetricsServer, instrument_application, loop_monitor, registry
+from moderation_bot.core.processor import ChatShardedUpdateProcessor
+from moderation_bot.core.ratelimit import ScheduledRateLimiter, retry_after_seconds
+from moderation_bot.core.startup import load_callback, serve_fast_webhook
+from moderation_bot.core.welcome import welcome_batcher
 from telegram.ext import filters
 
+_HANDLERS = "moderation_bot.handlers."
+
+# Command -> (module, callback), registered in this order
+COMMANDS = {
+    "help": ("help", "help_command"),
+    "warn": ("moderation", "warn_user"),
+    "warns": ("moderation", "list_warnings"),
+    "resetwarns": ("moderation", "reset_warnings"),
+    "warnpolicy": ("moderation", "set_warn_policy"),
+    "kick": ("moderation", "kick_user"),
+    "ban": ("moderation", "ban_user"),
+    "unban": ("moderation", "unban_user"),
+    "tmute": ("moderation", "timed_mute"),
+    "tban": ("moderation", "timed_ban"),
+    "purge": ("moderation", "purge_messages"),
+    "setwelcome": ("moderation", "set_welcome_message"),
+    "top": ("activity", "top_command"),
+    "announce": ("moderation", "announce_command"),
+    "tag": ("moderation", "tag_chat"),
+    "untag": ("moderation", "untag_chat"),
+    "nobots": ("spam", "toggle_nobots"),
+    "antiflood": ("spam", "toggle_antiflood"),
+    "antispam": ("spam", "toggle_antispam"),
+    "cleanlinked": ("moderation", "toggle_cleanlinked"),
+    "filter": ("filters", "add_filter"),
+    "filters": ("filters", "list_filters"),
+    "stop": ("filters", "stop_filter"),
+    "stopall": ("filters", "stop_all_filters"),
+    "pinned": ("pin", "get_pinned_message"),
+    "pin": ("pin", "pin_message"),
+    "announcepin": ("pin", "announce_pin"),
+    "permapin": ("pin", "perma_pin"),
+    "unpin": ("pin", "unpin_message"),
+    "unpinall": ("pin", "unpin_all_messages"),
+    "antichannelpin": ("pin", "toggle_antichannelpin"),
+}
+
+# Every outbound Bot API call goes through this scheduler
+rate_limiter = ScheduledRateLimiter()
+
+registry.gauge("bot_ratelimit_queue_depth", "Requests waiting for a rate limit token.",
+               lambda: rate_limiter.stats()["global_queue_depth"] + rate_limiter.stats()["chat_queue_depth"])
+registry.gauge("bot_admin_cache_hit_ratio", "Share of admin checks answered from the cache.",
+               lambda: admin_cache.stats()["hit_ratio"])
+registry.gauge("bot_deletion_pending_chats", "Chats with message deletions waiting to be sent.",
+               lambda: deletion_batcher.stats()["pending_chats"])
+registry.gauge("bot_broadcasts_running", "Broadcasts currently being sent.", lambda: broadcaster.running)
+registry.gauge("bot_timed_restrictions_pending", "Timed mutes and bans waiting to expire.", lambda: len(expiry_scheduler))
+
+startup_profile.mark("imports")
+
 async def error_handler(update: object, context: CallbackContext) -> None:
-    """Log the error and handle flood control."""
+    """Log the error."""
     if isinstance(context.error, telegram.error.RetryAfter):
+        # The rate limiter already waited and retried; this call was given up on.
         logger.warning(
-            "Flood control exceeded. Suggested retry in %s seconds. Pausing...",
-            context.error.retry_after,
-            update=update
+            "Flood control exceeded, request dropped after retries.",
+            retry_after=retry_after_seconds(context.error),
+            rate_limiter=rate_limiter.stats(),
         )
-        await asyncio.sleep(context.error.retry_after)
         return
     
     logger.error("Exception while handling an update:", exc_info=context.error)
 
+async def post_init(application: Application, metrics_server: MetricsServer = None) -> None:
+    """Restores the processed-update watermark, resumes unfinished broadcasts, lifts timed
+    restrictions that expired while the bot was down, starts the event loop monitor and
+    /metrics endpoint and logs the startup profile."""
+    deduplicator = getattr(application.update_processor, "deduplicator", None)
+    persistence = application.persistence
+    if deduplicator is not None and hasattr(persistence, "register_state"):
+        deduplicator.restore(await persistence.get_state(deduplicator.state_key))
+        persistence.register_state(deduplicator.state_key, deduplicator.checkpoint)
+    await broadcaster.resume(application)
+    await expiry_scheduler.start(application)
+    loop_monitor.start()
+    if metrics_server is not None:
+        await metrics_server.start()
+    startup_profile.mark("initialize")
+    startup_profile.report()
+
+async def post_shutdown(application: Application, metrics_server: MetricsServer = None) -> None:
+    """Stops the background tasks started in post_init."""
+    await loop_monitor.stop()
+    if metrics_server is not None:
+        await metrics_server.stop()
+
+async def post_stop(application: Application) -> None:
+    """Sends out deletions and welcomes that are still buffered, pauses running broadcasts
+    and stops the expiry timer."""
+    await broadcaster.stop()
+    expiry_scheduler.stop()
+    await deletion_batcher.flush_all()
+    await welcome_batcher.flush_all()
+
 async def start(update, context):
     """Sends a descriptive welcome message in DMs, or a brief one in groups."""
     chat_type = update.effective_chat.type
@@ -54,77 +140,182 @@ async def start(update, context):
     else:
         await update.message.reply_text("Moderation bot started. Add me to a group to begin.")
 
+def register_handlers(application: Application, lazy: bool = False) -> None:
+    """Registers the error handler and every command, message and member handler.
+
+    With ``lazy=True`` handler modules are not imported here: each handler is a stub
+    that imports its module the first time an update reaches it.
+    """
+    def handler(module: str, name: str):
+        return load_callback(_HANDLERS + module, name, lazy)
+
+    # Register the error handler
+    application.add_error_handler(error_handler)
+
+    # Register command handlers
+    application.add_handler(CommandHandler("start", start))
+    for command, (module, name) in COMMANDS.items():
+        application.add_handler(CommandHandler(command, handler(module, name)))
+
+    # Register the per-message pipeline (linked channel cleanup, anti-pin, anti-bot, anti-flood, activity, anti-spam, filters)
+    application.add_handler(MessageHandler(filters.ALL, handler("pipeline", "run_message_pipeline")), group=1)
+    # Keep the pin tracker current (the pipeline's group only runs one handler per message)
+    application.add_handler(
+        MessageHandler(filters.StatusUpdate.PINNED_MESSAGE, handler("pin", "track_pinned_message")), group=2
+    )
+
+    # Register member update handlers
+    application.add_handler(
+        ChatMemberHandler(handler("moderation", "track_admin_changes"), ChatMemberHandler.ANY_CHAT_MEMBER), group=-1
+    )
+    application.add_handler(ChatMemberHandler(handler("members", "welcome_new_member"), ChatMemberHandler.CHAT_MEMBER))
+
+    application.add_handler(TypeHandler(Update, startup_profile.first_update), group=101)
+
+def build_application(token: str, persistence=None, request=None, limiter=rate_limiter, shards: int = 8,
+                      metrics_port: int = None, lazy: bool = False) -> Application:
+    """Builds the Application with the bot's persistence, rate limiter, update processor and handlers.
+
+    ``request`` replaces the HTTP layer used to talk to the Bot API (the benchmarks pass a fake one);
+    ``limiter=None`` disables outbound rate limiting. With ``metrics_port`` set, Prometheus metrics
+    are served on ``/metrics`` at that port while the bot runs. ``lazy`` defers importing the
+    handler modules until they are first needed.
+    """
+    metrics_server = MetricsServer(port=metrics_port) if metrics_port else None
+    builder = (
+        Application.builder()
+        .token(token)
+        # Process different chats in parallel while keeping each chat's updates in order,
+        # and skip updates Telegram redelivers
+        .concurrent_updates(ChatShardedUpdateProcessor(shards=shards, deduplicator=UpdateDeduplicator()))
+        .post_init(partial(post_init, metrics_server=metrics_server))
+        .post_stop(post_stop)
+        .post_shutdown(partial(post_shutdown, metrics_server=metrics_server))
+    )
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if limiter is not None:
+        builder = builder.rate_limiter(limiter)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+
+    application = builder.build()
+    register_handlers(application, lazy=lazy)
+    instrument_application(application)
+    return application
+
 def main() -> None:
     """Start the bot."""
     logger.info("Starting moderation bot...")
 
-    # Load environment variables
+    # Load environment variables; on hosts configured through the environment there is no
+    # .env file and python-dotenv is not even imported
     script_dir = os.path.dirname(__file__)
     dotenv_path = os.path.join(script_dir, '..', '.env')
-    load_dotenv(dotenv_path)
-    
+    if os.path.exists(dotenv_path):
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path)
+    startup_profile.mark("env")
+
+    welcome_batcher.window = float(os.getenv("WELCOME_WINDOW", welcome_batcher.window))
+    broadcaster.concurrency = int(os.getenv("BROADCAST_CONCURRENCY", broadcaster.concurrency))
+    # Fast start: listen for the webhook first, import handler modules on first use
+    fast_start = os.getenv("FAST_START", "").lower() in ("1", "true", "yes", "on")
+    lazy = fast_start or os.getenv("LAZY_HANDLERS", "").lower() in ("1", "true", "yes", "on")
+
     token = os.getenv("TELEGRAM_TOKEN")
     if not token:
         logger.error("TELEGRAM_TOKEN not found in environment variables!")
         return
 
-    # Create the Application
-    application = Application.builder().token(token).build()
-
-    # Register the error handler
-    application.add_error_handler(error_handler)
-
-    # Register command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("warn", warn_user))
-    application.add_handler(CommandHandler("kick", kick_user))
-    application.add_handler(CommandHandler("ban", ban_user))
-    application.add_handler(CommandHandler("unban", unban_user))
-    application.add_handler(CommandHandler("setwelcome", set_welcome_message))
-    application.add_handler(CommandHandler("top", top_command))
-    application.add_handler(CommandHandler("announce", announce_command))
-    application.add_handler(CommandHandler("nobots", toggle_nobots))
-    application.add_handler(CommandHandler("cleanlinked", toggle_cleanlinked))
-    application.add_handler(CommandHandler("filter", add_filter))
-    application.add_handler(CommandHandler("filters", list_filters))
-    application.add_handler(CommandHandler("stop", stop_filter))
-    application.add_handler(CommandHandler("stopall", stop_all_filters))
-    application.add_handler(CommandHandler("pinned", get_pinned_message))
-    application.add_handler(CommandHandler("pin", pin_message))
-    application.add_handler(CommandHandler("announcepin", announce_pin))
-    application.add_handler(CommandHandler("permapin", perma_pin))
-    application.add_handler(CommandHandler("unpin", unpin_message))
-    application.add_handler(CommandHandler("unpinall", unpin_all_messages))
-    application.add_handler(CommandHandler("antichannelpin", toggle_antichannelpin))
-
-    # Register message handlers
-    application.add_handler(MessageHandler(filters.ALL, clean_linked_channel_messages), group=0)
-    application.add_handler(MessageHandler(filters.ALL, prevent_channel_auto_pin), group=0)
-    application.add_handler(MessageHandler(filters.ALL, block_other_bots), group=1)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track_activity), group=2)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, apply_filters), group=3)
-
-    # Register member update handler
-    application.add_handler(ChatMemberHandler(welcome_new_member, ChatMemberHandler.CHAT_MEMBER))
+    # Persist chat_data (activity, filters, toggles...) across restarts
+    from moderation_bot.core.persistence import SQLitePersistence
+    persistence_path = os.getenv("PERSISTENCE_PATH", os.path.join(script_dir, '..', 'moderation_bot.sqlite3'))
+    shards = int(os.getenv("UPDATE_SHARDS", "8"))
+    metrics_port = os.getenv("METRICS_PORT")
+    metrics_port = int(metrics_port) if metrics_port else None
 
     # Run the bot
     webhook_url = os.getenv("WEBHOOK_URL")
     port = int(os.getenv("PORT", "8000")) # Default to 8000 if PORT is not set
+    workers = int(os.getenv("WORKERS", "1"))
+
+    if webhook_url and workers > 1:
+        from moderation_bot.core.coordination import SharedCoordinator
+        from moderation_bot.core.ingress import WebhookIngress
 
-    if webhook_url:
+        # Spread chats over several processes behind one webhook endpoint
+        ingress = WebhookIngress(
+            token,
+            workers=workers,
+            coordinator=SharedCoordinator(),
+            persistence_path=persistence_path,
+            shards=shards,
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            metrics_port=metrics_port,
+        )
+        logger.info(f"Bot is starting with webhook on port {port} and {workers} workers...", webhook_url=webhook_url)
+        asyncio.run(ingress.serve(
+            listen="0.0.0.0",
+            port=port,
+            url_path=token,
+            webhook_url=f"{webhook_url}/{token}",
+            allowed_updates=Update.ALL_TYPES,
+        ))
+        logger.info("Bot has stopped.")
+        return
+
+    # Create the Application
+    application = build_application(
+        token,
+        persistence=SQLitePersistence(persistence_path),
+        shards=shards,
+        metrics_port=metrics_port,
+        lazy=lazy,
+    )
+    startup_profile.mark("build")
+
+    if webhook_url and os.getenv("WEBHOOK_SERVER", "").lower() == "asgi":
+        from moderation_bot.core.asgi import DEFAULT_MAX_BODY, serve_asgi_webhook
+
+        logger.info(f"Bot is starting with webhook on port {port} (ASGI)...", webhook_url=webhook_url)
+        asyncio.run(serve_asgi_webhook(
+            application,
+            listen="0.0.0.0",
+            port=port,
+            url_path=token,
+            webhook_url=f"{webhook_url}/{token}",
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            max_body=int(os.getenv("WEBHOOK_MAX_BODY", DEFAULT_MAX_BODY)),
+        ))
+    elif webhook_url and fast_start:
+        logger.info(f"Bot is starting with webhook on port {port} (fast start)...", webhook_url=webhook_url)
+        asyncio.run(serve_fast_webhook(
+            application,
+            listen="0.0.0.0",
+            port=port,
+            url_path=token,
+            webhook_url=f"{webhook_url}/{token}",
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+        ))
+    elif webhook_url:
         application.run_webhook(
             listen="0.0.0.0",
             port=port,
             url_path=token, # Telegram Bot API expects just the token as path
-            webhook_url=f"{webhook_url}/{token}" # Full URL for Telegram to send updates
+            webhook_url=f"{webhook_url}/{token}", # Full URL for Telegram to send updates
+            allowed_updates=Update.ALL_TYPES, # chat_member updates are not sent by default
+            secret_token=os.getenv("WEBHOOK_SECRET"),
         )
         logger.info(f"Bot is starting with webhook on port {port}...", webhook_url=webhook_url)
     else:
         logger.info("Bot is starting with polling...")
-        application.run_polling()
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
-    logger.info("Bot has stopped.")
+    logger.info("Bot has stopped.", admin_cache=admin_cache.stats(), rate_limiter=rate_limiter.stats(), deletions=deletion_batcher.stats(),
+                log_queue_dropped=sink.dropped, log_sampled_out=sampler.dropped)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
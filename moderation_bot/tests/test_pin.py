@@ -1,16 +1,17 @@
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
-from telegram import Chat, Message
+from telegram import Chat, Message, Update
 
 # Add the parent directory to the path to allow imports
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
+from moderation_bot.core.pins import PinTracker
 from moderation_bot.handlers.pin import (
     get_pinned_message, pin_message, announce_pin, perma_pin,
     unpin_message, unpin_all_messages, toggle_antichannelpin,
-    prevent_channel_auto_pin
+    prevent_channel_auto_pin, track_pinned_message
 )
 
 # Mock _is_user_admin for all tests in this module
@@ -19,6 +20,13 @@ def mock_is_admin():
     with patch('moderation_bot.handlers.pin._is_user_admin', new=AsyncMock(return_value=True)) as mock_admin:
         yield mock_admin
 
+# Start every test with no remembered pins
+@pytest.fixture(autouse=True)
+def tracker():
+    tracker = PinTracker()
+    with patch('moderation_bot.handlers.pin.pin_tracker', tracker):
+        yield tracker
+
 @pytest.fixture
 def mock_update_context():
     update = AsyncMock()
@@ -152,21 +160,106 @@ async def test_toggle_antichannelpin_show_status(mock_is_admin, mock_update_cont
     await toggle_antichannelpin(update, context)
     update.message.reply_html.assert_awaited_once_with("❌ Anti-channel pin is currently **disabled**.")
 
+@pytest.mark.asyncio
+async def test_get_pinned_message_from_memory(mock_is_admin, mock_update_context):
+    update, context = mock_update_context
+    context.bot.get_chat.return_value = MagicMock(pinned_message=MagicMock(spec=Message, message_id=5, text="Rules"))
+
+    await get_pinned_message(update, context)
+    await get_pinned_message(update, context)
+
+    context.bot.get_chat.assert_awaited_once_with(update.effective_chat.id)
+    assert update.message.reply_text.await_count == 2
+
+@pytest.mark.asyncio
+async def test_pin_message_is_remembered(mock_is_admin, mock_update_context, tracker):
+    update, context = mock_update_context
+    update.message.reply_to_message = MagicMock(message_id=999, text="Read this")
+    await pin_message(update, context)
+    assert tracker.peek(update.effective_chat.id) == (999, "Read this")
+
+    update.message.reply_to_message = None
+    await unpin_all_messages(update, context)
+    assert tracker.peek(update.effective_chat.id) == (None, None)
+
 @pytest.mark.asyncio
 async def test_prevent_channel_auto_pin_enabled(mock_is_admin, mock_update_context):
     update, context = mock_update_context
     context.chat_data['antichannelpin_enabled'] = True
     update.message.is_automatic_forward = True
-    update.message.from_chat = MagicMock(type=Chat.CHANNEL)
+    update.message.sender_chat = MagicMock(type=Chat.CHANNEL)
+    await prevent_channel_auto_pin(update, context)
+    context.bot.unpin_chat_message.assert_awaited_once_with(update.effective_chat.id, update.message.message_id)
+
+@pytest.mark.asyncio
+async def test_prevent_channel_auto_pin_keeps_the_remembered_pin(mock_is_admin, mock_update_context, tracker):
+    update, context = mock_update_context
+    context.chat_data['antichannelpin_enabled'] = True
+    update.message.is_automatic_forward = True
+    update.message.sender_chat = MagicMock(type=Chat.CHANNEL)
+    tracker.pinned(update.effective_chat.id, MagicMock(message_id=5, text="Rules"))
+
     await prevent_channel_auto_pin(update, context)
+
+    context.bot.get_chat.assert_not_awaited()
     context.bot.unpin_chat_message.assert_awaited_once_with(update.effective_chat.id, update.message.message_id)
+    # Undoing the auto-pin makes the rules the pinned message again
+    assert tracker.peek(update.effective_chat.id) == (5, "Rules")
+
+def _auto_forward_update(update_id, message_id):
+    # What Telegram sends to a discussion group when its linked channel posts
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": 1700000000 + message_id,
+            "chat": {"id": -1001, "type": "supergroup", "title": "Discussion"},
+            "from": {"id": 777000, "is_bot": False, "first_name": "Telegram"},
+            "sender_chat": {"id": -1002, "type": "channel", "title": "News"},
+            "is_automatic_forward": True,
+            "forward_origin": {
+                "type": "channel", "date": 1700000000 + message_id, "message_id": message_id,
+                "chat": {"id": -1002, "type": "channel", "title": "News"},
+            },
+            "text": f"Channel post {message_id}",
+        },
+    }, None)
+
+@pytest.mark.asyncio
+async def test_prevent_channel_auto_pin_unpins_each_channel_post_once(mock_is_admin, tracker):
+    context = AsyncMock()
+    context.chat_data = {'antichannelpin_enabled': True}
+    context.bot = AsyncMock()
+    # Whatever the tracker remembers, it cannot know about pins Telegram makes silently
+    tracker.cleared(-1001)
+
+    for update_id, message_id in ((1, 10), (2, 11)):
+        await prevent_channel_auto_pin(_auto_forward_update(update_id, message_id), context)
+
+    assert [call.args for call in context.bot.unpin_chat_message.await_args_list] == [(-1001, 10), (-1001, 11)]
+    context.bot.get_chat.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_track_pinned_message_undoes_channel_auto_pin(mock_is_admin, mock_update_context, tracker):
+    update, context = mock_update_context
+    context.chat_data['antichannelpin_enabled'] = True
+    update.effective_message.pinned_message = MagicMock(message_id=7, text="Rules", is_automatic_forward=False)
+    await track_pinned_message(update, context)
+    assert tracker.peek(update.effective_chat.id) == (7, "Rules")
+    context.bot.unpin_chat_message.assert_not_awaited()
+
+    update.effective_message.pinned_message = MagicMock(
+        message_id=8, is_automatic_forward=True, sender_chat=MagicMock(type=Chat.CHANNEL)
+    )
+    await track_pinned_message(update, context)
+    context.bot.unpin_chat_message.assert_awaited_once_with(update.effective_chat.id, 8)
 
 @pytest.mark.asyncio
 async def test_prevent_channel_auto_pin_disabled(mock_is_admin, mock_update_context):
     update, context = mock_update_context
     context.chat_data['antichannelpin_enabled'] = False
     update.message.is_automatic_forward = True
-    update.message.from_chat = MagicMock(type=Chat.CHANNEL)
+    update.message.sender_chat = MagicMock(type=Chat.CHANNEL)
     await prevent_channel_auto_pin(update, context)
     context.bot.unpin_chat_message.assert_not_awaited()
 
@@ -175,6 +268,6 @@ async def test_prevent_channel_auto_pin_not_from_channel(mock_is_admin, mock_upd
     update, context = mock_update_context
     context.chat_data['antichannelpin_enabled'] = True
     update.message.is_automatic_forward = True
-    update.message.from_chat = MagicMock(type=Chat.GROUP) # Not a channel
+    update.message.sender_chat = MagicMock(type=Chat.GROUP) # Not a channel
     await prevent_channel_auto_pin(update, context)
     context.bot.unpin_chat_message.assert_not_awaited()
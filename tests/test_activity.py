@@ -64,3 +64,33 @@ async def test_top_command_with_activity():
         "3. User456 - 5 messages\n"
     )
     update.message.reply_html.assert_called_once_with(expected_message)
+
+@pytest.mark.asyncio
+async def test_top_command_uses_cached_names():
+    """Test that /top only asks the API for users it has not seen post."""
+    update = AsyncMock()
+    update.effective_chat.id = -4242
+    context = AsyncMock()
+    context.chat_data = {}
+
+    update.effective_user.id = 1
+    update.effective_user.full_name = "Alice"
+    await track_activity(update, context)
+    await track_activity(update, context)
+    context.chat_data['user_activity'].increment(2)
+
+    async def mock_get_chat_member(chat_id, user_id):
+        user = MagicMock(full_name="Bob")
+        user.mention_html.return_value = f"User{user_id}"
+        return MagicMock(user=user)
+
+    context.bot.get_chat_member = AsyncMock(side_effect=mock_get_chat_member)
+
+    await top_command(update, context)
+
+    context.bot.get_chat_member.assert_awaited_once_with(-4242, 2)
+    update.message.reply_html.assert_called_once_with(
+        "<b>🏆 Top Active Users 🏆</b>\n\n"
+        '1. <a href="tg://user?id=1">Alice</a> - 2 messages\n'
+        "2. User2 - 1 messages\n"
+    )
@@ -0,0 +1,90 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from telegram.constants import ChatMemberStatus
+
+from moderation_bot.core.admin_cache import AdminCache
+from moderation_bot.handlers.moderation import track_admin_changes
+
+
+def _admins(*user_ids):
+    return [MagicMock(user=MagicMock(id=user_id)) for user_id in user_ids]
+
+@pytest.mark.asyncio
+async def test_admin_cache_hit_after_miss():
+    cache = AdminCache()
+    bot = AsyncMock()
+    bot.get_chat_administrators.return_value = _admins(1, 2)
+
+    assert await cache.get_admin_ids(bot, -100) == {1, 2}
+    assert await cache.get_admin_ids(bot, -100) == {1, 2}
+
+    bot.get_chat_administrators.assert_awaited_once_with(-100)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_admin_cache_expires_entries():
+    cache = AdminCache(ttl=0)
+    bot = AsyncMock()
+    bot.get_chat_administrators.return_value = _admins(1)
+
+    await cache.get_admin_ids(bot, -100)
+    await cache.get_admin_ids(bot, -100)
+
+    assert bot.get_chat_administrators.await_count == 2
+
+@pytest.mark.asyncio
+async def test_admin_cache_evicts_least_recently_used_chat():
+    cache = AdminCache(max_chats=2)
+    bot = AsyncMock()
+    bot.get_chat_administrators.return_value = _admins(1)
+
+    for chat_id in (-1, -2, -3):
+        await cache.get_admin_ids(bot, chat_id)
+
+    assert cache.stats()["cached_chats"] == 2
+    await cache.get_admin_ids(bot, -1)
+    assert bot.get_chat_administrators.await_count == 4
+
+@pytest.mark.asyncio
+async def test_admin_cache_shares_in_flight_lookup():
+    cache = AdminCache()
+    bot = AsyncMock()
+    release = asyncio.Event()
+
+    async def slow_get_chat_administrators(chat_id):
+        await release.wait()
+        return _admins(7)
+
+    bot.get_chat_administrators.side_effect = slow_get_chat_administrators
+    lookups = [asyncio.create_task(cache.get_admin_ids(bot, -100)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*lookups)
+    assert all(result == {7} for result in results)
+    bot.get_chat_administrators.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_track_admin_changes_invalidates_on_promotion():
+    update = MagicMock()
+    update.chat_member.chat.id = -100
+    update.chat_member.old_chat_member.status = ChatMemberStatus.MEMBER
+    update.chat_member.new_chat_member.status = ChatMemberStatus.ADMINISTRATOR
+    context = AsyncMock()
+
+    with patch('moderation_bot.handlers.moderation.admin_cache') as cache:
+        await track_admin_changes(update, context)
+        cache.invalidate.assert_called_once_with(-100)
+
+@pytest.mark.asyncio
+async def test_track_admin_changes_ignores_regular_members():
+    update = MagicMock()
+    update.chat_member.old_chat_member.status = ChatMemberStatus.LEFT
+    update.chat_member.new_chat_member.status = ChatMemberStatus.MEMBER
+    context = AsyncMock()
+
+    with patch('moderation_bot.handlers.moderation.admin_cache') as cache:
+        await track_admin_changes(update, context)
+        cache.invalidate.assert_not_called()
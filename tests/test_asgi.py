@@ -0,0 +1,74 @@
+import pytest
+from telegram.ext import Application
+
+from moderation_bot.core.asgi import AsgiWebhook
+
+
+def _scope(method="POST", path="/token", headers=()):
+    return {"type": "http", "method": method, "path": path, "headers": list(headers)}
+
+async def _call(app, scope, *chunks):
+    messages = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+                for index, chunk in enumerate(chunks or (b"",))]
+    received = []
+    sent = []
+
+    async def receive():
+        message = messages.pop(0)
+        received.append(message)
+        return message
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:]), received
+
+@pytest.fixture
+def application():
+    return Application.builder().token("1000:test").build()
+
+@pytest.mark.asyncio
+async def test_update_is_queued_and_acknowledged(application):
+    app = AsgiWebhook(application, "token", secret_token="s3cret")
+    headers = [(b"x-telegram-bot-api-secret-token", b"s3cret")]
+
+    status, _, _ = await _call(app, _scope(headers=headers), b'{"update_id":', b' 7}')
+    assert status == 200
+    assert application.update_queue.get_nowait().update_id == 7
+
+    # Acknowledged before decoding, then dropped
+    status, _, _ = await _call(app, _scope(headers=headers), b"not json")
+    assert status == 200
+    assert app.received == 1
+    assert application.update_queue.empty()
+
+@pytest.mark.asyncio
+async def test_bad_secret_is_refused_before_reading_the_body(application):
+    app = AsgiWebhook(application, "token", secret_token="s3cret")
+
+    for headers in ([], [(b"x-telegram-bot-api-secret-token", b"wrong")]):
+        status, _, received = await _call(app, _scope(headers=headers), b'{"update_id": 1}')
+        assert status == 403
+        assert received == []
+    assert application.update_queue.empty()
+
+@pytest.mark.asyncio
+async def test_oversized_bodies_are_refused(application):
+    app = AsgiWebhook(application, "token", max_body=16)
+
+    status, _, received = await _call(app, _scope(headers=[(b"content-length", b"17")]), b"x" * 17)
+    assert (status, received) == (413, [])
+    # Without a Content-Length the limit applies while reading
+    status, _, _ = await _call(app, _scope(), b"x" * 10, b"x" * 10)
+    assert status == 413
+    assert application.update_queue.empty()
+
+@pytest.mark.asyncio
+async def test_metrics_and_unknown_paths(application):
+    app = AsgiWebhook(application, "token")
+
+    status, body, _ = await _call(app, _scope("GET", "/metrics"))
+    assert status == 200 and b"bot_webhook_requests_total" in body
+    status, _, _ = await _call(app, _scope("POST", "/other"))
+    assert status == 404
@@ -0,0 +1,14 @@
+import pytest
+
+from benchmarks.bench_pipeline import run_benchmark
+
+
+@pytest.mark.asyncio
+async def test_benchmark_smoke_run():
+    """The benchmark harness can drive the real application end to end."""
+    report = await run_benchmark(updates=60, chats=3, users=20)
+
+    assert report["updates"] == 60
+    assert report["updates_per_second"] > 0
+    assert "group 1" in report["latency"]
+    assert report["api_calls"]["getMe"] == 1
@@ -0,0 +1,165 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+from moderation_bot.core.broadcast import TAGS_KEY, Broadcaster, is_audience, resolve_audience
+from moderation_bot.core.persistence import SQLitePersistence
+
+JOB = {
+    "id": "abc", "text": "hello", "audience": "all", "admin_chat_id": 7,
+    "targets": [-3, -2, -1], "done": {-3, -2}, "failed": {}, "created": 0,
+}
+
+
+def _application(chat_data, persistence=None):
+    application = MagicMock()
+    application.chat_data = chat_data
+    application.persistence = persistence
+    application.bot.send_message = AsyncMock()
+    application.update_persistence = AsyncMock()
+    return application
+
+def _sent_to(application):
+    return [call.args[0] for call in application.bot.send_message.await_args_list]
+
+def test_audience_selection():
+    chat_data = {-3: {TAGS_KEY: ["news"]}, -1: {}, -2: {TAGS_KEY: ["news", "dev"]}, 42: {TAGS_KEY: ["news"]}}
+    assert is_audience("all") and is_audience("tag:news")
+    assert not is_audience("tag:") and not is_audience("hello")
+    assert resolve_audience(chat_data, "all") == [-3, -2, -1]  # private chats are never broadcast to
+    assert resolve_audience(chat_data, "tag:NEWS") == [-3, -2]
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_every_chat_and_reports():
+    application = _application({-chat: {} for chat in range(1, 51)})
+    broadcaster = Broadcaster(concurrency=4, checkpoint_every=10)
+
+    job = await broadcaster.submit(application, "hello", "all", admin_chat_id=7)
+    await asyncio.gather(*broadcaster._tasks.values())
+
+    recipients = _sent_to(application)
+    assert sorted(recipients[:-1]) == sorted(job["targets"])  # each chat exactly once
+    assert recipients[-1] == 7
+    assert "50 of 50 chats reached" in application.bot.send_message.await_args.args[1]
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_chats_already_done(tmp_path):
+    persistence = SQLitePersistence(str(tmp_path / "bot.sqlite3"))
+    await persistence.save_job("abc", JOB, "main", 0)
+    application = _application({}, persistence)
+    broadcaster = Broadcaster()
+
+    assert await broadcaster.resume(application) == 1
+    await asyncio.gather(*broadcaster._tasks.values())
+
+    assert _sent_to(application) == [-1, 7]
+    assert await persistence.claim_jobs("main", float("inf")) == []
+    await persistence.flush()
+
+@pytest.mark.asyncio
+async def test_only_one_process_resumes_a_job(tmp_path):
+    path = str(tmp_path / "bot.sqlite3")
+    await SQLitePersistence(path).save_job("abc", JOB, "worker-0", 0)
+    release = asyncio.Event()
+    sent = []
+
+    async def send_message(chat_id, text):
+        sent.append(chat_id)
+        await release.wait()
+
+    broadcasters, applications = [], []
+    for index in range(3):
+        application = _application({}, SQLitePersistence(path))
+        application.bot.send_message = AsyncMock(side_effect=send_message)
+        broadcasters.append(Broadcaster(owner=f"worker-{index}"))
+        applications.append(application)
+
+    assert [await broadcaster.resume(application) for broadcaster, application in zip(broadcasters, applications)] \
+        == [1, 0, 0]
+    release.set()
+    await asyncio.gather(*broadcasters[0]._tasks.values())
+
+    assert sent == [-1, 7]
+    for application in applications:
+        await application.persistence.flush()
+
+@pytest.mark.asyncio
+async def test_audience_includes_chats_of_other_processes(tmp_path):
+    path = str(tmp_path / "bot.sqlite3")
+    other = SQLitePersistence(path)
+    await other.update_chat_data(-2, {TAGS_KEY: ["news"]})
+    await other.update_chat_data(-3, {"antispam_enabled": True})
+    await other.flush()
+    persistence = SQLitePersistence(path, chat_filter=lambda chat_id: chat_id == -1)
+    application = _application({-1: {TAGS_KEY: ["news"]}}, persistence)
+
+    assert await Broadcaster().audience(application, "all") == [-3, -2, -1]
+    assert await Broadcaster().audience(application, "tag:news") == [-2, -1]
+    await persistence.flush()
+
+@pytest.mark.asyncio
+async def test_checkpoints_are_written_before_sending_goes_on(tmp_path):
+    persistence = SQLitePersistence(str(tmp_path / "bot.sqlite3"), flush_interval=3600)
+    application = _application({-chat: {} for chat in range(1, 6)}, persistence)
+    checkpoints = []
+
+    async def send_message(chat_id, text):
+        if chat_id != 7:
+            stored = await persistence.claim_jobs("main", float("inf"))
+            checkpoints.append(len(stored[0]["done"]))
+
+    application.bot.send_message = AsyncMock(side_effect=send_message)
+    broadcaster = Broadcaster(concurrency=1, checkpoint_every=2)
+    await broadcaster.submit(application, "hello", "all", admin_chat_id=7)
+    await asyncio.gather(*broadcaster._tasks.values())
+
+    assert checkpoints == [0, 0, 2, 2, 4]
+    await persistence.flush()
+
+@pytest.mark.asyncio
+async def test_retry_after_waits_and_failures_are_summarized():
+    application = _application({-1: {}, -2: {}})
+    responses = {-1: [RetryAfter(0), None], -2: [Forbidden("bot was kicked")]}
+
+    async def send_message(chat_id, text):
+        if chat_id in responses:
+            result = responses[chat_id].pop(0)
+            if isinstance(result, Exception):
+                raise result
+
+    application.bot.send_message = AsyncMock(side_effect=send_message)
+    broadcaster = Broadcaster()
+
+    job = await broadcaster.submit(application, "hello", "all", admin_chat_id=7)
+    await asyncio.gather(*broadcaster._tasks.values())
+
+    assert job["failed"] == {-2: "Forbidden"}
+    assert broadcaster.sent == 1
+    summary = application.bot.send_message.await_args.args[1]
+    assert "1 of 2 chats reached" in summary and "Forbidden (1)" in summary
+
+@pytest.mark.asyncio
+async def test_stop_keeps_progress_for_the_next_start(tmp_path):
+    application = _application({-chat: {} for chat in range(1, 11)}, SQLitePersistence(str(tmp_path / "bot.sqlite3")))
+    release = asyncio.Event()
+
+    async def send_message(chat_id, text):
+        if chat_id == -3:
+            await release.wait()
+
+    application.bot.send_message = AsyncMock(side_effect=send_message)
+    broadcaster = Broadcaster(concurrency=1)
+    job = await broadcaster.submit(application, "hello", "all", admin_chat_id=7)
+    await asyncio.sleep(0.01)
+
+    await broadcaster.stop()
+
+    assert job["done"] == {-10, -9, -8, -7, -6, -5, -4}
+    assert broadcaster.running == 0
+    # The lease is given up, so whichever process starts next resumes the job
+    stored = await application.persistence.claim_jobs("worker-1", float("inf"))
+    assert [stored_job["done"] for stored_job in stored] == [job["done"]]
+    await application.persistence.flush()
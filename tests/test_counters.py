@@ -0,0 +1,48 @@
+import copy
+import pickle
+
+from moderation_bot.core.counters import ActivityCounter
+
+
+def test_increment_and_lookup():
+    counter = ActivityCounter()
+    assert counter.increment(42) == 1
+    assert counter.increment(42, 4) == 5
+    assert counter[42] == 5
+    assert counter.get(7) == 0
+    assert len(counter) == 1
+
+def test_top_returns_highest_counts_first():
+    counter = ActivityCounter({1: 3, 2: 10, 3: 7})
+    assert counter.top(2) == [(2, 10), (3, 7)]
+
+def test_merge_adds_counts():
+    counter = ActivityCounter({1: 3, 2: 1})
+    counter.merge(ActivityCounter({2: 4, 3: 2}))
+    assert dict(counter.items()) == {1: 3, 2: 5, 3: 2}
+
+def test_snapshot_round_trip(tmp_path):
+    counter = ActivityCounter({-1: 1, 10**12: 99})
+    path = str(tmp_path / "activity.bin")
+    counter.save(path)
+
+    restored = ActivityCounter.load(path)
+    assert restored == counter
+    assert restored.increment(10**12) == 100
+
+def test_pickle_and_deepcopy_preserve_counts():
+    counter = ActivityCounter({1: 2, 3: 4})
+    assert pickle.loads(pickle.dumps(counter)) == counter
+
+    clone = copy.deepcopy(counter)
+    clone.increment(1)
+    assert counter[1] == 2 and clone[1] == 3
+
+def test_leaderboard_tracks_overtakes():
+    counter = ActivityCounter()
+    for user_id in range(1, 8):
+        counter.increment(user_id, user_id)
+    assert [user_id for user_id, _ in counter.top()] == [7, 6, 5, 4, 3]
+
+    counter.increment(1, 10)
+    assert counter.top(2) == [(1, 11), (7, 7)]
@@ -0,0 +1,140 @@
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+
+from telegram import Update
+
+from moderation_bot.core.dedup import DONE, PROCESSING, UpdateDeduplicator
+from moderation_bot.core.persistence import SQLitePersistence
+from moderation_bot.core.processor import ChatShardedUpdateProcessor
+
+
+def _update(update_id, chat_id=-100):
+    update = MagicMock(spec=Update)
+    update.update_id = update_id
+    update.effective_chat.id = chat_id
+    return update
+
+def test_redelivered_update_is_rejected():
+    dedup = UpdateDeduplicator()
+    assert dedup.begin(1)
+    assert not dedup.begin(1)  # retried while still processing
+    assert dedup.state(1) == PROCESSING
+
+    dedup.finish(1)
+    assert dedup.state(1) == DONE
+    assert not dedup.begin(1)  # retried after it was handled
+    assert dedup.duplicates == 2
+
+def test_failed_update_can_be_retried():
+    dedup = UpdateDeduplicator()
+    dedup.begin(1)
+    dedup.finish(1, success=False)
+    assert dedup.begin(1)
+
+def test_window_evicts_oldest_ids():
+    dedup = UpdateDeduplicator(window=2)
+    for update_id in (1, 2, 3):
+        dedup.begin(update_id)
+        dedup.finish(update_id)
+
+    assert dedup.state(1) is None
+    assert dedup.state(3) == DONE
+    assert len(dedup._states) == 2
+
+def test_watermark_stays_below_updates_in_flight():
+    dedup = UpdateDeduplicator()
+    for update_id in (10, 11, 12):
+        dedup.begin(update_id)
+    dedup.finish(12)
+    dedup.finish(10)
+
+    assert dedup.watermark() == 10
+    dedup.finish(11)
+    assert dedup.watermark() == 12
+
+def test_restore_skips_already_handled_updates():
+    dedup = UpdateDeduplicator(clock=lambda: 1000.0)
+    dedup.restore((50, 900.0))
+
+    assert not dedup.begin(49)
+    assert not dedup.begin(50)
+    assert dedup.begin(51)
+    assert dedup.watermark() == 50
+
+def test_stale_checkpoint_is_ignored():
+    # After a week without updates Telegram may restart from a lower, random update ID
+    dedup = UpdateDeduplicator(clock=lambda: 8 * 86400.0)
+    dedup.restore((50, 0.0))
+
+    assert dedup.begin(7)
+    assert dedup.watermark() == 0
+
+def test_checkpoint_time_only_moves_with_the_watermark():
+    now = [100.0]
+    dedup = UpdateDeduplicator(clock=lambda: now[0])
+    dedup.begin(1)
+    dedup.finish(1)
+    assert dedup.checkpoint() == (1, 100.0)
+    now[0] = 200.0
+    assert dedup.checkpoint() == (1, 100.0)
+    dedup.begin(2)
+    dedup.finish(2)
+    assert dedup.checkpoint() == (2, 200.0)
+
+@pytest.mark.asyncio
+async def test_processor_runs_redelivered_update_once():
+    processor = ChatShardedUpdateProcessor(shards=2, deduplicator=UpdateDeduplicator())
+    await processor.initialize()
+    runs = []
+
+    async def handle():
+        await asyncio.sleep(0.01)
+        runs.append(1)
+
+    await asyncio.gather(
+        processor.process_update(_update(7), handle()),
+        processor.process_update(_update(7), handle()),
+    )
+    await processor.process_update(_update(7), handle())
+    await processor.shutdown()
+
+    assert runs == [1]
+    assert processor.deduplicator.watermark() == 7
+
+def test_watermark_waits_for_the_lowest_update_in_flight_across_shards():
+    dedup = UpdateDeduplicator()
+    for update_id in (20, 21, 22, 23):
+        dedup.begin(update_id)
+    # Shards finish out of order: 21 and 23 are done while 20 and 22 still run
+    dedup.finish(23)
+    dedup.finish(21)
+    assert dedup.watermark() == 19
+    dedup.finish(20)
+    assert dedup.watermark() == 21
+    dedup.finish(22)
+    assert dedup.watermark() == 23
+
+@pytest.mark.asyncio
+async def test_watermark_is_persisted_when_a_batch_is_written(tmp_path):
+    path = str(tmp_path / "bot.sqlite3")
+    dedup = UpdateDeduplicator(clock=lambda: 100.0)
+    persistence = SQLitePersistence(path)
+    persistence.register_state(dedup.state_key, dedup.checkpoint)
+    for update_id in (1, 2, 3):
+        dedup.begin(update_id)
+        dedup.finish(update_id)
+    # Processing updates writes nothing by itself
+    assert persistence.flushes == 0
+
+    await persistence.update_chat_data(-100, {"nobots_enabled": True})
+    await persistence._flush_pending()
+    assert await persistence.get_state(dedup.state_key) == (3, 100.0)
+    dedup.begin(4)
+    dedup.finish(4)
+    await persistence.flush()
+
+    reloaded = SQLitePersistence(path)
+    assert await reloaded.get_state(dedup.state_key) == (4, 100.0)
+    assert await reloaded.get_state("missing", 0) == 0
+    await reloaded.flush()
@@ -0,0 +1,80 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+
+from moderation_bot.core.deletion import DeletionBatcher
+
+
+@pytest.mark.asyncio
+async def test_messages_are_deleted_in_one_call_after_window():
+    batcher = DeletionBatcher(window=0.01)
+    bot = AsyncMock()
+    bot.delete_messages.return_value = True
+
+    for message_id in (1, 2, 3):
+        batcher.schedule(bot, -100, message_id)
+    bot.delete_messages.assert_not_awaited()
+
+    await asyncio.sleep(0.05)
+    bot.delete_messages.assert_awaited_once_with(-100, [1, 2, 3])
+    assert batcher.stats()["max_batch_size"] == 3
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_immediately():
+    batcher = DeletionBatcher(window=60, max_batch=2)
+    bot = AsyncMock()
+    bot.delete_messages.return_value = True
+
+    batcher.schedule(bot, -100, 1)
+    batcher.schedule(bot, -100, 2)
+    await asyncio.sleep(0)
+
+    bot.delete_messages.assert_awaited_once_with(-100, [1, 2])
+
+@pytest.mark.asyncio
+async def test_failed_bulk_delete_falls_back_to_single_deletes():
+    batcher = DeletionBatcher()
+    bot = AsyncMock()
+    bot.delete_messages.side_effect = Exception("Bad Request")
+    bot.delete_message.side_effect = [True, Exception("message to delete not found")]
+
+    failed = await batcher.delete_now(bot, -100, [1, 2])
+
+    assert failed == 1
+    assert bot.delete_message.await_count == 2
+    assert batcher.stats()["fallbacks"] == 1
+
+@pytest.mark.asyncio
+async def test_purge_sends_bounded_concurrent_chunks():
+    batcher = DeletionBatcher()
+    in_flight = peak = 0
+
+    async def delete_messages(chat_id, message_ids):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return True
+
+    bot = AsyncMock()
+    bot.delete_messages.side_effect = delete_messages
+    progress = AsyncMock()
+
+    failed = await batcher.purge(bot, -100, list(range(1, 5001)), concurrency=4, progress=progress)
+
+    assert failed == 0
+    assert bot.delete_messages.await_count == 50
+    assert all(len(call.args[1]) == 100 for call in bot.delete_messages.await_args_list)
+    assert peak == 4
+    assert progress.await_args.args == (5000, 5000)
+    bot.delete_message.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_purge_counts_failed_chunks_without_falling_back():
+    batcher = DeletionBatcher()
+    bot = AsyncMock()
+    bot.delete_messages.side_effect = [True, RuntimeError("not enough rights")]
+
+    assert await batcher.purge(bot, -100, list(range(150)), concurrency=1) == 50
+    bot.delete_message.assert_not_awaited()
@@ -0,0 +1,161 @@
+import asyncio
+from collections import defaultdict
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from moderation_bot.core.expiry import (
+    EXPIRIES_KEY, MAX_ATTEMPTS, MAX_RETRY_DELAY, RETRY_DELAY, UNBAN, UNMUTE, ExpiryScheduler, format_duration,
+    parse_duration,
+)
+
+
+def _application(chat_data=None):
+    application = MagicMock()
+    application.chat_data = defaultdict(dict, chat_data or {})
+    application.bot = AsyncMock()
+    application.job_queue = None
+    return application
+
+def test_parse_duration():
+    assert parse_duration("90s") == 90
+    assert parse_duration("10m") == 600
+    assert parse_duration("1d12h") == 129600
+    assert parse_duration("2W") == 14 * 86400
+    for invalid in ("", "10", "m", "10x", "1h 2m", "0m", "400d"):
+        assert parse_duration(invalid) is None
+    assert format_duration(129600) == "1d12h"
+
+@pytest.mark.asyncio
+async def test_missed_expiries_are_lifted_in_one_batch_at_startup():
+    now = [1000.0]
+    application = _application()
+    scheduler = ExpiryScheduler(clock=lambda: now[0])
+    await scheduler.start(application)
+    for user_id in range(100):
+        scheduler.schedule(-1, user_id, UNMUTE, 60)
+    scheduler.schedule(-1, 500, UNBAN, 3600)
+    scheduler.stop()
+
+    # The bot restarts after 10 minutes with chat_data loaded from persistence
+    now[0] += 600
+    restarted = ExpiryScheduler(clock=lambda: now[0])
+    application = _application(application.chat_data)
+    try:
+        assert await restarted.start(application) == 100
+    finally:
+        restarted.stop()
+
+    assert application.bot.restrict_chat_member.await_count == 100
+    application.bot.unban_chat_member.assert_not_awaited()
+    assert len(restarted) == 1
+    assert application.chat_data[-1][EXPIRIES_KEY] == {(500, UNBAN): 4600.0}
+
+@pytest.mark.asyncio
+async def test_expiries_are_kept_in_their_chats_data():
+    application = _application()
+    scheduler = ExpiryScheduler(clock=lambda: 0.0)
+    await scheduler.start(application)
+    scheduler.schedule(-1, 1, UNMUTE, 60)
+    scheduler.schedule(-2, 1, UNBAN, 120)
+    scheduler.stop()
+
+    assert application.chat_data == {-1: {EXPIRIES_KEY: {(1, UNMUTE): 60.0}}, -2: {EXPIRIES_KEY: {(1, UNBAN): 120.0}}}
+    application.mark_data_for_update_persistence.assert_any_call(chat_ids=-2)
+
+    # A process that owns only chat -2 only lifts chat -2's restrictions
+    owner = _application({-2: application.chat_data[-2]})
+    scheduler = ExpiryScheduler(clock=lambda: 500.0)
+    try:
+        assert await scheduler.start(owner) == 1
+    finally:
+        scheduler.stop()
+    owner.bot.unban_chat_member.assert_awaited_once_with(-2, 1, only_if_banned=True)
+    owner.bot.restrict_chat_member.assert_not_awaited()
+    assert EXPIRIES_KEY not in owner.chat_data[-2]
+
+@pytest.mark.asyncio
+async def test_failed_lifts_are_retried_with_backoff():
+    now = [0.0]
+    application = _application()
+    application.bot.unban_chat_member.side_effect = [RuntimeError("network"), RuntimeError("network"), True]
+    scheduler = ExpiryScheduler(clock=lambda: now[0])
+    await scheduler.start(application)
+    try:
+        scheduler.schedule(-1, 1, UNBAN, 60)
+        now[0] = 60
+        assert await scheduler._run_due() == 1
+        assert application.chat_data[-1][EXPIRIES_KEY] == {(1, UNBAN): 60 + RETRY_DELAY}
+
+        now[0] = 60 + RETRY_DELAY
+        assert await scheduler._run_due() == 1
+        assert application.chat_data[-1][EXPIRIES_KEY] == {(1, UNBAN): 60 + 3 * RETRY_DELAY}
+
+        now[0] = 60 + 3 * RETRY_DELAY
+        assert await scheduler._run_due() == 1
+    finally:
+        scheduler.stop()
+
+    assert application.bot.unban_chat_member.await_count == 3
+    assert (scheduler.failed, scheduler.lifted, len(scheduler)) == (2, 1, 0)
+    assert EXPIRIES_KEY not in application.chat_data[-1]
+
+@pytest.mark.asyncio
+async def test_lifts_are_given_up_after_max_attempts():
+    now = [0.0]
+    application = _application()
+    application.bot.restrict_chat_member.side_effect = RuntimeError("bot was kicked")
+    scheduler = ExpiryScheduler(clock=lambda: now[0])
+    await scheduler.start(application)
+    try:
+        scheduler.schedule(-1, 1, UNMUTE, 60)
+        for _ in range(MAX_ATTEMPTS):
+            now[0] += MAX_RETRY_DELAY
+            await scheduler._run_due()
+    finally:
+        scheduler.stop()
+
+    assert application.bot.restrict_chat_member.await_count == MAX_ATTEMPTS
+    assert len(scheduler) == 0
+    assert EXPIRIES_KEY not in application.chat_data[-1]
+
+@pytest.mark.asyncio
+async def test_single_timer_fires_for_each_due_time():
+    application = _application()
+    scheduler = ExpiryScheduler()
+    await scheduler.start(application)
+    try:
+        scheduler.schedule(-1, 1, UNBAN, 0.05)
+        scheduler.schedule(-1, 2, UNBAN, 0.01)
+        scheduler.schedule(-1, 3, UNBAN, 0.01)
+        await asyncio.sleep(0.03)
+        assert application.bot.unban_chat_member.await_count == 2
+
+        await asyncio.sleep(0.05)
+        application.bot.unban_chat_member.assert_awaited_with(-1, 1, only_if_banned=True)
+        assert len(scheduler) == 0
+    finally:
+        scheduler.stop()
+
+@pytest.mark.asyncio
+async def test_rescheduling_supersedes_and_cancel_forgets():
+    now = [0.0]
+    application = _application()
+    scheduler = ExpiryScheduler(clock=lambda: now[0])
+    await scheduler.start(application)
+    try:
+        scheduler.schedule(-1, 1, UNMUTE, 10)
+        scheduler.schedule(-1, 1, UNMUTE, 100)  # the mute was extended
+        scheduler.schedule(-1, 2, UNBAN, 10)
+        assert scheduler.cancel(-1, 2, UNBAN)
+        assert not scheduler.cancel(-1, 2, UNBAN)
+
+        now[0] = 50
+        assert await scheduler._run_due() == 0
+        now[0] = 100
+        assert await scheduler._run_due() == 1
+    finally:
+        scheduler.stop()
+
+    application.bot.restrict_chat_member.assert_awaited_once()
+    application.bot.unban_chat_member.assert_not_awaited()
@@ -0,0 +1,128 @@
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from moderation_bot.core.matcher import AhoCorasick
+from moderation_bot.handlers.filters import add_filter, stop_filter, apply_filters
+
+
+def test_matcher_finds_all_occurrences():
+    matcher = AhoCorasick(["he", "she", "hers", "his"])
+    assert sorted(matcher.iter_matches("ushers")) == [(1, "she"), (2, "he"), (2, "hers")]
+
+def test_matcher_prefers_earliest_then_longest_trigger():
+    matcher = AhoCorasick(["world", "hello", "hello there"])
+    assert matcher.find_first("say hello there world") == "hello there"
+    assert matcher.find_first("world, hello") == "world"
+    assert matcher.find_first("nothing to see") is None
+
+def test_matcher_is_independent_of_insertion_order():
+    text = "buy cheap crypto now"
+    assert AhoCorasick(["crypto", "cheap"]).find_first(text) == AhoCorasick(["cheap", "crypto"]).find_first(text)
+
+@pytest.fixture
+def filter_update_context():
+    update = AsyncMock()
+    update.effective_chat.id = -100
+    context = AsyncMock()
+    context.chat_data = {}
+    return update, context
+
+@pytest.mark.asyncio
+async def test_apply_filters_replies_with_first_trigger(filter_update_context):
+    update, context = filter_update_context
+    context.chat_data['filters'] = {'price': 'See the pinned message.', 'buy': 'No trading here.'}
+    update.message.text = "Where can I BUY it and what is the price?"
+
+    await apply_filters(update, context)
+
+    update.message.reply_text.assert_awaited_once_with('No trading here.')
+
+@pytest.mark.asyncio
+async def test_apply_filters_picks_up_filter_changes(filter_update_context):
+    update, context = filter_update_context
+    update.message.text = "gm everyone"
+
+    with patch('moderation_bot.handlers.filters._is_user_admin', new=AsyncMock(return_value=True)):
+        context.args = ['gm', 'Good morning!']
+        await add_filter(update, context)
+        await apply_filters(update, context)
+        update.message.reply_text.assert_awaited_with('Good morning!')
+
+        context.args = ['gm']
+        await stop_filter(update, context)
+        update.message.reply_text.reset_mock()
+        await apply_filters(update, context)
+        update.message.reply_text.assert_not_awaited()
+
+def test_engine_honours_trigger_types():
+    from moderation_bot.core.triggers import FilterEngine
+
+    engine = FilterEngine(["word:hi", "prefix:buy", r"re:\bmoon\w*", "glob:free*coins", "gm"])
+    assert engine.find_first("ghi there") is None
+    assert engine.find_first("oh hi there") == "word:hi"
+    assert engine.find_first("anyone buying?") == "prefix:buy"
+    assert engine.find_first("rebuy") is None
+    assert engine.find_first("to the MOONING") == r"re:\bmoon\w*"
+    assert engine.find_first("get free shiny coins") == "glob:free*coins"
+    assert engine.find_first("gm, free coins") == "gm"
+
+def test_regex_triggers_reject_catastrophic_patterns():
+    from moderation_bot.core.triggers import TriggerError, validate_trigger
+
+    validate_trigger(r"re:(buy|sell)\s+now")
+    validate_trigger(r"re:(?s:a.b)")
+    for pattern in ["re:(a+)+b", r"re:(\w+\s?)*x", r"re:(a)\1", "re:(?P<x>a)", "re:(", "re:(?i)spam",
+                    "glob:*a*a*a*a*a*b"]:
+        with pytest.raises(TriggerError):
+            validate_trigger(pattern)
+
+def test_trigger_is_validated_together_with_the_chats_other_patterns():
+    from moderation_bot.core.triggers import FilterEngine, TriggerError, validate_trigger
+
+    existing = {"re:spam": "no", "glob:free*coins": "no", "gm": "gm"}
+    validate_trigger(r"re:\bmoon\w*", existing)
+    # Fast on their own, slow once they share one alternation
+    validate_trigger(r"re:\w*\w*\w*\w*!")
+    with pytest.raises(TriggerError):
+        validate_trigger(r"re:\w*\w*\w*\w*!", {"re:(a|a)*b": "no"})
+    # A legacy trigger with a global flag is skipped instead of breaking the whole chat
+    engine = FilterEngine(["re:(?i)spam", "re:eggs"])
+    assert engine.find_first("green eggs") == "re:eggs"
+
+def test_slow_regex_is_cut_off_and_switched_off_for_the_chat():
+    from moderation_bot.core import triggers
+
+    # Stored before validation existed: quartic backtracking on a long run of "a"
+    engine = triggers.FilterEngine(["glob:*a*a*a*a*b", "re:spam"])
+    slow = "a" * 2000
+    for _ in range(triggers.SLOW_REGEX_STRIKES):
+        started = time.perf_counter()
+        assert engine.find_first(slow) is None
+        assert time.perf_counter() - started < 10 * triggers.REGEX_TIMEOUT
+    assert not engine.regex_enabled
+    assert engine.find_first("spam") is None
+
+@pytest.mark.asyncio
+async def test_add_filter_rejects_bad_regex(filter_update_context):
+    update, context = filter_update_context
+
+    with patch('moderation_bot.handlers.filters._is_user_admin', new=AsyncMock(return_value=True)):
+        context.args = ['re:(a+)+$', 'Gotcha']
+        await add_filter(update, context)
+
+    assert 'filters' not in context.chat_data
+    assert update.message.reply_text.await_args.args[0].startswith("❌")
+
+@pytest.mark.asyncio
+async def test_regex_triggers_keep_their_case(filter_update_context):
+    update, context = filter_update_context
+    update.message.text = "hello   world"
+
+    with patch('moderation_bot.handlers.filters._is_user_admin', new=AsyncMock(return_value=True)):
+        context.args = [r're:hello\W+world', 'Hi!']
+        await add_filter(update, context)
+        await apply_filters(update, context)
+
+    assert r're:hello\W+world' in context.chat_data['filters']
+    update.message.reply_text.assert_awaited_with('Hi!')
@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from moderation_bot.core.flood import FloodDetector
+from moderation_bot.handlers.spam import check_flood
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_detector_flags_messages_over_the_limit():
+    clock = FakeClock()
+    detector = FloodDetector(limit=3, window=2.0, clock=clock)
+
+    results = []
+    for _ in range(4):
+        results.append(detector.hit(-100, 1))
+        clock.now += 0.1
+
+    assert results == [False, False, False, True]
+
+def test_detector_window_slides():
+    clock = FakeClock()
+    detector = FloodDetector(limit=2, window=1.0, clock=clock)
+
+    for _ in range(6):
+        assert not detector.hit(-100, 1)
+        clock.now += 0.6
+
+def test_detector_tracks_users_and_chats_separately():
+    clock = FakeClock()
+    detector = FloodDetector(limit=1, window=10, clock=clock)
+
+    assert not detector.hit(-100, 1)
+    assert not detector.hit(-100, 2)
+    assert not detector.hit(-200, 1)
+    assert detector.hit(-100, 1)
+
+def test_muted_users_are_not_reported_again():
+    clock = FakeClock()
+    detector = FloodDetector(limit=1, window=10, clock=clock)
+    detector.hit(-100, 1)
+    assert detector.hit(-100, 1)
+
+    detector.mute(-100, 1, 60)
+    assert not detector.hit(-100, 1)
+
+def test_idle_users_are_evicted():
+    clock = FakeClock()
+    detector = FloodDetector(limit=3, window=1.0, clock=clock)
+    for user_id in range(100):
+        detector.hit(-100, user_id)
+    clock.now += 5
+
+    for _ in range(60):
+        detector.hit(-100, 1000)
+
+    assert len(detector) < 100
+
+def test_detector_respects_max_users():
+    detector = FloodDetector(limit=3, window=60, max_users=10, clock=FakeClock())
+    for user_id in range(50):
+        detector.hit(-100, user_id)
+    assert len(detector) == 10
+
+@pytest.mark.asyncio
+async def test_check_flood_restricts_offender():
+    update, context = AsyncMock(), AsyncMock()
+    update.effective_chat.id = -100
+    update.effective_user.id = 7
+    update.message.sender_chat = None
+    context.bot.id = 1
+    context.chat_data = {'antiflood_enabled': True}
+    detector = MagicMock()
+    detector.hit.return_value = True
+
+    with patch('moderation_bot.handlers.spam.flood_detector', detector), \
+            patch('moderation_bot.handlers.spam._is_user_admin', new=AsyncMock(return_value=False)):
+        await check_flood(update, context)
+
+    context.bot.restrict_chat_member.assert_awaited_once()
+    assert context.bot.restrict_chat_member.await_args.args == (-100, 7)
+    detector.mute.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_check_flood_spares_admins():
+    update, context = AsyncMock(), AsyncMock()
+    update.effective_user.id = 7
+    update.message.sender_chat = None
+    context.bot.id = 1
+    context.chat_data = {'antiflood_enabled': True}
+    detector = MagicMock()
+    detector.hit.return_value = True
+
+    with patch('moderation_bot.handlers.spam.flood_detector', detector), \
+            patch('moderation_bot.handlers.spam._is_user_admin', new=AsyncMock(return_value=True)):
+        await check_flood(update, context)
+
+    context.bot.restrict_chat_member.assert_not_awaited()
+
+def test_only_user_posting_after_the_window_is_kept():
+    clock = FakeClock()
+    detector = FloodDetector(limit=1, window=1.0, clock=clock)
+    detector.hit(-100, 1)
+    clock.now += 5
+
+    assert not detector.hit(-100, 1)
+    assert len(detector) == 1
+    clock.now += 0.1
+    assert detector.hit(-100, 1)
+
+def test_returning_user_keeps_their_ring():
+    clock = FakeClock()
+    detector = FloodDetector(limit=1, window=1.0, clock=clock)
+    detector.hit(-100, 1)
+    detector.hit(-100, 2)
+    clock.now += 5
+    # Evicting idle user 2 leaves user 1 at the front with a stale timestamp
+    assert not detector.hit(-100, 1)
+    clock.now += 0.1
+
+    assert detector.hit(-100, 1)
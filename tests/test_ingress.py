@@ -0,0 +1,106 @@
+import pytest
+import json
+import multiprocessing
+import queue
+from unittest.mock import AsyncMock, MagicMock
+
+from moderation_bot.core.admin_cache import AdminCache
+from moderation_bot.core.coordination import LocalCoordinator, SharedCoordinator
+from moderation_bot.core.ingress import WebhookIngress, update_chat_id, worker_index, worker_persistence
+from moderation_bot.core.persistence import SQLitePersistence
+
+
+def _bump_in_child(coordinator, key):
+    coordinator.bump(key)
+    coordinator.block(60)
+
+
+def test_update_chat_id_finds_chat_or_user():
+    assert update_chat_id({"update_id": 1, "message": {"chat": {"id": -100}}}) == -100
+    assert update_chat_id({"update_id": 2, "chat_member": {"chat": {"id": -200}}}) == -200
+    assert update_chat_id({"update_id": 3, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": -300}}}}) == -300
+    assert update_chat_id({"update_id": 4, "inline_query": {"from": {"id": 7}}}) == 7
+    assert update_chat_id({"update_id": 5}) == 0
+
+def test_dispatch_routes_each_chat_to_one_worker_in_order():
+    ingress = WebhookIngress("token", workers=3, coordinator=LocalCoordinator())
+    ingress._inboxes = [queue.Queue() for _ in range(3)]
+    bodies = [json.dumps({"update_id": i, "message": {"chat": {"id": -100 - i % 4}}}).encode() for i in range(12)]
+
+    assert [ingress.dispatch(body) for body in bodies] == [200] * 12
+
+    for index, inbox in enumerate(ingress._inboxes):
+        routed = [json.loads(inbox.get_nowait()) for _ in range(inbox.qsize())]
+        for update in routed:
+            assert worker_index(update["message"]["chat"]["id"], 3) == index
+        ids = [update["update_id"] for update in routed]
+        assert ids == sorted(ids)
+
+def test_dispatch_rejects_bad_bodies_and_full_queues():
+    ingress = WebhookIngress("token", workers=1, coordinator=LocalCoordinator())
+    ingress._inboxes = [queue.Queue(maxsize=1)]
+    body = json.dumps({"update_id": 1, "message": {"chat": {"id": -1}}}).encode()
+
+    assert ingress.dispatch(b"not json") == 400
+    assert ingress.dispatch(body) == 200
+    assert ingress.dispatch(body) == 503
+    assert ingress.rejected == 2
+
+def test_secret_token_check():
+    ingress = WebhookIngress("token", workers=1, coordinator=LocalCoordinator(), secret_token="s3cret")
+    assert ingress.check_secret("s3cret")
+    assert not ingress.check_secret("wrong")
+    assert not ingress.check_secret(None)
+
+@pytest.mark.asyncio
+async def test_worker_persistence_loads_owned_chats_and_leaves_bot_data_to_the_primary(tmp_path):
+    path = str(tmp_path / "bot.sqlite3")
+    seed = SQLitePersistence(path)
+    for chat_id in (-1, -2, -3, -4):
+        await seed.update_chat_data(chat_id, {"nobots_enabled": True})
+    await seed.update_bot_data({"shared": 1})
+    await seed.flush()
+
+    primary, other = worker_persistence(path, 0, 2), worker_persistence(path, 1, 2)
+    assert set(await primary.get_chat_data()) == {-2, -4}
+    assert set(await other.get_chat_data()) == {-1, -3}
+    assert primary.store_data.bot_data and primary.store_data.user_data
+    assert not other.store_data.bot_data and not other.store_data.user_data
+    await primary.flush()
+    await other.flush()
+
+def test_local_coordinator_enforces_global_budget():
+    coordinator = LocalCoordinator(global_rate=2)
+    assert coordinator.try_acquire() == 0
+    assert coordinator.try_acquire() == 0
+    assert coordinator.try_acquire() > 0
+
+    coordinator.block(10)
+    assert coordinator.try_acquire() > 9
+
+def test_shared_coordinator_is_visible_across_processes():
+    context = multiprocessing.get_context("spawn")
+    coordinator = SharedCoordinator(context=context)
+    process = context.Process(target=_bump_in_child, args=(coordinator, -100))
+    process.start()
+    process.join(30)
+
+    assert process.exitcode == 0
+    assert coordinator.generation(-100) == 1
+    assert coordinator.try_acquire() > 50
+
+@pytest.mark.asyncio
+async def test_admin_cache_honors_invalidations_from_other_processes():
+    coordinator = LocalCoordinator()
+    cache = AdminCache(coordinator=coordinator)
+    bot = AsyncMock()
+    bot.get_chat_administrators.return_value = [MagicMock(user=MagicMock(id=1))]
+
+    await cache.get_admin_ids(bot, -100)
+    await cache.get_admin_ids(bot, -100)
+    assert bot.get_chat_administrators.await_count == 1
+
+    # Another worker invalidates the chat
+    coordinator.bump(-100)
+    await cache.get_admin_ids(bot, -100)
+    assert bot.get_chat_administrators.await_count == 2
@@ -0,0 +1,93 @@
+import copy
+import pickle
+
+from moderation_bot.core.ledger import WARNINGS_KEY, WarningLedger, get_warning_ledger
+
+
+def test_warnings_expire_after_the_window():
+    now = [0.0]
+    ledger = WarningLedger(window=100, clock=lambda: now[0])
+    assert ledger.add(1, 9, "spam") == 1
+    now[0] = 60
+    assert ledger.add(1, 9, "links") == 2
+    assert ledger.add(2, 9, "flood") == 1
+
+    now[0] = 101
+    assert ledger.count(1) == 1
+    assert ledger.warnings(1) == [(60, 9, "links")]
+    now[0] = 161
+    assert ledger.count(1) == 0
+    assert ledger.warnings(1) == []
+
+def test_reset_only_touches_the_user():
+    ledger = WarningLedger()
+    ledger.add(1, 9, "a")
+    ledger.add(1, 9, "b")
+    ledger.add(2, 9, "c")
+    assert ledger.reset(1) == 2
+    assert ledger.reset(1) == 0
+    assert ledger.count(2) == 1
+    assert len(ledger) == 1
+
+def test_log_is_compacted_once_dead_rows_dominate():
+    ledger = WarningLedger()
+    for user_id in range(5000):
+        ledger.add(user_id, 9, "spam")
+        ledger.reset(user_id)
+    ledger.add(1, 9, "kept")
+    assert len(ledger._log) < 2100
+    assert ledger.warnings(1)[0][2] == "kept"
+
+def test_expired_warnings_of_users_who_never_return_stop_counting():
+    now = [0.0]
+    ledger = WarningLedger(window=100, clock=lambda: now[0])
+    for user_id in range(3000):
+        ledger.add(user_id, 9, "spam")
+    now[0] = 50
+    ledger.add(5000, 9, "later")
+    ledger.reset(5000)
+    ledger.add(5000, 9, "again")
+
+    now[0] = 120
+    assert len(ledger) == 1
+    now[0] = 200
+    ledger.add(1, 9, "back")
+    assert len(ledger) == 1
+    assert len(ledger._log) < 2100  # the expired rows were compacted away
+    assert ledger.warnings(1) == [(200, 9, "back")]
+
+def test_pickle_and_deepcopy_keep_only_live_warnings():
+    ledger = WarningLedger(limit=5)
+    ledger.add(1, 9, "a")
+    ledger.add(2, 9, "b")
+    ledger.reset(1)
+
+    for restored in (pickle.loads(pickle.dumps(ledger)), copy.deepcopy(ledger)):
+        assert restored.limit == 5
+        assert restored.count(1) == 0
+        assert [reason for _, _, reason in restored.warnings(2)] == ["b"]
+        assert len(restored._log) == 1
+        restored.add(3, 9, "c")
+    assert ledger.count(3) == 0
+
+def test_get_warning_ledger_creates_it_once():
+    chat_data = {}
+    ledger = get_warning_ledger(chat_data)
+    assert chat_data[WARNINGS_KEY] is ledger
+    assert get_warning_ledger(chat_data) is ledger
+
+def test_version_moves_with_every_change():
+    ledger = WarningLedger()
+    versions = [ledger.version]
+    ledger.add(1, 9, "spam")
+    versions.append(ledger.version)
+    ledger.count(1)
+    ledger.reset(2)  # nothing to reset
+    versions.append(ledger.version)
+    ledger.reset(1)
+    versions.append(ledger.version)
+    ledger.configure(5, 3600, "ban", None)
+    versions.append(ledger.version)
+
+    assert versions[1] == versions[2]
+    assert len({versions[0], versions[1], versions[3], versions[4]}) == 4
@@ -0,0 +1,92 @@
+import io
+import json
+import logging
+
+import pytest
+import structlog
+
+from moderation_bot.core.logsink import EventSampler, QueueLogSink, QueueLoggerFactory, capture_exc_info, parse_sampling, stamp
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _logger(sink, sampler, level=logging.INFO):
+    return structlog.wrap_logger(
+        QueueLoggerFactory(sink)(),
+        processors=[structlog.processors.add_log_level, sampler, capture_exc_info, stamp],
+        wrapper_class=structlog.make_filtering_bound_logger(level),
+    )
+
+
+def test_sampler_keeps_the_configured_fraction():
+    draws = iter([0.5, 0.001, 0.9])
+    sampler = EventSampler({"hot": (0.01, None)}, random=lambda: next(draws))
+
+    kept = []
+    for _ in range(3):
+        try:
+            kept.append(sampler(None, "debug", {"event": "hot"}))
+        except structlog.DropEvent:
+            pass
+
+    assert kept == [{"event": "hot", "sampled": 0.01}]
+    assert sampler.dropped == {"hot": 2}
+
+def test_sampler_rate_limits_per_second():
+    clock = FakeClock()
+    sampler = EventSampler({"hit": (1.0, 2)}, clock=clock)
+
+    def passes():
+        try:
+            sampler(None, "info", {"event": "hit"})
+            return True
+        except structlog.DropEvent:
+            return False
+
+    assert [passes() for _ in range(4)] == [True, True, False, False]
+    clock.now += 1
+    assert passes()
+
+def test_sampler_ignores_other_events():
+    sampler = EventSampler({"hot": (0.0, None)})
+    assert sampler(None, "info", {"event": "User banned"}) == {"event": "User banned"}
+
+def test_parse_sampling():
+    assert parse_sampling("Tracked activity=0.01:10; Filter applied=1") == {
+        "Tracked activity": (0.01, 10),
+        "Filter applied": (1.0, None),
+    }
+
+def test_sink_renders_json_on_its_thread():
+    out = io.StringIO()
+    sink = QueueLogSink(file=out)
+    log = _logger(sink, EventSampler({}))
+
+    log.info("User banned", chat_id=-100)
+    log.debug("Tracked activity")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.error("Failed", exc_info=True)
+    sink.close()
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line["event"] for line in lines] == ["User banned", "Failed"]
+    assert lines[0]["level"] == "info" and lines[0]["chat_id"] == -100
+    assert lines[0]["timestamp"].endswith("+00:00")
+    assert "ValueError: boom" in lines[1]["exception"]
+
+def test_sink_drops_instead_of_blocking_when_full():
+    sink = QueueLogSink(file=io.StringIO(), max_queue=1)
+    sink._thread = object()  # pretend the writer is running but stuck
+
+    sink.put("info", {"event": "a"})
+    sink.put("info", {"event": "b"})
+
+    assert sink.dropped == 1
@@ -9,6 +9,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from moderation_bot.handlers.members import welcome_new_member
+from moderation_bot.core.welcome import welcome_batcher
 
 @pytest.mark.asyncio
 async def test_welcome_new_member():
@@ -26,6 +27,7 @@ async def test_welcome_new_member():
     # Mock random.choice to return a predictable initiate name
     with patch('random.choice', return_value="TestInitiateName"):
         await welcome_new_member(update, context)
+        await welcome_batcher.flush_all()
 
     expected_welcome_text_pattern = (
         r"Yoh-koh-so, NewUser! ☠️\n\n"
@@ -49,6 +51,7 @@ async def test_no_welcome_for_existing_member():
     update.chat_member.difference = MagicMock(return_value={"status": (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR)})
 
     await welcome_new_member(update, context)
+    await welcome_batcher.flush_all()
 
     update.effective_chat.send_message.assert_not_called()
 
@@ -67,6 +70,7 @@ async def test_welcome_new_member_custom_message():
     context.chat_data = {'welcome_message': 'Hello, {username}! Welcome aboard!'}
 
     await welcome_new_member(update, context)
+    await welcome_batcher.flush_all()
 
     update.effective_chat.send_message.assert_called_once_with(
         "Hello, CustomUser! Welcome aboard!",
@@ -89,6 +93,7 @@ async def test_welcome_new_member_with_initiate_name():
     # Mock random.choice to return a predictable initiate name
     with patch('random.choice', return_value="TestInitiateName"):
         await welcome_new_member(update, context)
+        await welcome_batcher.flush_all()
 
     expected_welcome_text_pattern = (
         r"Yoh-koh-so, NewUser! ☠️\n\n"
@@ -102,3 +107,33 @@ async def test_welcome_new_member_with_initiate_name():
     actual_message = update.effective_chat.send_message.call_args[0][0]
     assert re.fullmatch(expected_welcome_text_pattern, actual_message) # Using re.fullmatch for exact match
     assert update.effective_chat.send_message.call_args[1]['parse_mode'] == 'HTML'
+
+@pytest.mark.asyncio
+async def test_join_burst_gets_one_welcome():
+    """Test that joins within the window are greeted together."""
+    update = AsyncMock()
+    update.effective_chat.id = -100
+    context = AsyncMock()
+    context.chat_data = {'welcome_message': 'Welcome {username}!'}
+    update.chat_member.difference = MagicMock(return_value={"status": (ChatMemberStatus.LEFT, ChatMemberStatus.MEMBER)})
+
+    for name in ("Ann", "Bob", "Cid"):
+        update.chat_member.new_chat_member.user = MagicMock(mention_html=MagicMock(return_value=name))
+        await welcome_new_member(update, context)
+    await welcome_batcher.flush_all()
+
+    update.effective_chat.send_message.assert_called_once_with("Welcome Ann, Bob, Cid!", parse_mode='HTML')
+
+def test_welcome_is_split_at_the_length_limit():
+    """Test that long mention lists are spread over several messages."""
+    from moderation_bot.core.welcome import WelcomeTemplate, pack_mentions
+
+    template = WelcomeTemplate("Hi {username}, read the {rules}! {{braces}}")
+    mentions = [f"<a href='tg://user?id={i}'>User {i}</a>" for i in range(300)]
+
+    messages = pack_mentions(template, mentions)
+
+    assert len(messages) > 1
+    assert all(len(message) <= 4096 for message in messages)
+    assert all(message.endswith(", read the {rules}! {braces}") for message in messages)
+    assert sum(message.count("<a href") for message in messages) == 300
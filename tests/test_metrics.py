@@ -0,0 +1,94 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock
+
+from moderation_bot.core.metrics import Counter, Histogram, MetricsServer, Registry, timed_callback, update_type
+
+
+def test_counter_renders_labelled_samples():
+    registry = Registry()
+    counter = registry.counter("calls_total", "Calls.", ("method", "outcome"))
+    counter.inc("sendMessage", "ok")
+    counter.inc("sendMessage", "ok")
+    counter.inc("sendMessage", "retry_after")
+
+    text = registry.render()
+
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{method="sendMessage",outcome="ok"} 2' in text
+    assert 'calls_total{method="sendMessage",outcome="retry_after"} 1' in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("handler",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "top")
+
+    text = registry.render()
+
+    assert 'latency_seconds_bucket{handler="top",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{handler="top",le="1.0"} 3' in text
+    assert 'latency_seconds_bucket{handler="top",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{handler="top"} 4' in text
+    assert 'latency_seconds_sum{handler="top"} 6.05' in text
+
+def test_gauge_is_read_at_scrape_time():
+    registry = Registry()
+    state = {"depth": 1}
+    registry.gauge("depth", "Depth.", lambda: state["depth"])
+    state["depth"] = 7
+
+    assert "depth 7" in registry.render()
+
+def test_label_values_are_escaped():
+    counter = Counter("c", "C.", ("name",))
+    counter.inc('a"b\\c')
+
+    assert list(counter.samples()) == [("c", '{name="a\\"b\\\\c"}', 1)]
+
+def test_update_type_names_the_set_field():
+    class FakeUpdate:
+        message = None
+        chat_member = object()
+
+    assert update_type(FakeUpdate()) == "chat_member"
+
+@pytest.mark.asyncio
+async def test_timed_callback_records_failures_too():
+    callback = AsyncMock(side_effect=ValueError("boom"), __name__="failing")
+    histogram = Histogram("h", "H.", ("handler",))
+
+    import moderation_bot.core.metrics as metrics
+    original = metrics.handler_latency
+    metrics.handler_latency = histogram
+    try:
+        with pytest.raises(ValueError):
+            await timed_callback("failing", callback)()
+    finally:
+        metrics.handler_latency = original
+
+    assert ('h_count', '{handler="failing"}', 1) in list(histogram.samples())
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_the_registry():
+    registry = Registry()
+    registry.counter("hits_total", "Hits.").inc()
+    server = MetricsServer(host="127.0.0.1", port=0, registry=registry)
+    await server.start()
+    port = server._server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET / HTTP/1.1\r\n\r\n")
+        missing = await reader.read()
+        writer.close()
+    finally:
+        await server.stop()
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b"hits_total 1" in response
+    assert missing.startswith(b"HTTP/1.1 404")
@@ -6,7 +6,12 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from moderation_bot.handlers.moderation import warn_user, kick_user, ban_user, unban_user, set_welcome_message, announce_command
+from collections import defaultdict
+
+from moderation_bot.core.expiry import ExpiryScheduler
+from moderation_bot.core.ledger import BAN, MUTE, WarningLedger
+from moderation_bot.core.recent import RecentMessages
+from moderation_bot.handlers.moderation import warn_user, kick_user, ban_user, unban_user, set_welcome_message, announce_command, purge_messages, timed_mute, timed_ban, list_warnings, reset_warnings, set_warn_policy
 
 
 # --- Tests for /warn ---
@@ -19,6 +24,7 @@ async def test_warn_user_as_admin():
     warned_user.mention_html.return_value = "WarnedUser"
     update.message.reply_to_message.from_user = warned_user
     context.args = ["for", "spamming"]
+    context.chat_data = {}
 
     # Directly mock _is_user_admin to return True, simplifying the test setup
     with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)):
@@ -26,6 +32,7 @@ async def test_warn_user_as_admin():
         update.message.reply_html.assert_called_once()
         call_args, _ = update.message.reply_html.call_args
         assert "<b>Reason:</b> for spamming" in call_args[0]
+        assert "(1/3)" in call_args[0]
 
 @pytest.mark.asyncio
 async def test_warn_user_as_non_admin():
@@ -35,6 +42,58 @@ async def test_warn_user_as_non_admin():
         await warn_user(update, context)
         update.message.reply_text.assert_called_once_with("This command can only be used by admins.")
 
+@pytest.mark.asyncio
+async def test_warn_limit_bans_and_clears_warnings():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_chat.id = -100
+    update.message.reply_to_message.from_user = MagicMock(id=77)
+    context.args = []
+    ledger = WarningLedger(limit=2, action=BAN, duration=None)
+    context.chat_data = {"warnings": ledger}
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)):
+        await warn_user(update, context)
+        context.bot.ban_chat_member.assert_not_awaited()
+        await warn_user(update, context)
+
+    context.bot.ban_chat_member.assert_awaited_once_with(-100, 77, until_date=None)
+    assert "banned permanently" in update.message.reply_html.call_args.args[0]
+    assert ledger.count(77) == 0
+
+@pytest.mark.asyncio
+async def test_warns_and_resetwarns_answer_from_the_ledger():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.message.reply_to_message = None
+    ledger = WarningLedger()
+    ledger.add(77, 1, "spamming")
+    context.chat_data = {"warnings": ledger}
+    context.args = ["77"]
+
+    await list_warnings(update, context)
+    assert "1/3" in update.message.reply_text.call_args.args[0]
+    assert "spamming" in update.message.reply_text.call_args.args[0]
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)):
+        await reset_warnings(update, context)
+    assert "Cleared 1 warning" in update.message.reply_text.call_args.args[0]
+    assert ledger.count(77) == 0
+
+@pytest.mark.asyncio
+async def test_warnpolicy_sets_the_policy():
+    update = AsyncMock()
+    context = AsyncMock()
+    context.chat_data = {}
+    context.args = ["5", "30d", "ban", "1w"]
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)):
+        await set_warn_policy(update, context)
+
+    ledger = context.chat_data["warnings"]
+    assert (ledger.limit, ledger.window, ledger.action, ledger.duration) == (5, 30 * 86400, "ban", 7 * 86400)
+    assert "banned for 7d" in update.message.reply_text.call_args.args[0]
+
 # --- Tests for /kick ---
 
 @pytest.mark.asyncio
@@ -63,6 +122,56 @@ async def test_ban_user_as_admin():
         await ban_user(update, context)
         context.bot.ban_chat_member.assert_called_once_with(update.effective_chat.id, banned_user.id)
 
+@pytest.mark.asyncio
+async def test_ban_after_tban_is_not_lifted_when_the_tban_runs_out():
+    now = [1000.0]
+    application = MagicMock(bot_data={}, chat_data=defaultdict(dict), job_queue=None, bot=AsyncMock())
+    scheduler = ExpiryScheduler(clock=lambda: now[0])
+    await scheduler.start(application)
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_chat.id = -100
+    update.message.reply_to_message.from_user = MagicMock(id=42)
+
+    try:
+        with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)), \
+             patch('moderation_bot.handlers.moderation.expiry_scheduler', scheduler):
+            context.args = ["1h"]
+            await timed_ban(update, context)
+            context.args = []
+            await ban_user(update, context)
+
+        assert len(scheduler) == 0
+        now[0] += 3600
+        assert await scheduler._run_due() == 0
+    finally:
+        scheduler.stop()
+    application.bot.unban_chat_member.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_permanent_escalation_cancels_an_earlier_timed_mute():
+    application = MagicMock(bot_data={}, chat_data=defaultdict(dict), job_queue=None, bot=AsyncMock())
+    scheduler = ExpiryScheduler()
+    await scheduler.start(application)
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_chat.id = -100
+    update.message.reply_to_message.from_user = MagicMock(id=42)
+    context.chat_data = {"warnings": WarningLedger(limit=1, action=MUTE, duration=None)}
+
+    try:
+        with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)), \
+             patch('moderation_bot.handlers.moderation.expiry_scheduler', scheduler):
+            context.args = ["1h"]
+            await timed_mute(update, context)
+            context.args = []
+            await warn_user(update, context)
+    finally:
+        scheduler.stop()
+
+    assert "muted permanently" in update.message.reply_html.call_args.args[0]
+    assert len(scheduler) == 0
+
 # --- Tests for /unban ---
 
 @pytest.mark.asyncio
@@ -147,3 +256,118 @@ async def test_announce_command_as_non_admin():
         "This command can only be used by bot administrators in a private message."
     )
 
+
+@pytest.mark.asyncio
+async def test_announce_all_starts_a_broadcast():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_user.id = 123
+    update.effective_chat.id = 123
+    context.args = ["all", "Maintenance", "tonight"]
+    job = {"id": "abc", "targets": [-1, -2]}
+
+    with patch.dict(os.environ, {"ADMIN_USER_IDS": "123"}), \
+         patch('moderation_bot.handlers.moderation.broadcaster') as broadcaster:
+        broadcaster.submit = AsyncMock(return_value=job)
+        await announce_command(update, context)
+
+    broadcaster.submit.assert_awaited_once_with(context.application, "Maintenance tonight", "all", 123)
+    context.bot.send_message.assert_not_called()
+    update.message.reply_text.assert_called_once()
+    assert "2 chats" in update.message.reply_text.call_args.args[0]
+
+# --- Tests for /purge ---
+
+@pytest.mark.asyncio
+async def test_purge_range_from_replied_message():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_chat.id = -100
+    update.message.message_id = 350
+    update.message.reply_to_message.message_id = 101
+    context.args = []
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)), \
+         patch('moderation_bot.handlers.moderation.deletion_batcher') as batcher:
+        batcher.purge = AsyncMock(return_value=0)
+        await purge_messages(update, context)
+
+    assert batcher.purge.await_args.args[2] == list(range(101, 351))
+    update.message.reply_text.return_value.edit_text.assert_awaited_with("🧹 Purged 250 messages.")
+
+@pytest.mark.asyncio
+async def test_purge_last_messages_of_a_user():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_chat.id = -100
+    update.message.message_id = 50
+    update.message.reply_to_message = None
+    context.args = ["77", "2"]
+    recent = RecentMessages()
+    for message_id, sender in [(10, 77), (11, 5), (12, 77), (13, 77)]:
+        recent.add(-100, message_id, sender)
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)), \
+         patch('moderation_bot.handlers.moderation.recent_messages', recent), \
+         patch('moderation_bot.handlers.moderation.deletion_batcher') as batcher:
+        batcher.purge = AsyncMock(return_value=0)
+        await purge_messages(update, context)
+
+    assert batcher.purge.await_args.args[2] == [13, 12, 50]
+
+@pytest.mark.asyncio
+async def test_purge_without_target_shows_usage():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.message.reply_to_message = None
+    context.args = []
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)):
+        await purge_messages(update, context)
+
+    assert update.message.reply_text.call_args.args[0].startswith("Usage:")
+
+# --- Tests for /tmute and /tban ---
+
+@pytest.mark.asyncio
+async def test_timed_mute_schedules_the_unmute():
+    update = AsyncMock()
+    context = AsyncMock()
+    update.effective_chat.id = -100
+    update.message.reply_to_message.from_user = MagicMock(id=77)
+    context.args = ["30m", "spamming"]
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)), \
+         patch('moderation_bot.handlers.moderation.expiry_scheduler') as scheduler:
+        scheduler.schedule.return_value = 0  # long past: no until_date is sent, the scheduler lifts it
+        await timed_mute(update, context)
+
+    scheduler.schedule.assert_called_once_with(-100, 77, "unmute", 1800)
+    assert context.bot.restrict_chat_member.await_args.kwargs["until_date"] is None
+    assert "muted for 30m" in update.message.reply_html.call_args.args[0]
+
+@pytest.mark.asyncio
+async def test_timed_ban_rejects_bad_duration():
+    update = AsyncMock()
+    context = AsyncMock()
+    context.args = ["soon"]
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)):
+        await timed_ban(update, context)
+
+    context.bot.ban_chat_member.assert_not_awaited()
+    assert "/tban <duration>" in update.message.reply_text.call_args.args[0]
+
+@pytest.mark.asyncio
+async def test_timed_mute_rejects_durations_telegram_would_make_permanent():
+    update = AsyncMock()
+    context = AsyncMock()
+    context.args = ["20s"]
+
+    with patch('moderation_bot.handlers.moderation._is_user_admin', new=AsyncMock(return_value=True)), \
+         patch('moderation_bot.handlers.moderation.expiry_scheduler') as scheduler:
+        await timed_mute(update, context)
+
+    scheduler.schedule.assert_not_called()
+    context.bot.restrict_chat_member.assert_not_awaited()
+    assert "at least 1m" in update.message.reply_text.call_args.args[0]
@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import patch
+
+from moderation_bot.core.counters import ActivityCounter
+from moderation_bot.core.persistence import SQLitePersistence
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "bot.sqlite3")
+
+@pytest.mark.asyncio
+async def test_chat_data_round_trip(db_path):
+    persistence = SQLitePersistence(db_path)
+    await persistence.update_chat_data(-100, {'filters': {'gm': 'Good morning!'}, 'nobots_enabled': True})
+    await persistence.update_bot_data({'started': 1})
+    await persistence.flush()
+
+    reloaded = SQLitePersistence(db_path)
+    assert await reloaded.get_chat_data() == {-100: {'filters': {'gm': 'Good morning!'}, 'nobots_enabled': True}}
+    assert await reloaded.get_bot_data() == {'started': 1}
+    await reloaded.flush()
+
+@pytest.mark.asyncio
+async def test_only_changed_keys_are_written(db_path):
+    persistence = SQLitePersistence(db_path)
+    await persistence.update_chat_data(-100, {'user_activity': {1: 1}, 'welcome_message': 'Hi'})
+    await persistence._flush_pending()
+    assert persistence.rows_written == 2
+
+    await persistence.update_chat_data(-100, {'user_activity': {1: 2}, 'welcome_message': 'Hi'})
+    await persistence._flush_pending()
+    assert persistence.rows_written == 3
+
+    await persistence.update_chat_data(-100, {'user_activity': {1: 2}})
+    await persistence.flush()
+    assert persistence.rows_written == 4
+
+    reloaded = SQLitePersistence(db_path)
+    assert await reloaded.get_chat_data() == {-100: {'user_activity': {1: 2}}}
+    await reloaded.flush()
+
+@pytest.mark.asyncio
+async def test_batch_is_flushed_at_size_threshold(db_path):
+    persistence = SQLitePersistence(db_path, flush_interval=3600, max_batch=3)
+    for chat_id in (-1, -2):
+        await persistence.update_chat_data(chat_id, {'nobots_enabled': True})
+    assert persistence.flushes == 0
+
+    await persistence.update_chat_data(-3, {'nobots_enabled': True})
+    assert persistence.flushes == 1
+    await persistence.flush()
+
+@pytest.mark.asyncio
+async def test_dropped_chat_is_removed(db_path):
+    persistence = SQLitePersistence(db_path)
+    await persistence.update_chat_data(-100, {'nobots_enabled': True})
+    await persistence._flush_pending()
+    await persistence.drop_chat_data(-100)
+    await persistence.flush()
+
+    reloaded = SQLitePersistence(db_path)
+    assert await reloaded.get_chat_data() == {}
+    await reloaded.flush()
+
+@pytest.mark.asyncio
+async def test_data_is_snapshotted_when_handed_over(db_path):
+    persistence = SQLitePersistence(db_path)
+    chat_data = {'filters': {'gm': 'Good morning!'}}
+    await persistence.update_chat_data(-100, chat_data)
+    # Handlers keep changing the live dict while the batch waits for the writer thread
+    chat_data['filters']['gn'] = 'Good night!'
+    chat_data['nobots_enabled'] = True
+    await persistence.flush()
+
+    reloaded = SQLitePersistence(db_path)
+    assert await reloaded.get_chat_data() == {-100: {'filters': {'gm': 'Good morning!'}}}
+    await reloaded.flush()
+
+@pytest.mark.asyncio
+async def test_unchanged_counters_are_not_pickled_again(db_path):
+    persistence = SQLitePersistence(db_path, flush_interval=3600)
+    activity = ActivityCounter({1: 3})
+    chat_data = {'user_activity': activity, 'nobots_enabled': True}
+
+    with patch.object(ActivityCounter, '__getstate__', autospec=True,
+                      side_effect=ActivityCounter.__getstate__) as getstate:
+        await persistence.update_chat_data(-100, chat_data)
+        chat_data['nobots_enabled'] = False
+        await persistence.update_chat_data(-100, chat_data)
+        assert getstate.call_count == 1
+
+        activity.increment(2)
+        await persistence.update_chat_data(-100, chat_data)
+        assert getstate.call_count == 2
+    await persistence.flush()
+
+    reloaded = SQLitePersistence(db_path)
+    restored = (await reloaded.get_chat_data())[-100]
+    assert restored == {'user_activity': ActivityCounter({1: 3, 2: 1}), 'nobots_enabled': False}
+    await reloaded.flush()
@@ -0,0 +1,30 @@
+from unittest.mock import MagicMock
+
+from moderation_bot.core.pins import PinTracker
+
+
+def test_tracker_forgets_the_chat_when_the_current_pin_is_unpinned():
+    now = [0.0]
+    tracker = PinTracker(ttl=10, clock=lambda: now[0])
+    tracker.pinned(-1, MagicMock(message_id=5, text="rules"))
+    assert tracker.peek(-1) == (5, "rules")
+
+    tracker.unpinned(-1, 4)  # some other message
+    assert tracker.peek(-1) == (5, "rules")
+    tracker.unpinned(-1, 5)
+    assert tracker.peek(-1) is None
+
+    tracker.cleared(-1)
+    assert tracker.peek(-1) == (None, None)
+    now[0] = 11
+    assert tracker.peek(-1) is None
+
+def test_tracker_evicts_least_recently_used_chat():
+    tracker = PinTracker(max_chats=2)
+    for chat_id in (-1, -2):
+        tracker.pinned(chat_id, None)
+    tracker.peek(-1)
+    tracker.pinned(-3, None)
+
+    assert tracker.peek(-2) is None
+    assert tracker.peek(-1) == (None, None)
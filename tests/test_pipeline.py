@@ -0,0 +1,89 @@
+import subprocess
+import sys
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from moderation_bot.handlers import pipeline
+from moderation_bot.handlers.pipeline import FEATURE_FILTERS, FEATURE_NOBOTS, feature_flags, run_message_pipeline
+
+
+def _stub_stages():
+    stages = [AsyncMock(name=stage.__name__) for _, _, stage in pipeline.STAGES]
+    patched = tuple((flag, text_only, stub) for (flag, text_only, _), stub in zip(pipeline.STAGES, stages))
+    return stages, patch.object(pipeline, 'STAGES', patched)
+
+def test_feature_flags_reads_toggles():
+    assert feature_flags({}) == 0
+    assert feature_flags({'nobots_enabled': True, 'filters': {'gm': 'gm!'}}) == FEATURE_NOBOTS | FEATURE_FILTERS
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_everything_for_non_text_in_plain_chat():
+    update, context = AsyncMock(), AsyncMock()
+    context.chat_data = {}
+    stages, patcher = _stub_stages()
+
+    with patcher, patch.object(pipeline, '_PLAIN_TEXT') as plain_text:
+        plain_text.check_update.return_value = False
+        await run_message_pipeline(update, context)
+
+    for stage in stages:
+        stage.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_only_enabled_stages():
+    update, context = AsyncMock(), AsyncMock()
+    context.chat_data = {'nobots_enabled': True}
+    stages, patcher = _stub_stages()
+    clean_linked, anti_pin, no_bots, anti_flood, activity, anti_spam, apply_filters = stages
+
+    with patcher, patch.object(pipeline, '_PLAIN_TEXT') as plain_text:
+        plain_text.check_update.return_value = True
+        await run_message_pipeline(update, context)
+
+    clean_linked.assert_not_awaited()
+    anti_pin.assert_not_awaited()
+    no_bots.assert_awaited_once_with(update, context)
+    anti_flood.assert_not_awaited()
+    anti_spam.assert_not_awaited()
+    activity.assert_awaited_once_with(update, context)
+    apply_filters.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_errors_and_continues():
+    update, context = AsyncMock(), AsyncMock()
+    context.chat_data = {'nobots_enabled': True}
+    context.application.process_error.return_value = False
+    stages, patcher = _stub_stages()
+    error = RuntimeError("boom")
+    stages[2].side_effect = error
+
+    with patcher, patch.object(pipeline, '_PLAIN_TEXT') as plain_text:
+        plain_text.check_update.return_value = True
+        await run_message_pipeline(update, context)
+
+    context.application.process_error.assert_awaited_once_with(update, error)
+    stages[4].assert_awaited_once()  # track_activity still runs
+
+@pytest.mark.asyncio
+async def test_stage_returning_true_ends_the_pipeline():
+    update, context = AsyncMock(), AsyncMock()
+    context.chat_data = {'antispam_enabled': True, 'filters': {'gm': 'gm!'}}
+    stages, patcher = _stub_stages()
+    stages[5].return_value = True  # anti-spam deleted the message
+
+    with patcher, patch.object(pipeline, '_PLAIN_TEXT') as plain_text:
+        plain_text.check_update.return_value = True
+        await run_message_pipeline(update, context)
+
+    stages[5].assert_awaited_once()
+    stages[6].assert_not_awaited()
+
+def test_toggled_stages_are_imported_on_first_use():
+    code = ("import sys; import moderation_bot.handlers.pipeline; "
+            "print(sorted(m for m in sys.modules if m.startswith('moderation_bot.handlers.')))")
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+
+    assert "moderation_bot.handlers.activity" in loaded
+    for module in ("filters", "moderation", "pin", "spam"):
+        assert f"moderation_bot.handlers.{module}'" not in loaded
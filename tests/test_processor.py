@@ -0,0 +1,54 @@
+import pytest
+import asyncio
+from unittest.mock import MagicMock
+
+from telegram import Update
+
+from moderation_bot.core.processor import ChatShardedUpdateProcessor
+
+
+def _update(chat_id):
+    update = MagicMock(spec=Update)
+    update.effective_chat.id = chat_id
+    return update
+
+@pytest.mark.asyncio
+async def test_updates_of_one_chat_run_in_order():
+    processor = ChatShardedUpdateProcessor(shards=4)
+    await processor.initialize()
+    seen = []
+
+    async def handle(index):
+        # Later updates finish faster; ordering must still hold.
+        await asyncio.sleep(0.01 * (5 - index))
+        seen.append(index)
+
+    await asyncio.gather(*(processor.process_update(_update(-100), handle(i)) for i in range(5)))
+    await processor.shutdown()
+
+    assert seen == [0, 1, 2, 3, 4]
+
+@pytest.mark.asyncio
+async def test_different_chats_run_in_parallel():
+    processor = ChatShardedUpdateProcessor(shards=2)
+    await processor.initialize()
+    release = asyncio.Event()
+    seen = []
+
+    async def slow():
+        await release.wait()
+        seen.append("slow")
+
+    async def fast():
+        seen.append("fast")
+        release.set()
+
+    # Chats -2 and -1 land on different shards, so the fast one is not stuck behind the slow one.
+    await asyncio.wait_for(
+        asyncio.gather(processor.process_update(_update(-2), slow()), processor.process_update(_update(-1), fast())),
+        timeout=1,
+    )
+    await processor.shutdown()
+
+    assert seen == ["fast", "slow"]
+    assert processor.queue_depths() == []
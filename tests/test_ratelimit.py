@@ -0,0 +1,70 @@
+import pytest
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock
+
+from telegram.error import RetryAfter
+
+from moderation_bot.core.ratelimit import PriorityTokenBucket, ScheduledRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_bucket_serves_higher_priority_first():
+    bucket = PriorityTokenBucket(rate=100, capacity=1)
+    await bucket.acquire()  # drain the only token
+    order = []
+
+    async def acquire(priority, name):
+        await bucket.acquire(priority)
+        order.append(name)
+
+    await asyncio.gather(acquire(2, "welcome"), acquire(2, "filter"), acquire(0, "delete"))
+    assert order == ["delete", "welcome", "filter"]
+
+@pytest.mark.asyncio
+async def test_retry_after_requeues_request():
+    limiter = ScheduledRateLimiter(group_rate_per_minute=6000)
+    callback = AsyncMock(side_effect=[RetryAfter(timedelta(0)), {"ok": True}])
+
+    result = await limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": -100}, None)
+
+    assert result == {"ok": True}
+    assert callback.await_count == 2
+    assert limiter.stats()["retry_after"] == 1
+
+@pytest.mark.asyncio
+async def test_retry_after_gives_up_after_max_retries():
+    limiter = ScheduledRateLimiter(group_rate_per_minute=6000, max_retries=1)
+    callback = AsyncMock(side_effect=RetryAfter(timedelta(0)))
+
+    with pytest.raises(RetryAfter):
+        await limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": -100}, None)
+    assert callback.await_count == 2
+
+@pytest.mark.asyncio
+async def test_retry_after_only_blocks_the_affected_chat():
+    limiter = ScheduledRateLimiter()
+    limiter._chat_bucket(-1).block(60)
+    callback = AsyncMock(return_value=True)
+
+    result = await asyncio.wait_for(
+        limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": -2}, None), timeout=1
+    )
+    assert result is True
+    await limiter.shutdown()
+
+@pytest.mark.asyncio
+async def test_coordinator_budget_is_shared_with_other_processes():
+    from moderation_bot.core.coordination import LocalCoordinator
+
+    coordinator = LocalCoordinator(global_rate=50)
+    for _ in range(50):
+        coordinator.try_acquire()  # another worker used up the budget
+    limiter = ScheduledRateLimiter(coordinator=coordinator)
+    callback = AsyncMock(return_value=True)
+
+    started = asyncio.get_running_loop().time()
+    await limiter.process_request(callback, (), {}, "getMe", {}, None)
+
+    assert asyncio.get_running_loop().time() - started >= 0.015
+    callback.assert_awaited_once()
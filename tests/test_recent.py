@@ -0,0 +1,23 @@
+from moderation_bot.core.recent import RecentMessages
+
+
+def test_from_sender_returns_newest_first_within_the_ring():
+    recent = RecentMessages(per_chat=5)
+    for message_id, sender in enumerate([1, 2, 1, 1, 2, 1, 1], start=10):
+        recent.add(-100, message_id, sender)
+
+    assert recent.from_sender(-100, 1, 10) == [16, 15, 13, 12]  # message 10 fell out of the ring
+    assert recent.from_sender(-100, 1, 2) == [16, 15]
+    assert recent.from_sender(-100, 3, 10) == []
+    assert recent.from_sender(-200, 1, 10) == []
+
+def test_least_recently_active_chats_are_dropped():
+    recent = RecentMessages(per_chat=2, max_chats=2)
+    recent.add(-1, 1, 7)
+    recent.add(-2, 1, 7)
+    recent.add(-1, 2, 7)
+    recent.add(-3, 1, 7)
+
+    assert len(recent) == 2
+    assert recent.from_sender(-2, 7, 5) == []
+    assert recent.from_sender(-1, 7, 5) == [2, 1]
@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from moderation_bot.core.simhash import DuplicateIndex, hamming, simhash
+from moderation_bot.handlers.spam import check_duplicate_spam
+
+SPAM = "🚀 Huge AIRDROP live now! Claim 500 USDT free at scam-link dot com before it ends, only 100 spots left!!"
+VARIANT = "Huge airdrop LIVE now!! claim 750 usdt free at scam-link dot com before it ends, only 50 spots left"
+OTHER = "Does anyone know when the next community call is happening? I missed the announcement last week."
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_light_edits_keep_the_signature_close():
+    assert hamming(simhash(SPAM), simhash(VARIANT)) <= 4
+    assert hamming(simhash(SPAM), simhash(OTHER)) > 4
+
+def test_signatures_do_not_depend_on_the_process():
+    code = f"from moderation_bot.core.simhash import simhash; print(simhash({SPAM!r}))"
+    for seed in ("1", "2"):
+        env = {**os.environ, "PYTHONHASHSEED": seed}
+        output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+        assert int(output.stdout) == simhash(SPAM)
+
+def test_short_messages_are_not_fingerprinted():
+    assert simhash("gm everyone") is None
+
+def test_index_flags_after_threshold_and_returns_earlier_copies():
+    index = DuplicateIndex(threshold=2, window=60, clock=FakeClock())
+
+    assert index.add(SPAM, -1, 10) == []
+    assert index.add(VARIANT, -2, 20) == []
+    assert index.add(OTHER, -1, 11) == []
+    assert index.add(SPAM, -3, 30) == [(-1, 10), (-2, 20), (-3, 30)]
+    # Once flagged, every further copy is reported right away
+    assert index.add(VARIANT, -1, 12) == [(-1, 12)]
+
+def test_index_forgets_copies_outside_the_window():
+    clock = FakeClock()
+    index = DuplicateIndex(threshold=2, window=60, clock=clock)
+
+    for message_id in range(3):
+        assert index.add(SPAM, -1, message_id) == []
+        clock.now += 40
+
+def test_index_is_bounded():
+    import random
+    rng = random.Random(1)
+    index = DuplicateIndex(max_clusters=5, clock=FakeClock())
+    for number in range(50):
+        words = ("".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=6)) for _ in range(10))
+        index.add(" ".join(words), -1, number)
+
+    assert len(index) == 5
+    assert sum(len(bucket) for bucket in index._bands.values()) <= 5 * 5
+
+@pytest.mark.asyncio
+async def test_check_duplicate_spam_deletes_and_stops_pipeline():
+    update, context = AsyncMock(), AsyncMock()
+    update.effective_chat.id = -100
+    update.message.text = SPAM
+    update.message.message_id = 5
+    context.chat_data = {'antispam_enabled': True}
+    index = MagicMock()
+    index.add.return_value = [(-200, 1), (-100, 5)]
+    batcher = MagicMock()
+
+    with patch('moderation_bot.handlers.spam.duplicate_index', index), \
+            patch('moderation_bot.handlers.spam.deletion_batcher', batcher), \
+            patch('moderation_bot.handlers.spam._is_user_admin', new=AsyncMock(return_value=False)):
+        assert await check_duplicate_spam(update, context) is True
+
+    assert [call.args[1:] for call in batcher.schedule.call_args_list] == [(-200, 1), (-100, 5)]
+
+@pytest.mark.asyncio
+async def test_check_duplicate_spam_deletes_earlier_copies_when_an_admin_triggers():
+    update, context = AsyncMock(), AsyncMock()
+    update.effective_chat.id = -100
+    update.message.text = SPAM
+    update.message.message_id = 5
+    context.chat_data = {'antispam_enabled': True}
+    index = DuplicateIndex(threshold=2, window=60, clock=FakeClock())
+    index.add(SPAM, -200, 1)
+    index.add(VARIANT, -100, 2)
+    batcher = MagicMock()
+
+    with patch('moderation_bot.handlers.spam.duplicate_index', index), \
+            patch('moderation_bot.handlers.spam.deletion_batcher', batcher), \
+            patch('moderation_bot.handlers.spam._is_user_admin', new=AsyncMock(return_value=True)):
+        assert await check_duplicate_spam(update, context) is False
+
+    assert [call.args[1:] for call in batcher.schedule.call_args_list] == [(-200, 1), (-100, 2)]
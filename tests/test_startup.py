@@ -0,0 +1,101 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from telegram.ext import Application, CommandHandler
+
+from moderation_bot.core import startup
+from moderation_bot.core.startup import EarlyWebhook, StartupProfile, ensure_webhook, lazy_callback, run_application
+from moderation_bot.main import build_application
+
+
+def test_profile_records_phases_in_order():
+    now = [10.0]
+    profile = StartupProfile(clock=lambda: now[0])
+    now[0] = 10.3
+    profile.mark("imports")
+    now[0] = 10.5
+    profile.mark("initialize")
+
+    assert list(profile.phases) == ["imports", "initialize"]
+    assert profile.phases["initialize"] == pytest.approx(0.2)
+    assert profile.elapsed() == pytest.approx(0.5)
+
+@pytest.mark.asyncio
+async def test_lazy_callback_imports_its_module_once():
+    module = MagicMock()
+    module.warn_user = AsyncMock(return_value="done")
+    stub = lazy_callback("moderation_bot.handlers.moderation", "warn_user")
+    assert stub.__name__ == "warn_user"
+
+    with patch.object(startup.importlib, "import_module", return_value=module) as import_module:
+        assert await stub("update", "context") == "done"
+        await stub("update", "context")
+
+    import_module.assert_called_once_with("moderation_bot.handlers.moderation")
+    assert module.warn_user.await_count == 2
+
+def test_lazy_application_registers_stubs():
+    with patch.object(startup.importlib, "import_module") as import_module:
+        application = build_application("1000:test", limiter=None, lazy=True)
+
+    import_module.assert_not_called()
+    commands = {command for handler in application.handlers[0] if isinstance(handler, CommandHandler)
+                for command in handler.commands}
+    assert {"start", "warn", "filter", "announce"} <= commands
+
+@pytest.mark.asyncio
+async def test_ensure_webhook_skips_an_identical_webhook():
+    bot = AsyncMock()
+    bot.get_webhook_info.return_value = MagicMock(url="https://bot/token", allowed_updates=("message",))
+
+    assert await ensure_webhook(bot, "https://bot/token", ["message"]) is False
+    bot.set_webhook.assert_not_awaited()
+
+    assert await ensure_webhook(bot, "https://new/token", ["message"]) is True
+    assert await ensure_webhook(bot, "https://bot/token", ["message"], secret_token="s3cret") is True
+    assert bot.set_webhook.await_count == 2
+
+def test_early_webhook_queues_updates_before_start():
+    application = Application.builder().token("1000:test").build()
+    webhook = EarlyWebhook(application, secret_token="s3cret")
+
+    assert webhook.dispatch(b'{"update_id": 5}') == 200
+    assert webhook.dispatch(b"not json") == 400
+    assert application.update_queue.get_nowait().update_id == 5
+    assert webhook.check_secret("s3cret") and not webhook.check_secret("wrong") and not webhook.check_secret(None)
+
+@pytest.mark.asyncio
+async def test_run_application_follows_the_run_webhook_lifecycle():
+    calls = []
+    application = MagicMock(running=True)
+    for step in ("initialize", "start", "stop", "shutdown"):
+        setattr(application, step, AsyncMock(side_effect=lambda step=step: calls.append(step)))
+    for hook in ("post_init", "post_stop", "post_shutdown"):
+        setattr(application, hook, AsyncMock(side_effect=lambda _, hook=hook: calls.append(hook)))
+
+    async def serve():
+        calls.append("serve")
+        raise RuntimeError("server died")
+
+    with pytest.raises(RuntimeError):
+        await run_application(application, serve)
+
+    assert calls == ["initialize", "post_init", "start", "serve", "stop", "post_stop", "shutdown", "post_shutdown"]
+
+@pytest.mark.asyncio
+async def test_webhook_app_serves_metrics_next_to_the_webhook():
+    from tornado.httpclient import AsyncHTTPClient
+    from tornado.httpserver import HTTPServer
+    from tornado.testing import bind_unused_port
+
+    webhook = EarlyWebhook(Application.builder().token("1000:test").build())
+    sock, port = bind_unused_port()
+    server = HTTPServer(webhook.make_app("token"))
+    server.add_sockets([sock])
+    try:
+        response = await AsyncHTTPClient().fetch(f"http://127.0.0.1:{port}/metrics")
+    finally:
+        server.stop()
+
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert b"bot_updates_total" in response.body